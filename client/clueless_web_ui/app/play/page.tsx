@@ -12,7 +12,8 @@ import {
   SidebarTrigger,
 } from "@/components/ui/sidebar";
 import { defaultGameState, GameStateContext, gsObj } from "@/lib/types";
-import { useEffect, useState } from "react";
+import { isStaleUpdate, mergeGameState } from "@/lib/utils";
+import { useEffect, useRef, useState } from "react";
 
 export default function Home() {
   const [gameID, setGameId] = useState("");
@@ -20,6 +21,7 @@ export default function Home() {
   const [userAnswer, setUserAnswer] = useState("");
   const [trigger, setTrigger] = useState(0);
   const [gameState, setGameState] = useState(defaultGameState);
+  const version = useRef(-1);
   const currPlayer: string = gameState.game_phase.player;
   const currPhase: string = gameState.game_phase.phase;
 
@@ -32,7 +34,8 @@ export default function Home() {
 
     async function getGameState() {
       const rawResp = await fetch(
-        process.env.NEXT_PUBLIC_SERVER_URL + `/State?gameKey=${value}`,
+        process.env.NEXT_PUBLIC_SERVER_URL +
+          `/State?gameKey=${value}&since_version=${version.current}`,
         {
           method: "POST",
           headers: {
@@ -41,17 +44,51 @@ export default function Home() {
           },
         },
       );
+      // nothing changed since the last poll
+      if (rawResp.status == 304) {
+        return;
+      }
       const content = await rawResp.json();
       console.log(content); // this is for development use only and should be removed for the target inc (probably)
-      setGameState(content);
+      applyUpdate(content);
+    }
+
+    // eslint-disable-next-line @typescript-eslint/no-explicit-any
+    function applyUpdate(content: any) {
+      if (isStaleUpdate(version.current, content)) {
+        // the state held was replaced while this delta was on its way, fetch
+        // what changed since the version held instead if it is behind
+        if (content.version > version.current) {
+          getGameState();
+        }
+        return;
+      }
+      version.current = content.version;
+      setGameState((prev) => mergeGameState(prev, content));
+    }
+
+    // Updates are pushed by the server as they happen, polling is only
+    // used while the socket is not connected
+    let socket: WebSocket | null = null;
+    if (value) {
+      socket = new WebSocket(
+        (process.env.NEXT_PUBLIC_SERVER_URL || "").replace(/^http/, "ws") +
+          `/updates?gameKey=${value}`,
+      );
+      socket.onmessage = (event) => {
+        applyUpdate(JSON.parse(event.data));
+      };
     }
 
     const intervalID = setInterval(() => {
-      if (value) {
+      if (value && socket?.readyState != WebSocket.OPEN) {
         getGameState();
       }
     }, 5000);
-    return () => clearInterval(intervalID);
+    return () => {
+      clearInterval(intervalID);
+      socket?.close();
+    };
   }, []);
 
   useEffect(() => {
@@ -67,6 +104,7 @@ export default function Home() {
         },
       );
       const content = await rawResp.json();
+      version.current = content.version;
       console.log(content); // this is for development use only and should be removed for the target inc (probably)
       setGameState(content);
     }
@@ -6,6 +6,7 @@ export const defaultGameState = {
     phase: "",
   },
   victory_state: 0,
+  version: -1,
   player_character_mapping: {},
   player_username_mapping: {},
   moved_by_suggest: {},
@@ -40,6 +41,7 @@ export interface gsObj {
     phase: string;
   };
   victory_state: number;
+  version: number;
   player_character_mapping: {
     [key: string]: string;
   };
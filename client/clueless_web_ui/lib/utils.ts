@@ -4,3 +4,36 @@ import { twMerge } from "tailwind-merge";
 export function cn(...inputs: ClassValue[]) {
   return twMerge(clsx(inputs));
 }
+
+// Apply a /State response to the current game state. Responses carrying a
+// since_version only hold what changed after that version, so new logs and chat
+// entries are prepended and changed map locations replace the old ones. They
+// only apply on top of that exact version, any other state is kept as it is
+// (see isStaleUpdate).
+// eslint-disable-next-line @typescript-eslint/no-explicit-any
+export function mergeGameState(prev: any, content: any) {
+  if (content.since_version === undefined) {
+    return content;
+  }
+  if (content.since_version !== prev.version) {
+    return prev;
+  }
+  return {
+    ...prev,
+    ...content,
+    map: { ...prev.map, ...content.map },
+    logs: [...content.logs, ...(prev.logs ?? [])],
+    chat: [...content.chat, ...(prev.chat ?? [])],
+  };
+}
+
+// Whether a /State response or pushed update is a delta built on another
+// version than the one held, e.g. one already replaced by a full /State fetch.
+// Such a delta cannot be merged, the state must be fetched again from the
+// version held if the delta was newer than it.
+// eslint-disable-next-line @typescript-eslint/no-explicit-any
+export function isStaleUpdate(version: number, content: any) {
+  return (
+    content.since_version !== undefined && content.since_version !== version
+  );
+}
@@ -0,0 +1,127 @@
+"""
+Benchmark of playing many games at once with the NumPy batch engine against
+playing them one by one through the GameState engine. Both play the same simple
+strategy: random moves and suggestions, and an accusation once every card but
+the solution has been seen.
+
+Needs NumPy, run from the server directory with:
+    python -m benchmarks.bench_batch
+"""
+
+import random
+import time
+
+import numpy as np
+
+from util import engine
+from util.batch import (
+    ACCUSE,
+    MOVE,
+    NONE,
+    PERSON_CARDS,
+    ROOM_CARDS,
+    SUGGEST,
+    WEAPON_CARDS,
+    GameBatch,
+    choose_bits,
+)
+from util.cards import CARDS, mask_to_cards
+from util.enums import PlayerEnum, WeaponEnum
+from util.game_map import LOCATIONS
+
+NUM_PLAYERS = 4
+GAMES = 20000
+MAX_TURNS = 300
+
+
+def play_batch(size: int, rng: np.random.Generator) -> tuple[GameBatch, int]:
+    """
+    Plays a batch of games until they end or reach MAX_TURNS, returns the
+    batch and the number of turns played over all games
+    """
+    batch = GameBatch.new(NUM_PLAYERS, size, rng)
+    turns = 0
+    for _ in range(MAX_TURNS):
+        ongoing = batch.ongoing
+        if not ongoing.any():
+            break
+        turns += int(ongoing.sum())
+
+        moving = ongoing & (batch.phase == MOVE)
+        batch.move(choose_bits(batch.legal_moves(), len(LOCATIONS), rng), moving)
+
+        suggesting = batch.ongoing & (batch.phase == SUGGEST)
+        persons = rng.integers(len(PlayerEnum), size=size)
+        weapons = rng.integers(len(WeaponEnum), size=size)
+        batch.suggest(persons, weapons, suggesting, rng)
+
+        # the unknown cards hold one person, one weapon and one room,
+        # the lowest card ids of each kind give the accusation
+        accusing = batch.ongoing & (batch.phase == ACCUSE)
+        unknown = batch.current(batch.unknown_cards())
+        solved = accusing & (np.bitwise_count(unknown) == 3)
+        held = (unknown[:, None] >> np.arange(len(CARDS))) & 1
+        persons = np.argmax(held[:, PERSON_CARDS], axis=1)
+        weapons = np.argmax(held[:, WEAPON_CARDS], axis=1)
+        rooms = np.argmax(held[:, ROOM_CARDS], axis=1)
+        batch.accuse(
+            np.where(solved, persons, NONE),
+            np.where(solved, weapons, NONE),
+            np.where(solved, rooms, NONE),
+            accusing,
+        )
+    return batch, turns
+
+
+def play_objects(size: int, rng: random.Random) -> int:
+    """
+    Plays the same strategy one GameState at a time, returns the turns played
+    """
+    turns = 0
+    for _ in range(size):
+        game, _ = engine.new_game(NUM_PLAYERS, rng)
+        for _ in range(MAX_TURNS):
+            if game.victory_state:
+                break
+            turns += 1
+            player = game.player_order[game.current_turn.player]
+            if game.current_turn.phase == "move":
+                target = rng.choice(engine.legal_moves(game, player))
+                engine.move(game, player, target, time="")
+            if game.current_turn.phase == "suggest":
+                room = game.get_location(game.get_character(player))
+                person = rng.choice(list(PlayerEnum))
+                weapon = rng.choice(list(WeaponEnum))
+                engine.suggest(game, player, person, weapon, room, time="", rng=rng)
+            known = game.hands[game.player_order.index(player)]
+            unknown = mask_to_cards(
+                ((1 << len(CARDS)) - 1) & ~(known | game.seen_cards[player])
+            )
+            if len(unknown) == 3:
+                engine.accuse(game, player, *unknown, time="")
+            else:
+                engine.accuse(game, player, None, None, None, time="")
+    return turns
+
+
+def main() -> None:
+    print(f"{GAMES} games of {NUM_PLAYERS} players, at most {MAX_TURNS} turns each")
+
+    start = time.perf_counter()
+    batch, turns = play_batch(GAMES, np.random.default_rng(0))
+    seconds = time.perf_counter() - start
+    print(
+        f"  batch:     {GAMES / seconds:9.0f} games/s {turns / seconds:11.0f} turns/s"
+        f"  ({(~batch.ongoing).sum()} finished)"
+    )
+
+    # the object engine is far slower, a tenth of the games is enough
+    size = GAMES // 10
+    start = time.perf_counter()
+    turns = play_objects(size, random.Random(0))
+    seconds = time.perf_counter() - start
+    print(f"  GameState: {size / seconds:9.0f} games/s {turns / seconds:11.0f} turns/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,280 @@
+"""
+Microbenchmarks of the core rule functions, with a stored baseline to catch
+regressions: each case is timed as the best of several runs, in nanoseconds per
+call.
+
+Run from the server directory with:
+    python -m benchmarks.bench_core                 # time every case
+    python -m benchmarks.bench_core --save          # store them as the baseline
+    python -m benchmarks.bench_core --compare       # fail on slower cases
+
+--compare exits with status 1 if a case is slower than its baseline by more than
+--threshold (a fraction, 0.25 by default). Timings depend on the machine, so
+compare against a baseline saved on the same one.
+"""
+
+from pathlib import Path
+from typing import Callable
+import argparse
+import json
+import platform
+import random
+import sys
+import timeit
+
+from util.actions import MoveAction
+from util.cards import cards_to_mask
+from util.enums import PlayerEnum, WeaponEnum, RoomEnum
+from util.functions import get_character_location
+from util.game_map import LOCATIONS
+from util.game_state import GameState
+from util.movement import validate_move
+
+BASELINE = Path(__file__).with_name("baseline_core.json")
+REPEAT = 5
+
+# Each case builds what it needs and returns a function to time along with how
+# many calls of the benchmarked function one run of it makes
+CASES: dict[str, Callable[[], tuple[Callable[[], object], int]]] = {}
+
+
+def case(name: str):
+    def register(build):
+        CASES[name] = build
+        return build
+
+    return register
+
+
+def new_game(num_players: int = 6) -> GameState:
+    return GameState(num_players, rng=random.Random(0))
+
+
+@case("GameState.__init__")
+def bench_init():
+    rng = random.Random(0)
+    return lambda: GameState(6, rng=rng), 1
+
+
+@case("deal_remaining_cards")
+def bench_deal():
+    game = new_game()
+    return lambda: game.deal_remaining_cards(6), 1
+
+
+def bench_dump(logs: int):
+    game = new_game()
+    for i in range(logs):
+        game.add_log(f"player{i % 6 + 1} moved to the study")
+
+    def dump():
+        # the logs and chat are handed out lazily, go through them as the
+        # encoder would
+        state = game.dump_to_dict()
+        return list(state["logs"]), list(state["chat"])
+
+    return dump, 1
+
+
+def bench_encode(logs: int):
+    game = new_game()
+    for i in range(logs):
+        game.add_log(f"player{i % 6 + 1} moved to the study")
+
+    def encode():
+        # drop the cached snapshot so the encoding is timed too
+        game._snapshot = None
+        return game.dump_to_json()
+
+    return encode, 1
+
+
+for logs in (0, 100, 1000):
+    case(f"dump_to_dict[{logs} logs]")(lambda logs=logs: bench_dump(logs))
+    case(f"dump_to_json[{logs} logs]")(lambda logs=logs: bench_encode(logs))
+
+
+@case("get_character_location")
+def bench_location():
+    game = new_game()
+    characters = list(PlayerEnum)
+
+    def locate():
+        for character in characters:
+            get_character_location(character, game)
+
+    return locate, len(characters)
+
+
+@case("validate_move")
+def bench_validate():
+    rng = random.Random(0)
+    game = new_game()
+    moves = [
+        (MoveAction("player1", rng.choice(LOCATIONS)), rng.choice(LOCATIONS), game)
+        for _ in range(100)
+    ]
+
+    def validate():
+        for args in moves:
+            validate_move(*args)
+
+    return validate, len(moves)
+
+
+@case("next_phase")
+def bench_next_phase():
+    game = new_game()
+
+    def step():
+        game.next_phase("move")
+        game.next_phase("suggest")
+        game.next_phase("accuse")
+
+    return step, 3
+
+
+@case("next_player")
+def bench_next_player():
+    game = new_game()
+    # a player out of the game is skipped over
+    game.moveable_players.remove("player3")
+    return game.next_player, 1
+
+
+@case("find_disprover")
+def bench_disprover():
+    rng = random.Random(0)
+    game = new_game()
+    rooms = [room for room in RoomEnum if room != RoomEnum.staging]
+    suggestions = [
+        (
+            rng.choice(game.player_order),
+            cards_to_mask(
+                [
+                    rng.choice(list(PlayerEnum)),
+                    rng.choice(list(WeaponEnum)),
+                    rng.choice(rooms),
+                ]
+            ),
+        )
+        for _ in range(100)
+    ]
+
+    def resolve():
+        for suggestor, suggestion in suggestions:
+            game.find_disprover(suggestor, suggestion)
+
+    return resolve, len(suggestions)
+
+
+def run(names: list[str], repeat: int = REPEAT) -> dict[str, float]:
+    """
+    Function to time the given cases, each is run for at least 0.2 seconds in
+    each of repeat rounds going through every case. Taking the best round of a
+    case leaves out the rounds slowed down by something else on the machine,
+    and interleaving the cases keeps such a slowdown from hitting every round
+    of one case.
+
+    Returns:
+        The nanoseconds per call of each case
+    """
+    timers = {}
+    for name in names:
+        fn, calls = CASES[name]()
+        timer = timeit.Timer(fn)
+        number, _ = timer.autorange()
+        timers[name] = (timer, number, calls)
+
+    results = {name: float("inf") for name in names}
+    for _ in range(repeat):
+        for name, (timer, number, calls) in timers.items():
+            ns = timer.timeit(number) / number / calls * 1e9
+            results[name] = min(results[name], ns)
+    return results
+
+
+def compare(
+    results: dict[str, float], baseline: dict[str, float], threshold: float
+) -> list[str]:
+    """
+    Function to find the cases slower than their baseline by more than the
+    threshold, cases without a baseline are never regressions
+    """
+    return [
+        name
+        for name, ns in results.items()
+        if name in baseline and ns > baseline[name] * (1 + threshold)
+    ]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--filter", default="", help="only cases containing this")
+    parser.add_argument("--repeat", type=int, default=REPEAT)
+    parser.add_argument("--baseline", type=Path, default=BASELINE)
+    parser.add_argument("--save", action="store_true", help="store as the baseline")
+    parser.add_argument("--compare", action="store_true", help="check the baseline")
+    parser.add_argument("--threshold", type=float, default=0.25)
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args()
+
+    names = [name for name in CASES if args.filter in name]
+    results = run(names, args.repeat)
+
+    baseline = {}
+    if args.compare or not args.save:
+        if args.baseline.exists():
+            baseline = json.loads(args.baseline.read_text())["results"]
+        elif args.compare:
+            sys.exit(f"No baseline at {args.baseline}, store one with --save")
+    regressions = compare(results, baseline, args.threshold)
+    if args.compare and regressions:
+        # time the slower cases again before failing, to rule out noise
+        again = run(regressions, args.repeat)
+        for name, ns in again.items():
+            results[name] = min(results[name], ns)
+        regressions = compare(results, baseline, args.threshold)
+
+    if args.save:
+        # keep the baseline of the cases left out by --filter
+        stored = {}
+        if args.baseline.exists():
+            stored = json.loads(args.baseline.read_text())["results"]
+        stored.update(results)
+        args.baseline.write_text(
+            json.dumps(
+                {
+                    "python": platform.python_version(),
+                    "machine": platform.machine(),
+                    "results": stored,
+                },
+                indent=2,
+            )
+            + "\n"
+        )
+
+    if args.json:
+        print(
+            json.dumps(
+                {"results": results, "baseline": baseline, "regressions": regressions},
+                indent=2,
+            )
+        )
+    else:
+        print(f"{'case':<28}{'ns/call':>12}{'baseline':>12}{'change':>10}")
+        for name, ns in results.items():
+            if name in baseline:
+                change = f"{ns / baseline[name] - 1:+.1%}"
+                print(f"{name:<28}{ns:>12.0f}{baseline[name]:>12.0f}{change:>10}")
+            else:
+                print(f"{name:<28}{ns:>12.0f}{'-':>12}{'-':>10}")
+        for name in regressions:
+            print(f"REGRESSION {name}: more than {args.threshold:.0%} slower")
+
+    if args.compare and regressions:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""
+Benchmark of the movement rules, comparing the bitmask board against the
+original implementation which scanned the MAP frozensets and the per location
+lists of GameState.map.
+
+Run from the server directory with:
+    python -m benchmarks.bench_movement
+"""
+
+import random
+import timeit
+
+from util.actions import MoveAction
+from util.enums import HallEnum, HttpEnum
+from util.game_map import LOCATIONS, MAP
+from util.game_state import GameState
+from util.movement import does_possible_move_exist, validate_move
+
+NUMBER = 20000
+
+
+def legacy_validate_move(
+    movement: MoveAction, current_location, gs: GameState
+) -> tuple:
+    if gs.current_turn.phase != "move":
+        return (HttpEnum.bad_request, "Wrong phase of the game to perform a move.")
+    if movement.location not in MAP[current_location]:
+        return (HttpEnum.bad_request, "Invalid location to move to.")
+    if isinstance(movement.location, HallEnum) and len(gs.map[movement.location]) >= 1:
+        return (HttpEnum.bad_request, "Cannot move to an occupied hallway.")
+    return (HttpEnum.good, "")
+
+
+def legacy_does_possible_move_exist(current_location, gs: GameState) -> bool:
+    hall_count = 0
+    player_count = 0
+    for location in MAP[current_location]:
+        if type(location) is HallEnum:
+            hall_count += 1
+        if gs.map[location]:
+            player_count += 1
+    if hall_count != len(MAP[current_location]):
+        return True
+    return player_count != len(MAP[current_location])
+
+
+def run(fn, cases) -> float:
+    """
+    Returns the average time in nanoseconds of one call to fn over all cases
+    """
+
+    def loop():
+        for args in cases:
+            fn(*args)
+
+    seconds = timeit.timeit(loop, number=NUMBER // len(cases))
+    return seconds / ((NUMBER // len(cases)) * len(cases)) * 1e9
+
+
+def main() -> None:
+    rng = random.Random(0)
+    gs = GameState(6)
+
+    moves = []
+    for _ in range(200):
+        current = rng.choice(LOCATIONS)
+        target = rng.choice(LOCATIONS)
+        moves.append((MoveAction("player1", target), current, gs))
+    locations = [(location, gs) for location in LOCATIONS]
+
+    # Both implementations must agree before timing them
+    for args in moves:
+        assert validate_move(*args) == legacy_validate_move(*args)
+    for args in locations:
+        assert does_possible_move_exist(*args) == legacy_does_possible_move_exist(*args)
+
+    rows = [
+        ("validate_move", validate_move, legacy_validate_move, moves),
+        (
+            "does_possible_move_exist",
+            does_possible_move_exist,
+            legacy_does_possible_move_exist,
+            locations,
+        ),
+    ]
+    print(f"{'function':<28}{'legacy ns':>12}{'bitmask ns':>12}{'speedup':>10}")
+    for name, current, legacy, cases in rows:
+        legacy_ns = run(legacy, cases)
+        current_ns = run(current, cases)
+        print(
+            f"{name:<28}{legacy_ns:>12.0f}{current_ns:>12.0f}"
+            f"{legacy_ns / current_ns:>9.2f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
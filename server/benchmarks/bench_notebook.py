@@ -0,0 +1,60 @@
+"""
+Benchmark of keeping a player's notebook (util/notebook.py) up to date: the
+cost of recording the outcome of one suggestion, which happens on every
+/suggestion, and of setting up the notebooks of a new game.
+
+Run from the server directory with:
+    python -m benchmarks.bench_notebook
+"""
+
+import random
+import timeit
+
+from util.cards import cards_to_mask, mask_to_cards
+from util.enums import PlayerEnum, WeaponEnum, RoomEnum
+from util.game_state import GameState
+from util.notebook import Notebook
+
+NUMBER = 200
+SUGGESTIONS = 30
+
+
+def main() -> None:
+    rng = random.Random(0)
+    game = GameState(6, rng=rng)
+    rooms = [room for room in RoomEnum if room != RoomEnum.staging]
+
+    # the outcomes of a player's suggestions, worked out from the game
+    outcomes = []
+    seen = 0
+    for _ in range(SUGGESTIONS):
+        suggestion = cards_to_mask(
+            [
+                rng.choice(list(PlayerEnum)),
+                rng.choice(list(WeaponEnum)),
+                rng.choice(rooms),
+            ]
+        )
+        disprover = game.find_disprover("player1", suggestion & ~seen)
+        if disprover is None:
+            outcomes.append((suggestion, None, None))
+            continue
+        player, cards = disprover
+        card = mask_to_cards(cards)[0]
+        seen |= cards_to_mask([card])
+        outcomes.append((suggestion, game.player_order.index(player), card))
+
+    def play() -> None:
+        notebook = Notebook(0, game.hands)
+        for suggestion, disprover, card in outcomes:
+            notebook.suggested(suggestion)
+            notebook.disproved(disprover, card)
+
+    setup = timeit.timeit(lambda: Notebook(0, game.hands), number=NUMBER) / NUMBER
+    total = timeit.timeit(play, number=NUMBER) / NUMBER
+    print(f"new notebook:        {setup * 1e6:6.1f} us")
+    print(f"suggestion outcome:  {(total - setup) / SUGGESTIONS * 1e6:6.1f} us")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""
+Benchmark of rebuilding games from their events, the way SQLiteGameStore
+loads a game: either replaying every event from the start, or decoding the
+latest snapshot and replaying only the events after it.
+
+Run from the server directory with:
+    python -m benchmarks.bench_replay
+"""
+
+import json
+import random
+import timeit
+
+from util.enums import PlayerEnum, WeaponEnum, RoomEnum
+from util.events import (
+    Chatted,
+    Disproved,
+    GameCreated,
+    Moved,
+    Suggested,
+    event_from_dict,
+    replay,
+)
+from util.game_map import MAP
+from util.game_state import GameState
+from util.store import decode_game, encode_game
+
+NUMBER = 20
+EVENTS = 2000
+SNAPSHOT_EVERY = 50
+
+
+def random_game(rng: random.Random) -> tuple[GameState, list]:
+    """
+    Plays a game of random moves, suggestions and chat messages, the
+    events are not checked against the rules as replay does not check them
+    """
+    game = GameState(6)
+    events = [GameCreated.from_game(game)]
+    events[0].apply(game)
+
+    while len(events) < EVENTS:
+        player = rng.choice(game.player_order)
+        location = game.get_location(game.get_character(player))
+        target = rng.choice(sorted(MAP[location], key=str))
+        new = [Moved(player, target, "12:00")]
+        if isinstance(target, RoomEnum):
+            new.append(
+                Suggested(
+                    player,
+                    rng.choice(list(PlayerEnum)),
+                    rng.choice(list(WeaponEnum)),
+                    target,
+                    "12:00",
+                )
+            )
+            new.append(Disproved(player, None, None, "12:00"))
+        new.append(Chatted(player, "hello", "12:00"))
+        for event in new:
+            event.apply(game)
+        events.extend(new)
+    return game, events
+
+
+def run(fn) -> float:
+    """
+    Returns the average time in seconds of one call to fn
+    """
+    return timeit.timeit(fn, number=NUMBER) / NUMBER
+
+
+def main() -> None:
+    # GameState deals with the random module
+    random.seed(0)
+    game, events = random_game(random.Random(0))
+    rows = [json.dumps(event.to_dict()) for event in events]
+
+    # a snapshot with the events after it, on average a game is half way
+    # to its next snapshot
+    cut = len(events) - SNAPSHOT_EVERY // 2
+    snapshot = encode_game(replay(events[:cut]))
+    tail = rows[cut:]
+
+    def from_scratch():
+        return replay(event_from_dict(json.loads(row)) for row in rows)
+
+    def from_snapshot():
+        return replay(
+            (event_from_dict(json.loads(row)) for row in tail), decode_game(snapshot)
+        )
+
+    def apply_only():
+        return replay(events)
+
+    # Every way of loading must rebuild the same game before timing them
+    for load in (from_scratch, from_snapshot, apply_only):
+        assert load().dump_to_json() == game.dump_to_json()
+
+    print(f"{len(events)} events, snapshot every {SNAPSHOT_EVERY}")
+    print(f"{'load':<16}{'events':>8}{'ms':>10}{'events/s':>12}")
+    for name, load, count in [
+        ("apply only", apply_only, len(events)),
+        ("from scratch", from_scratch, len(events)),
+        ("from snapshot", from_snapshot, len(tail)),
+    ]:
+        seconds = run(load)
+        print(f"{name:<16}{count:>8}{seconds * 1e3:>10.2f}{count / seconds:>12.0f}")
+
+
+if __name__ == "__main__":
+    main()
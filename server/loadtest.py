@@ -0,0 +1,396 @@
+"""
+Load test of the HTTP API: plays many games at once through a running server the
+way the web client does, and reports throughput and latency percentiles for each
+endpoint.
+
+Unless --url is given the server (main.py) is started on a free local port for
+the length of the run. Every game is created with /new_game and joined with
+/username by each of its players, whose turns then go through /move,
+/suggestion, /accusation and now and then /chat, each action followed by a full
+/State like the client reloading its view. Meanwhile every player polls /State
+with since_version every --poll seconds, like a client without its update
+socket. Each game ends on its last turn with a correct accusation.
+
+Run from the server directory with:
+    python loadtest.py --games 100 --players 4 --turns 30 --json
+"""
+
+from dataclasses import asdict, dataclass, field
+import argparse
+import asyncio
+import json
+import math
+import random
+import secrets
+import subprocess
+import time
+
+import httpx
+
+from router import Worker
+from util.enums import EndGameEnum, HallEnum, PlayerEnum, RoomEnum, WeaponEnum
+from util.game_map import ADJACENCY_MASKS, HALLWAY_MASK, LOCATION_BITS, LOCATIONS
+
+PERCENTILES = (50, 95, 99)
+
+
+def percentile(ordered: list[float], p: float) -> float:
+    """
+    Function to get the nearest-rank percentile of sorted values
+    """
+    if not ordered:
+        return 0.0
+    return ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)]
+
+
+@dataclass
+class Report:
+    """
+    Statistics over every request and game of a load test
+    """
+
+    games: int = 0
+    finished: int = 0
+    failed: int = 0
+    turns: int = 0
+    seconds: float = 0.0
+    # CPU seconds used by the load test itself, when it shares the server's
+    # cores a high share of seconds means the numbers are limited by it
+    client_cpu_seconds: float = 0.0
+    # seconds taken by each answered request, and failed requests, per endpoint
+    latencies: dict[str, list[float]] = field(default_factory=dict)
+    errors: dict[str, int] = field(default_factory=dict)
+
+    def to_dict(self) -> dict:
+        output = asdict(self)
+        del output["latencies"]
+        requests = sum(len(seconds) for seconds in self.latencies.values())
+        output["requests"] = requests
+        output["requests_per_second"] = requests / self.seconds if self.seconds else 0
+        output["turns_per_second"] = self.turns / self.seconds if self.seconds else 0
+        output["endpoints"] = {}
+        for name, seconds in sorted(self.latencies.items()):
+            ordered = sorted(seconds)
+            stats = {"count": len(ordered), "errors": self.errors.get(name, 0)}
+            for p in PERCENTILES:
+                stats[f"p{p}_ms"] = percentile(ordered, p) * 1e3
+            stats["max_ms"] = ordered[-1] * 1e3 if ordered else 0.0
+            output["endpoints"][name] = stats
+        return output
+
+
+class LoadClient:
+    """
+    An HTTP client timing each request it sends into a Report
+    """
+
+    def __init__(self, client: httpx.AsyncClient, report: Report) -> None:
+        self.client = client
+        self.report = report
+
+    async def post(self, name: str, path: str, **kwargs) -> httpx.Response:
+        """
+        Send a POST request, name is the endpoint it is reported under
+        """
+        latencies = self.report.latencies.setdefault(name, [])
+        start = time.perf_counter()
+        try:
+            response = await self.client.post(path, **kwargs)
+        except httpx.HTTPError:
+            self.report.errors[name] = self.report.errors.get(name, 0) + 1
+            raise
+        latencies.append(time.perf_counter() - start)
+        if response.status_code >= 400:
+            self.report.errors[name] = self.report.errors.get(name, 0) + 1
+        return response
+
+
+def legal_moves(state: dict, player: str) -> list[RoomEnum | HallEnum]:
+    """
+    Function to list the locations a player can move to, from the map of a
+    game as sent by /State
+    """
+    character = state["player_character_mapping"][player]
+    occupied = 0
+    location = None
+    for key, characters in state["map"].items():
+        place = HallEnum(int(key)) if key.isdigit() else RoomEnum(key)
+        if characters:
+            occupied |= LOCATION_BITS[place]
+        if character in characters:
+            location = place
+    reachable = ADJACENCY_MASKS[location] & ~(occupied & HALLWAY_MASK)
+    return [target for target in LOCATIONS if reachable & LOCATION_BITS[target]]
+
+
+async def poll(
+    client: LoadClient,
+    key: str,
+    interval: float,
+    rng: random.Random,
+    done: asyncio.Event,
+) -> None:
+    """
+    Function to poll a game's state like a client without its update socket,
+    until done is set
+    """
+    version = None
+    delay = rng.uniform(0, interval)
+    while True:
+        try:
+            await asyncio.wait_for(done.wait(), delay)
+            return
+        except asyncio.TimeoutError:
+            pass
+        delay = interval
+        params = {"gameKey": key}
+        if version is not None:
+            params["since_version"] = version
+        response = await client.post("/State (poll)", "/State", params=params)
+        if response.status_code == 200:
+            version = response.json()["version"]
+
+
+async def play_game(
+    client: LoadClient,
+    num_players: int,
+    turns: int,
+    rng: random.Random,
+    poll_interval: float,
+    think: float,
+    chat_rate: float,
+) -> None:
+    """
+    Function to play one game through the API, ending with a correct accusation
+    after the given number of turns
+    """
+    report = client.report
+
+    async def pause() -> None:
+        if think:
+            await asyncio.sleep(rng.uniform(0, 2 * think))
+
+    async def state() -> dict:
+        response = await client.post("/State", "/State", params={"gameKey": key})
+        response.raise_for_status()
+        return response.json()
+
+    response = await client.post(
+        "/new_game", "/new_game", json={"num_players": num_players}
+    )
+    response.raise_for_status()
+    key = response.json()
+    players = [f"player{i + 1}" for i in range(num_players)]
+    for player in players:
+        await client.post(
+            "/username",
+            "/username",
+            json={"game_id": key, "player": player, "username": f"load-{player}"},
+        )
+
+    done = asyncio.Event()
+    pollers = [
+        asyncio.create_task(poll(client, key, poll_interval, rng, done))
+        for _ in players
+    ]
+    try:
+        current = await state()
+        for turn in range(turns):
+            if current["victory_state"] != EndGameEnum.keep_playing:
+                break
+            player = current["game_phase"]["player"]
+            phase = current["game_phase"]["phase"]
+
+            if phase == "move":
+                moves = legal_moves(current, player)
+                if not moves:
+                    break
+                target = rng.choice(moves)
+                await pause()
+                await client.post(
+                    "/move",
+                    "/move",
+                    json={"player": player, "location": target, "id": key},
+                )
+                current = await state()
+                phase = current["game_phase"]["phase"]
+
+            if phase == "suggest":
+                character = current["player_character_mapping"][player]
+                room = next(
+                    place for place, on in current["map"].items() if character in on
+                )
+                details = {
+                    "person": rng.choice(list(PlayerEnum)),
+                    "weapon": rng.choice(list(WeaponEnum)),
+                    "room": room,
+                }
+                await pause()
+                await client.post(
+                    "/suggestion",
+                    "/suggestion",
+                    json={
+                        "gameKey": key,
+                        "player": player,
+                        "statementDetails": details,
+                    },
+                )
+                current = await state()
+
+            if rng.random() < chat_rate:
+                await client.post(
+                    "/chat",
+                    "/chat",
+                    json={"key": key, "player": player, "message": "hmm"},
+                )
+
+            # the client is sent the solution, the last turn uses it to win
+            details = {"person": None, "weapon": None, "room": None}
+            if turn == turns - 1:
+                solution = current["solution"]
+                details = {
+                    "person": solution["killer"],
+                    "weapon": solution["weapon"],
+                    "room": solution["room"],
+                }
+            await pause()
+            await client.post(
+                "/accusation",
+                "/accusation",
+                json={"gameKey": key, "player": player, "statementDetails": details},
+            )
+            report.turns += 1
+            current = await state()
+
+        if current["victory_state"] != EndGameEnum.keep_playing:
+            report.finished += 1
+    finally:
+        done.set()
+        await asyncio.gather(*pollers, return_exceptions=True)
+
+
+async def load(
+    client: httpx.AsyncClient,
+    games: int,
+    num_players: int = 4,
+    turns: int = 30,
+    seed: int = 0,
+    concurrency: int | None = None,
+    poll_interval: float = 5.0,
+    think: float = 0.0,
+    chat_rate: float = 0.2,
+) -> Report:
+    """
+    Function to play games through the API with at most concurrency of them
+    going at once, game i uses the random seed seed + i
+
+    Returns:
+        The report over every game and request
+    """
+    report = Report()
+    timed = LoadClient(client, report)
+    slots = asyncio.Semaphore(concurrency or games)
+
+    async def run(i: int) -> None:
+        async with slots:
+            report.games += 1
+            try:
+                await play_game(
+                    timed,
+                    num_players,
+                    turns,
+                    random.Random(seed + i),
+                    poll_interval,
+                    think,
+                    chat_rate,
+                )
+            except httpx.HTTPError:
+                report.failed += 1
+
+    start, cpu = time.perf_counter(), time.process_time()
+    await asyncio.gather(*(run(i) for i in range(games)))
+    report.seconds = time.perf_counter() - start
+    report.client_cpu_seconds = time.process_time() - cpu
+    return report
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--url", help="server to test, started locally if unset")
+    parser.add_argument("--games", type=int, default=50)
+    parser.add_argument("--players", type=int, default=4)
+    parser.add_argument("--turns", type=int, default=30, help="turns in each game")
+    parser.add_argument(
+        "--concurrency", type=int, default=None, help="games played at once"
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--poll", type=float, default=5.0, help="seconds")
+    parser.add_argument(
+        "--think", type=float, default=0.0, help="mean seconds before each action"
+    )
+    parser.add_argument("--chat-rate", type=float, default=0.2)
+    parser.add_argument("--connections", type=int, default=100)
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    parser.add_argument("--output", help="also write the JSON report to this file")
+    parser.add_argument(
+        "--server-logs", action="store_true", help="show the local server's logs"
+    )
+    args = parser.parse_args()
+
+    worker = None
+    url = args.url
+    if url is None:
+        logs = None if args.server_logs else subprocess.DEVNULL
+        worker = Worker.start(secrets.token_urlsafe(32), output=logs)
+        url = worker.url
+
+    async def run() -> Report:
+        limits = httpx.Limits(max_connections=args.connections)
+        async with httpx.AsyncClient(base_url=url, limits=limits, timeout=30) as client:
+            return await load(
+                client,
+                args.games,
+                args.players,
+                args.turns,
+                args.seed,
+                args.concurrency,
+                args.poll,
+                args.think,
+                args.chat_rate,
+            )
+
+    try:
+        report = asyncio.run(run())
+    finally:
+        if worker is not None:
+            worker.stop()
+
+    stats = report.to_dict()
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(stats, f, indent=2)
+    if args.json:
+        print(json.dumps(stats, indent=2))
+        return
+
+    print(
+        f"{report.games} games ({report.finished} finished, {report.failed} failed) "
+        f"in {report.seconds:.2f}s: {stats['requests_per_second']:.0f} requests/s, "
+        f"{stats['turns_per_second']:.0f} turns/s, "
+        f"{report.client_cpu_seconds:.2f}s of CPU used by the load test"
+    )
+    print(
+        f"  {'endpoint':<16}{'count':>8}{'errors':>8}"
+        + "".join(f"{f'p{p} ms':>10}" for p in PERCENTILES)
+        + f"{'max ms':>10}"
+    )
+    for name, endpoint in stats["endpoints"].items():
+        print(
+            f"  {name:<16}{endpoint['count']:>8}{endpoint['errors']:>8}"
+            + "".join(f"{endpoint[f'p{p}_ms']:>10.2f}" for p in PERCENTILES)
+            + f"{endpoint['max_ms']:>10.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,22 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import (
+    FastAPI,
+    Header,
+    HTTPException,
+    Request,
+    Response,
+    WebSocket,
+    WebSocketDisconnect,
+)
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 
 from util.game_state import GameState
-from util.enums import RoomEnum, HttpEnum, EndGameEnum
+from util.enums import HttpEnum, EndGameEnum
+from util import engine
+from util.engine import RuleError
+from util.estimator import probabilities, sample
+from util.events import Event
 from util.actions import (
     ChatRequest,
     NewGameRequest,
@@ -10,25 +24,180 @@ from util.actions import (
     Statement,
     UsernameRequest,
 )
-from util.functions import get_character_location, get_time, location_str
-from util.movement import move_player, validate_move
+from util.functions import etag_matches
+from util.locks import KeyedLocks
+from util.logs import parse_settings, setup_logging
+from util.metrics import (
+    CONTENT_TYPE,
+    MetricsMiddleware,
+    RequestMetrics,
+    family,
+    resident_memory,
+)
+from util.profiling import TOP, ProfilingMiddleware, RequestProfiler
+from util.push import UpdateHub
+from util.registry import DirectoryArchive, GameRegistry
+from util.store import (
+    SQLiteGameStore,
+    SocketGameStore,
+    VersionConflict,
+    decode_game,
+    encode_game,
+)
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import asynccontextmanager
+import asyncio
+import copy
+import hmac
+import math
+import multiprocessing
+import os
 import random
+import time
+from typing import Annotated, Literal
 
 import uuid
 
 import logging
 
-logging.basicConfig(format="%(levelname)s: %(message)s", level=logging.DEBUG)
+# Log records are formatted and written by a background thread (see util/logs.py).
+# CLUELESS_LOG_LEVEL sets the level of every logger and CLUELESS_LOG_LEVELS those
+# of single modules, CLUELESS_LOG_SAMPLE keeps one in n of the records of busy
+# events or loggers and CLUELESS_LOG_FORMAT=text writes plain text instead of JSON.
+setup_logging(
+    level=os.environ.get("CLUELESS_LOG_LEVEL", "INFO"),
+    levels=parse_settings(os.environ.get("CLUELESS_LOG_LEVELS", "")),
+    rates={
+        name: int(rate)
+        for name, rate in parse_settings(
+            os.environ.get("CLUELESS_LOG_SAMPLE", "")
+        ).items()
+    },
+    structured=os.environ.get("CLUELESS_LOG_FORMAT", "json") != "text",
+)
 logger = logging.getLogger(__name__)
 
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global estimate_pool
+
+    if ESTIMATE_WORKERS:
+        # workers are started as tasks come in, start them all before serving so
+        # that their start-up does not count against the first estimate's deadline
+        pool, loop = start_estimate_pool(), asyncio.get_running_loop()
+        await asyncio.gather(
+            *(loop.run_in_executor(pool, abs, 0) for _ in range(ESTIMATE_WORKERS))
+        )
+    yield
+    # Make sure every queued write reaches the database before exiting
+    await games.drain()
+    if store is not None:
+        store.close()
+    if estimate_pool is not None:
+        estimate_pool.shutdown(cancel_futures=True)
+        estimate_pool = None
+
+
+app = FastAPI(lifespan=lifespan)
 
 origins = [
     "http://localhost:3000",  # this origin should be removed from PROD but for our purposes its no big deal
     "https://clueless-eight.vercel.app",
 ]
 
-games = {}
+# If a store is configured every event of a game is recorded in it and games are
+# loaded back from it lazily. A database lets games survive restarts, a shared
+# store (a database opened with CLUELESS_SHARED_DATABASE=1 or the table served by
+# "python -m util.store <socket>", both given CLUELESS_STORE_KEY) lets several
+# worker processes serve the same games.
+if "CLUELESS_STORE_SOCKET" in os.environ:
+    store = SocketGameStore(
+        os.environ["CLUELESS_STORE_SOCKET"], os.environ.get("CLUELESS_STORE_KEY", "")
+    )
+elif "CLUELESS_DATABASE" in os.environ:
+    store = SQLiteGameStore(
+        os.environ["CLUELESS_DATABASE"],
+        shared=os.environ.get("CLUELESS_SHARED_DATABASE") == "1",
+    )
+else:
+    store = None
+
+# How often, in seconds, update listeners check a shared store for changes made
+# by other processes, which cannot notify them
+SHARED_POLL_INTERVAL = 1.0
+
+# Games idle for longer than these many seconds are evicted from memory, finished
+# games go sooner. Evicted games are kept in the database or archive directory, if
+# one is configured, and reloaded when they are next used, otherwise they are dropped.
+games = GameRegistry(
+    ttl=float(os.environ.get("CLUELESS_GAME_TTL", 6 * 60 * 60)),
+    finished_ttl=float(os.environ.get("CLUELESS_FINISHED_GAME_TTL", 30 * 60)),
+    max_games=(
+        int(os.environ["CLUELESS_MAX_GAMES"])
+        if "CLUELESS_MAX_GAMES" in os.environ
+        else None
+    ),
+    archive=(
+        store
+        if store is not None
+        else (
+            DirectoryArchive(os.environ["CLUELESS_ARCHIVE_DIR"])
+            if "CLUELESS_ARCHIVE_DIR" in os.environ
+            else None
+        )
+    ),
+)
+
+# Clients listening for pushed updates, keyed by game key
+hub = UpdateHub()
+
+# Handlers changing a game hold its lock, see commit
+game_locks = KeyedLocks()
+
+# Solution probabilities are estimated by sampling card deals in this many worker
+# processes (0 samples in a thread instead), stopping after ESTIMATE_SAMPLES deals
+# or ESTIMATE_SECONDS after the request arrived, whichever comes first. The pool is
+# started with the app, from a fork server where there is one: forking this process
+# would copy the locks of its logging and store threads in whatever state they are.
+ESTIMATE_WORKERS = int(
+    os.environ.get("CLUELESS_ESTIMATE_WORKERS", min(4, os.cpu_count() or 1))
+)
+ESTIMATE_SAMPLES = int(os.environ.get("CLUELESS_ESTIMATE_SAMPLES", 20000))
+ESTIMATE_SECONDS = float(os.environ.get("CLUELESS_ESTIMATE_SECONDS", 0.25))
+estimate_pool: ProcessPoolExecutor | None = None
+
+
+def start_estimate_pool() -> ProcessPoolExecutor:
+    """
+    Utility function to create the pool of processes estimating solution
+    probabilities, used by the app until it shuts down
+    """
+    global estimate_pool
+
+    methods = multiprocessing.get_all_start_methods()
+    estimate_pool = ProcessPoolExecutor(
+        ESTIMATE_WORKERS,
+        mp_context=multiprocessing.get_context(
+            "forkserver" if "forkserver" in methods else "spawn"
+        ),
+    )
+    return estimate_pool
+
+
+# Set by router.py on the worker processes it starts. Requests carrying the same
+# token in an X-Worker-Token header come from the router, which is allowed to pick
+# the key of a new game and to move games between workers.
+WORKER_TOKEN = os.environ.get("CLUELESS_WORKER_TOKEN")
+
+# Requests sent with CLUELESS_PROFILE_TOKEN in an X-Profile header are profiled,
+# and one request in CLUELESS_PROFILE_EVERY is sampled for the rolling hot spots,
+# both are read from /internal/profiles (see util/profiling.py)
+profiler = RequestProfiler(
+    token=os.environ.get("CLUELESS_PROFILE_TOKEN"),
+    every=int(os.environ.get("CLUELESS_PROFILE_EVERY", 0)),
+)
+app.add_middleware(ProfilingMiddleware, profiler=profiler)
 
 app.add_middleware(
     CORSMiddleware,
@@ -38,17 +207,103 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Counts and latencies of the requests to each route, served by /metrics. Added
+# last so it is the outermost middleware and times the whole request.
+request_metrics = RequestMetrics()
+app.add_middleware(MetricsMiddleware, metrics=request_metrics)
+
+
+async def checkout(key: str) -> GameState | None:
+    """
+    Function to get the game a handler applies its changes to, None for unknown
+    keys. Recording in a shared store waits on other processes, so
+    there the changes are made to a copy of the game which commit swaps in once
+    they are recorded. Until then other requests keep reading the recorded
+    version, and a copy whose changes conflict is simply dropped.
+    """
+    game = await games.fetch(key)
+    if game is not None and store is not None and store.shared:
+        game = game.copy()
+    return game
+
+
+async def commit(key: str, game: GameState, *events: Event) -> None:
+    """
+    Called by every handler after the engine has applied its changes to a game
+    (from checkout, or a new one), records the events if a store is configured,
+    holds the game in memory and notifies the clients listening for updates to it.
+
+    Recording in a shared store is done in a worker thread as it waits on
+    other processes, so a handler can be suspended here. Handlers must hold
+    game_locks(key) from reading the game until commit returns, otherwise a
+    second request for the same game could be validated against the state
+    from before this one's changes.
+
+    If another process changed the game in a shared store since the handler
+    read it, the events are not recorded and the request fails with a 409, the
+    stale copy of the game is dropped so the client's retry reloads it.
+    """
+    if store is not None:
+        try:
+            if store.shared:
+                await asyncio.to_thread(store.record, key, events, game)
+            else:
+                store.record(key, events, game)
+        except VersionConflict:
+            games.drop(key)
+            raise HTTPException(
+                status_code=HttpEnum.conflict,
+                detail="The game was changed by another request, try again.",
+            )
+    games.replace(key, game)
+    hub.publish(key)
+
+
+@app.exception_handler(RuleError)
+async def rule_error(request: Request, error: RuleError) -> JSONResponse:
+    """
+    Actions the engine does not allow are answered like an HTTPException
+    """
+    return JSONResponse(status_code=error.status, content={"detail": error.detail})
+
+
+def from_router(x_worker_token: str | None) -> bool:
+    """
+    Utility function to check a request was made by the router
+    """
+    return (
+        WORKER_TOKEN is not None
+        and x_worker_token is not None
+        and hmac.compare_digest(WORKER_TOKEN, x_worker_token)
+    )
+
+
+def check_router(x_worker_token: str | None) -> None:
+    if not from_router(x_worker_token):
+        raise HTTPException(
+            status_code=HttpEnum.forbidden, detail="Only for the router."
+        )
+
 
 @app.post("/new_game")
-async def initialize_game(req: NewGameRequest) -> str:
-    try:
-        temp = GameState(req.num_players)
-    except ValueError:
-        raise HTTPException(status_code=403, detail="Invalid number of players.")
+async def initialize_game(
+    req: NewGameRequest,
+    x_game_key: Annotated[str | None, Header()] = None,
+    x_worker_token: Annotated[str | None, Header()] = None,
+) -> str:
+    # The router picks the key itself, so it knows which worker the game is on
+    if x_game_key is not None and from_router(x_worker_token):
+        if await games.fetch(x_game_key) is not None:
+            raise HTTPException(
+                status_code=HttpEnum.conflict, detail="Game key already in use."
+            )
+        key = x_game_key
+    else:
+        key = str(uuid.uuid4())
 
-    key = str(uuid.uuid4())
-    logger.debug(f"Creating Game State of ID: {key}")
-    games[key] = temp
+    game, events = engine.new_game(req.num_players)
+    logger.debug("Creating game %s", key, extra={"event": "new_game", "game": key})
+    await commit(key, game, *events)
     return key
 
 
@@ -59,81 +314,238 @@ async def move(movement: MoveAction):
     endpoint takes in a MoveAction as input, which contains the player making
     the action, the game id and the desired location to move to.
     """
-    # Check if game exists
-    if movement.id is None or movement.id not in games.keys():
-        raise HTTPException(status_code=404, detail="Game not found.")
-    key = movement.id
-
-    # Check if player can be found in the current map
-    try:
-        current_location = get_character_location(
-            games[key].player_character_mapping[movement.player], games[key]
-        )
-    except (ValueError, KeyError):
-        raise HTTPException(status_code=404, detail="Player not found on Map.")
-
-    # If the player's character is marked as having been moved by a suggestion,
-    # reset it here. The default is false, so setting it to false is technically
-    # faster than also adding a conditional
-    games[key].reset_player_moved_by_suggest(
-        games[key].player_character_mapping[movement.player]
-    )
+    async with game_locks(movement.id):
+        # Check if game exists
+        game = await checkout(movement.id) if movement.id is not None else None
+        if game is None:
+            raise HTTPException(status_code=404, detail="Game not found.")
 
-    http_code = validate_move(movement, current_location, games[key])
+        events = engine.move(game, movement.player, movement.location)
+        await commit(movement.id, game, *events)
 
-    if http_code[0] == HttpEnum.good:
-        move_player(
-            character=games[key].player_character_mapping[movement.player],
-            target_location=movement.location,
-            current_location=current_location,
-            gs=games[key],
+        # If the player entered a room the game moves to the suggestion phase,
+        # otherwise (in a hallway) the accusation phase
+        logger.info(
+            "%s moved to %s, going to the %s phase",
+            movement.player,
+            movement.location.value,
+            game.current_turn.phase,
+            extra={"event": "move", "game": movement.id, "player": movement.player},
         )
-        # Check if player entered a room
-        # If they have, move the game phase to suggestion
-        # Otherwise keep the same phase but change players
-        if isinstance(movement.location, RoomEnum):
-            games[key].next_phase("suggest")
-            logging.info(f"Moving {movement.player} to {movement.location}")
-            logging.info(f"{movement.player} can now make a suggestion")
-        else:
-            # Players in Hallways can still make Accusations
-            games[key].next_phase("accuse")
-            logging.info(
-                f"{movement.player} moved to a Hallway, going to Accusation phase"
-            )
 
-        games[key].logs.append(
-            f"{get_time()} - {games[key].player_character_mapping[movement.player].value} moved to {location_str(movement.location)}."
-        )
         return {
             "Response": f"Successfully moved {movement.player} to {movement.location.value}. Moving to next Player."
         }
-    else:
-        raise HTTPException(status_code=http_code[0].value, detail=http_code[1])
 
 
 @app.post("/State")
-async def gameState(gameKey: str) -> dict:
+async def gameState(
+    gameKey: str,
+    since_version: int | None = None,
+    if_none_match: Annotated[str | None, Header()] = None,
+) -> Response:
     """
     Function to get the game state. For now this is assuming that the game state endpoint will work for everybody
+
+    If the client already holds the current version of the game, either passed as
+    since_version or as the ETag in an If-None-Match header, an empty 304 response
+    is returned instead of the full state. If since_version is older than the current
+    version only the changes made after it are returned, marked by a since_version
+    field, unless it is too old to be served from the game's change journal.
     """
     # Check if the requester has the required access to get the game state
     # TODO
 
-    # check to see if there are active games to query
-    if not games:
-        raise HTTPException(status_code=503, detail="No games available")
-
     # get the current game state from the requested game key
-    if gameKey not in games.keys():
+    currentGame = await games.fetch(gameKey)
+    if currentGame is None:
+        # check to see if there are active games to query, which may ask the store
+        if not await asyncio.to_thread(bool, games):
+            raise HTTPException(status_code=503, detail="No games available")
         # if there are keys and if the requested key doesn't match, throw an exception
         raise HTTPException(status_code=404, detail="unknown game key")
-    else:
-        # if there are no games throw an exception
-        currentGame = games[gameKey]
 
-    # convert the GameState into a dict of strings and return it
-    return currentGame.dump_to_dict()
+    etag = f'"{currentGame.version}"'
+    if since_version == currentGame.version or etag_matches(if_none_match, etag):
+        request_metrics.observe_state("not_modified", 0)
+        return Response(status_code=304, headers={"ETag": etag})
+
+    content, kind = None, "delta"
+    if since_version is not None:
+        content = currentGame.dump_changes_to_json(since_version)
+    if content is None:
+        # the already encoded snapshot of the current version
+        content, kind = currentGame.dump_to_json(), "full"
+    request_metrics.observe_state(kind, len(content))
+    return Response(
+        content=content, media_type="application/json", headers={"ETag": etag}
+    )
+
+
+@app.get("/hint")
+async def hint(gameKey: str, player: str) -> dict:
+    """
+    Function to get what a player can work out from what they know so far: how
+    many solutions are still possible, the cards which could be in the solution,
+    the accusation to make once only one is left and who could hold each card
+    """
+    currentGame = await games.fetch(gameKey)
+    if currentGame is None:
+        raise HTTPException(status_code=HttpEnum.not_found, detail="unknown game key")
+
+    if player not in currentGame.notebooks:
+        raise HTTPException(
+            status_code=HttpEnum.not_found, detail="Player is unknown to the game"
+        )
+    return currentGame.notebooks[player].to_dict(currentGame.player_order)
+
+
+@app.get("/probabilities")
+async def solution_probabilities(
+    gameKey: str, player: str, budget: float | None = None
+) -> dict:
+    """
+    Function to estimate, for a player, the chance of each person, weapon and room
+    being in the solution given what they know so far (see util/estimator.py).
+    The estimate is reused until the game changes, budget lowers the seconds
+    spent sampling below the server's limit. Requests which cannot get a worker
+    within that time get a 503, an estimate cut short by its deadline is returned
+    but not kept.
+    """
+    # the time spent waiting for the game or for a free worker counts too
+    seconds = ESTIMATE_SECONDS if budget is None else min(budget, ESTIMATE_SECONDS)
+    deadline = time.monotonic() + seconds
+
+    currentGame = await games.fetch(gameKey)
+    if currentGame is None:
+        raise HTTPException(status_code=HttpEnum.not_found, detail="unknown game key")
+
+    if player not in currentGame.notebooks:
+        raise HTTPException(
+            status_code=HttpEnum.not_found, detail="Player is unknown to the game"
+        )
+
+    version = currentGame.version
+    cached = currentGame.estimates.get(player)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+
+    # the game can change while the deals are sampled, sample from a copy
+    notebook = copy.deepcopy(currentGame.notebooks[player])
+    # the deals sampled for an estimate unless its deadline passes first
+    counts, kept, trials, wanted = [], 0, 0, ESTIMATE_SAMPLES
+    if len(notebook.solutions()) > 1:
+        if ESTIMATE_WORKERS:
+            pool = estimate_pool or start_estimate_pool()
+            loop = asyncio.get_running_loop()
+            samples = math.ceil(ESTIMATE_SAMPLES / ESTIMATE_WORKERS)
+            wanted = samples * ESTIMATE_WORKERS
+            results = await asyncio.gather(
+                *(
+                    loop.run_in_executor(
+                        pool,
+                        sample,
+                        notebook,
+                        samples,
+                        deadline,
+                        random.getrandbits(64),
+                    )
+                    for _ in range(ESTIMATE_WORKERS)
+                )
+            )
+        else:
+            results = [
+                await asyncio.to_thread(
+                    sample,
+                    notebook,
+                    ESTIMATE_SAMPLES,
+                    deadline,
+                    random.getrandbits(64),
+                )
+            ]
+        counts = [sum(column) for column in zip(*(result[0] for result in results))]
+        kept = sum(result[1] for result in results)
+        trials = sum(result[2] for result in results)
+        if not trials:
+            # the deadline passed before any worker got to sample
+            raise HTTPException(
+                status_code=HttpEnum.service_unavailable,
+                detail="Too busy to estimate, try again later.",
+            )
+
+    estimate = {
+        "version": version,
+        "samples": kept,
+        "trials": trials,
+        **probabilities(notebook, counts, kept),
+    }
+    # an estimate cut short by its deadline is not kept
+    if kept >= wanted or not trials:
+        currentGame.estimates[player] = (version, estimate)
+    return estimate
+
+
+@app.websocket("/updates")
+async def gameUpdates(websocket: WebSocket, gameKey: str):
+    """
+    Push channel for a game. The full game state is sent as soon as the client
+    connects, after that every change committed by a handler is pushed in the same
+    incremental format the State endpoint returns when given a since_version.
+    """
+    currentGame = await games.fetch(gameKey)
+    if currentGame is None:
+        await websocket.close(code=1008, reason="unknown game key")
+        return
+
+    await websocket.accept()
+    queue = hub.subscribe(gameKey)
+    # Anything sent by the client is ignored, reading is only used to notice
+    # when the client goes away
+    received = asyncio.ensure_future(websocket.receive())
+    changed = None
+    # changes made by other processes are not published here, so a shared store
+    # is also checked every so often
+    poll = SHARED_POLL_INTERVAL if store is not None and store.shared else None
+    try:
+        version = currentGame.version
+        await websocket.send_text(currentGame.dump_to_json().decode("utf-8"))
+
+        while True:
+            if changed is None:
+                changed = asyncio.ensure_future(queue.get())
+            await asyncio.wait(
+                [changed, received],
+                timeout=poll,
+                return_when=asyncio.FIRST_COMPLETED,
+            )
+
+            if received.done():
+                if received.result()["type"] == "websocket.disconnect":
+                    break
+                received = asyncio.ensure_future(websocket.receive())
+            if changed.done():
+                changed = None
+            elif poll is None:
+                continue
+
+            currentGame = await games.fetch(gameKey)
+            if currentGame is None:
+                break
+            if currentGame.version == version:
+                continue
+            update = currentGame.dump_changes_since(version)
+            version = currentGame.version
+            if update is None:
+                await websocket.send_text(currentGame.dump_to_json().decode("utf-8"))
+            else:
+                await websocket.send_json(jsonable_encoder(update))
+    except (WebSocketDisconnect, KeyError):
+        pass
+    finally:
+        received.cancel()
+        if changed is not None:
+            changed.cancel()
+        hub.unsubscribe(gameKey, queue)
 
 
 @app.post("/accusation", status_code=200)
@@ -143,64 +555,54 @@ async def makeAccusation(accusation: Statement):
     takes in a Statement object. If all details are None, the accusation phase is
     skipped.
     """
-    # Check if game exists
-    if accusation.gameKey is None or accusation.gameKey not in games.keys():
-        raise HTTPException(status_code=404, detail="Game not found.")
-    game = games[accusation.gameKey]
-
-    if game.current_turn.phase != "accuse":
-        raise HTTPException(
-            status_code=HttpEnum.bad_request,
-            detail="Game phase not in the accusation phase",
+    async with game_locks(accusation.gameKey):
+        # Check if game exists
+        game = (
+            await checkout(accusation.gameKey)
+            if accusation.gameKey is not None
+            else None
         )
-
-    # If the accusation Statement is all None, no accusation is desired
-    # and move to the next player.
-    accval = accusation.statementDetails
-    if not (accval.person or accval.weapon or accval.room):
-        log_str = f"{game.player_username_mapping[accusation.player]} opted to not make an accusation."
-        logger.info(log_str)
-        game.logs.append(f"{get_time()} - " + log_str)
-        # Move game to the next player and the move phase
-        game.next_player()
-        game.next_phase("move")
-    else:
-        game.logs.append(
-            f"{get_time()} - {game.player_username_mapping[accusation.player]} made an accusation of {accval.person.value} in {location_str(accval.room)} with the {accval.weapon.value}."
+        if game is None:
+            raise HTTPException(status_code=404, detail="Game not found.")
+
+        # If the accusation Statement is all None, no accusation is desired
+        # and the game moves to the next player. A wrong accusation leaves the
+        # player only able to disprove suggestions.
+        accval = accusation.statementDetails
+        events = engine.accuse(
+            game, accusation.player, accval.person, accval.weapon, accval.room
         )
-        # If the accusation is correct, end the game
-        if (
-            accval.person == game.solution.person
-            and accval.weapon == game.solution.weapon
-            and accval.room == game.solution.room
-        ):
-            game.logs.append(
-                f"{get_time()} - {game.player_username_mapping[accusation.player]} uncovered all the Clues and won the game!"
+        await commit(accusation.gameKey, game, *events)
+
+        fields = {
+            "event": "accusation",
+            "game": accusation.gameKey,
+            "player": accusation.player,
+        }
+        if not (accval.person or accval.weapon or accval.room):
+            logger.info(
+                "%s opted to not make an accusation", accusation.player, extra=fields
             )
-            logging.info(
-                f"{accusation.player} correctly put together the Clues and won the game!"
+        elif game.victory_state == EndGameEnum.winner_found:
+            logger.info(
+                "%s correctly put together the clues and won the game",
+                accusation.player,
+                extra=fields,
             )
-            logging.info("*****Game Over*****")
-            game.victory_state = EndGameEnum.winner_found
-        # Otherwise, the player can continue playing only as an observor to disprove
-        # suggestions; i.e. they cannot move, make suggestions or accusations.
-        # Their only purpose is to disprove other suggestions.
         else:
-            game.logs.append(
-                f"{get_time()} - {game.player_username_mapping[accusation.player]}'s accusation was incorrect; they are now a spectator"
+            # the player remains to provide input on suggestions
+            logger.info(
+                "%s's accusation was not correct%s",
+                accusation.player,
+                (
+                    ", no players are left to make one"
+                    if game.victory_state == EndGameEnum.no_winners
+                    else ""
+                ),
+                extra=fields,
             )
-            logging.info(f"{accusation.player}'s accusation was not correct.")
-            logging.info("They will remain to provide input on suggestions.")
-            game.next_player()
-            # Remove player and transition to the next one
-            game.moveable_players.remove(accusation.player)
-            if len(game.moveable_players) == 0:
-                logging.info("No Players left to make correct accusations.")
-                logging.info("*****Game Over*****")
-                game.victory_state = EndGameEnum.no_winners
-            game.next_phase("move")
 
-    return game.victory_state
+        return game.victory_state
 
 
 @app.post("/suggestion", status_code=200)
@@ -216,216 +618,266 @@ async def makeSuggestion(playerSuggestion: Statement) -> dict:
         suggestion: the suggestion they are making (player, weapon, and room)
     """
 
-    # specify internal variable details
-    suggestor: str
-    gameKey: str
-    suggestion: Statement.Details
-    returnDict = {"response": "", "player": ""}
-
-    # exceptions for unprovided data
-    if not playerSuggestion.player:
-        raise HTTPException(
-            status_code=HttpEnum.bad_request,
-            detail="player making suggestion is unspecified",
-        )
-    else:
-        suggestor = playerSuggestion.player
-
-    if not playerSuggestion.gameKey:
-        raise HTTPException(
-            status_code=HttpEnum.bad_request, detail="gameKey unspecified"
-        )
-    else:
+    async with game_locks(playerSuggestion.gameKey):
+        if not playerSuggestion.gameKey:
+            raise HTTPException(
+                status_code=HttpEnum.bad_request, detail="gameKey unspecified"
+            )
         gameKey = playerSuggestion.gameKey
-
-    if not (
-        playerSuggestion.statementDetails.person
-        or playerSuggestion.statementDetails.weapon
-        or playerSuggestion.statementDetails.room
-    ):
-        raise HTTPException(
-            status_code=HttpEnum.bad_request, detail="suggestion details unspecified"
-        )
-    else:
+        suggestor = playerSuggestion.player
         suggestion = playerSuggestion.statementDetails
 
-    # get the game state information
-    if gameKey not in games.keys():
-        # if there are keys and if the requested key doesn't match, throw an exception
-        raise HTTPException(status_code=HttpEnum.not_found, detail="unknown game key")
-    else:
-        currentGame = games[gameKey]
-
-    # dump to dictionary format
-    currentGameDict = currentGame.dump_to_dict()
-
-    try:
-        # get the character represented by the current player
-        playersCharacter = currentGameDict["player_character_mapping"][suggestor]
-    except KeyError:
-        raise HTTPException(
-            status_code=HttpEnum.not_found, detail="Suggestor is unknown to the game"
-        )
+        # get the game state information
+        currentGame = await checkout(gameKey)
+        if currentGame is None:
+            # if there are keys and if the requested key doesn't match, throw an exception
+            raise HTTPException(
+                status_code=HttpEnum.not_found, detail="unknown game key"
+            )
 
-    if (
-        currentGame.current_turn.phase != "suggest"
-        and not currentGame.moved_by_suggest[playersCharacter]
-    ):
-        raise HTTPException(
-            status_code=HttpEnum.bad_request,
-            detail="Game phase not in the suggestion phase",
+        # Making the suggestion moves the suggested character into the room, and
+        # the disproving card is added to the suggestor's seen cards
+        # TODO: Future iterations should send a request out to the identified player to show a card if one of the suggestions is in their hand
+        suggested, disproved = engine.suggest(
+            currentGame,
+            suggestor,
+            suggestion.person,
+            suggestion.weapon,
+            suggestion.room,
         )
+        await commit(gameKey, currentGame, suggested, disproved)
 
-    # If the player's character is marked as having been moved by a suggestion,
-    # reset it here. The default is false, so setting it to false is technically
-    # faster than also adding a conditional
-    currentGame.reset_player_moved_by_suggest(playersCharacter)
-
-    # Ensure the suggestor is in the same room as the suggestion they are making
-    # Satisfies game requirement
-    if get_character_location(playersCharacter, currentGame) != suggestion.room:
-        # TODO: This exception is necessary once the players can actually make suggestions - to test it will be commented out
-        raise HTTPException(
-            status_code=HttpEnum.forbidden,
-            detail="Suggestor is unable to make this suggestion -- suggestor is not in the room where the suggestion is being made",
+        # the suggested character is moved into the room
+        logger.info(
+            "%s suggests %s with the %s in the %s, disproved by %s",
+            suggestor,
+            suggestion.person.value,
+            suggestion.weapon.value,
+            suggestion.room.value,
+            disproved.disprover or "nobody",
+            extra={"event": "suggestion", "game": gameKey, "player": suggestor},
         )
+        if disproved.card is not None:
+            return {"response": disproved.card.value, "player": disproved.disprover}
+        return {"response": "", "player": ""}
 
-    logger.info(
-        f"{currentGame.player_username_mapping[playerSuggestion.player]} suggests {playerSuggestion.statementDetails.person} with the {playerSuggestion.statementDetails.weapon} in the {playerSuggestion.statementDetails.room}"
-    )
-    currentGame.logs.append(
-        f"{currentGame.player_username_mapping[playerSuggestion.player]} suggests {playerSuggestion.statementDetails.person.value} with the {playerSuggestion.statementDetails.weapon.value} in the {playerSuggestion.statementDetails.room.value}"
-    )
 
-    # move the target player to the suggested room
-    # get current room
-    movingPlayerCurrentLocation = get_character_location(suggestion.person, currentGame)
-    # create a move object of the suggestion movement
+@app.post("/chat", status_code=200)
+async def formChat(chatReq: ChatRequest):
+    """
+    Endpoint to form a chat message
+    """
+    async with game_locks(chatReq.key):
+        # get the game state information
+        currentGame = await checkout(chatReq.key)
+        if currentGame is None:
+            # if there are keys and if the requested key doesn't match, throw an exception
+            raise HTTPException(
+                status_code=HttpEnum.not_found, detail="unknown game key"
+            )
 
-    # For the sake of being more professional, don't display log
-    # if the suggested person and the player's character are the same
-    if playerSuggestion.player is not suggestion.person:
-        currentGame.logs.append(
-            f"{get_time()} - Moving suggested character {suggestion.person.value} to {location_str(suggestion.room)}"
+        logger.debug(
+            "Chat message from %s",
+            chatReq.player,
+            extra={"event": "chat", "game": chatReq.key, "player": chatReq.player},
         )
-        logger.info(f"Moving suggested player {suggestion.person} to {suggestion.room}")
-
-    # execute move
-    move_player(
-        character=suggestion.person,
-        target_location=suggestion.room,
-        current_location=movingPlayerCurrentLocation,
-        gs=currentGame,
-    )
+        events = engine.chat(currentGame, chatReq.player, chatReq.message)
+        await commit(chatReq.key, currentGame, *events)
+        return {"Response": currentGame.chat[-1]}
 
-    # Mark the Targeted player as having been moved by a suggestion
-    logger.info(
-        f"{suggestion.person} is being marked as having been moved by suggestion"
-    )
-    if suggestion.person != playersCharacter:
-        currentGame.set_player_moved_by_suggest(suggestion.person)
 
-    # after move update the game state dictionary
-    currentGameDict = currentGame.dump_to_dict()
+@app.post("/username")
+async def pick_username(req: UsernameRequest):
+    async with game_locks(req.game_id):
+        curr_game = await checkout(req.game_id)
+        if curr_game is None:
+            raise HTTPException(
+                status_code=HttpEnum.not_found, detail="unknown game ID"
+            )
 
-    # will need a way to relate the suggestor to the players in the game (i.e., their place in the order of the game)
-    # this allows us to pick the next player to look at for cards
-    playersList = list(currentGameDict["player_character_mapping"].keys())
-    loopIdx = playersList.index(suggestor)
+        events = engine.join(curr_game, req.player, req.username)
+        await commit(req.game_id, curr_game, *events)
+        logger.info(
+            "%s has joined game %s with username %s",
+            req.player,
+            req.game_id,
+            req.username,
+            extra={"event": "join", "game": req.game_id, "player": req.player},
+        )
 
-    # create a list of players that can be used to find the next player whose cards should be checked
-    top = playersList[:loopIdx]
-    bottom = playersList[loopIdx:]
-    playersList = bottom[1:] + top
 
-    # loop through the players in order and check their cards against the suggestion
-    found_card = False
-    for p in playersList:
-        # TODO: Future iterations should send a request out to the identified player to show a card if one of the suggestions is in their hand
-        playerCards = currentGameDict[p]
+@app.get("/internal/games")
+async def list_games(
+    x_worker_token: Annotated[str | None, Header()] = None,
+) -> list[str]:
+    """
+    Endpoint for the router to list the keys of every game on this worker, with
+    a shared store those of the games it holds in memory
+    """
+    check_router(x_worker_token)
+    if store is not None and store.shared:
+        return games.resident_keys()
+    return await games.fetch_keys()
 
-        # select the cards that are in the suggestion
-        overlapCards = [
-            c
-            for c in playerCards
-            if c in suggestion.person or c in suggestion.weapon or c in suggestion.room
-        ]
 
-        # check all overlapping cards for cards that the player has seen before and remove them from the pool of possible cards
-        overlapCards = [
-            c for c in overlapCards if c not in currentGame.playerHasSeen[suggestor]
-        ]
+@app.get("/internal/games/{key}")
+async def export_game(
+    key: str,
+    x_worker_token: Annotated[str | None, Header()] = None,
+) -> Response:
+    """
+    Endpoint for the router to copy a game off this worker, encoded with encode_game
+    """
+    check_router(x_worker_token)
+    game = await games.fetch(key)
+    if game is None:
+        raise HTTPException(status_code=HttpEnum.not_found, detail="unknown game key")
+    return Response(content=encode_game(game), media_type="application/octet-stream")
 
-        if overlapCards:
-            # if there are any overlapping cards, return one of them randomly
-            returnDict["response"] = random.choice(overlapCards)
-            returnDict["player"] = p
 
-            # add chosen card to the set of seen cards
-            currentGame.playerHasSeen[suggestor].add(returnDict["response"])
+@app.put("/internal/games/{key}")
+async def import_game(
+    key: str,
+    request: Request,
+    x_worker_token: Annotated[str | None, Header()] = None,
+) -> None:
+    """
+    Endpoint for the router to place a game exported from another worker here
+    """
+    async with game_locks(key):
+        check_router(x_worker_token)
+        game = decode_game(await request.body())
+        await games.put(key, game)
+        if store is not None:
+            if store.shared:
+                await asyncio.to_thread(store.save, key, game)
+            else:
+                store.save(key, game)
+        hub.publish(key)
+
+
+@app.delete("/internal/games/{key}")
+async def remove_game(
+    key: str,
+    x_worker_token: Annotated[str | None, Header()] = None,
+) -> None:
+    """
+    Endpoint for the router to remove a game which has moved to another worker,
+    with a shared store the game stays there and only this worker's copy goes
+    """
+    async with game_locks(key):
+        check_router(x_worker_token)
+        if store is not None and store.shared:
+            games.drop(key)
+        else:
+            await games.remove(key)
+        hub.publish(key)
 
-            currentGame.logs.append(
-                f"{get_time()} - {currentGame.player_username_mapping[suggestor]}'s suggestion was disproved."
-            )
-            logger.info(
-                f"{currentGame.player_username_mapping[suggestor]}'s suggestion had a card in an other player's hand."
-            )
 
-            # break loop immediately once an overlapping card is found
-            found_card = True
-            break
-    if not found_card:
-        currentGame.logs.append(
-            f"{get_time()} - {currentGame.player_username_mapping[suggestor]}'s suggestion was not disproved."
-        )
-        logger.info(
-            f"{currentGame.player_username_mapping[suggestor]}'s suggestion did NOT have a card in an other player's hand."
+def check_profiler(x_profile_token: str | None) -> None:
+    if not profiler.authorized(x_profile_token):
+        raise HTTPException(
+            status_code=HttpEnum.forbidden, detail="Only with the profiling token."
         )
 
-    # change game turn phase
-    currentGame.next_phase("accuse")
-    return returnDict
 
-
-@app.post("/chat", status_code=200)
-async def formChat(chatReq: ChatRequest):
+@app.get("/internal/profiles")
+async def list_profiles(
+    top: int = TOP,
+    sort: Literal["own", "cumulative"] = "own",
+    x_profile_token: Annotated[str | None, Header()] = None,
+) -> dict:
     """
-    Endpoint to form a chat message
+    Endpoint to get the functions taking the most time over the recently sampled
+    requests, and the requests profiled on demand (without their functions)
     """
-    # get the game state information
-    if chatReq.key not in games.keys():
-        # if there are keys and if the requested key doesn't match, throw an exception
-        raise HTTPException(status_code=HttpEnum.not_found, detail="unknown game key")
-    else:
-        currentGame = games[chatReq.key]
-
-    logger.debug("Forming a chat message")
-    currentGame.chat.append(
-        f'{get_time()} - {currentGame.player_username_mapping[chatReq.player]}: "{chatReq.message}"'
-    )
+    check_profiler(x_profile_token)
     return {
-        "Response": f'{get_time()} - {currentGame.player_username_mapping[chatReq.player]}: "{chatReq.message}"'
+        "every": profiler.every,
+        "sampled": len(profiler.window),
+        "hot_spots": profiler.hot_spots(top, sort),
+        "profiles": [
+            {name: value for name, value in profile.items() if name != "functions"}
+            for profile in profiler.profiles.values()
+        ],
     }
 
 
-@app.post("/username")
-async def pick_username(req: UsernameRequest):
-    if req.game_id not in games.keys():
-        raise HTTPException(status_code=HttpEnum.not_found, detail="unknown game ID")
-    else:
-        curr_game: GameState = games[req.game_id]
+@app.get("/internal/profiles/{profile_id}")
+async def get_profile(
+    profile_id: str,
+    x_profile_token: Annotated[str | None, Header()] = None,
+) -> dict:
+    """
+    Endpoint to get a request profiled on demand, by the id it was answered with
+    """
+    check_profiler(x_profile_token)
+    if profile_id not in profiler.profiles:
+        raise HTTPException(status_code=HttpEnum.not_found, detail="unknown profile")
+    return profiler.profiles[profile_id]
 
-    if not curr_game.player_username_mapping[req.player]:
-        print(curr_game.player_username_mapping[req.player])
-        curr_game.player_username_mapping[req.player] = req.username
-        curr_game.logs.append(
-            f'"{req.username}" has joined the game as {curr_game.player_character_mapping[req.player].value}'
-        )
-        logger.info(
-            f"{req.player} has joined game {req.game_id} with username: {req.username}"
-        )
-    else:
+
+@app.put("/internal/profiles")
+async def set_profiling(
+    every: int,
+    x_profile_token: Annotated[str | None, Header()] = None,
+) -> None:
+    """
+    Endpoint to sample one request in every for the hot spots from now on, 0 to
+    stop sampling. The hot spots gathered so far are cleared.
+    """
+    check_profiler(x_profile_token)
+    if every < 0:
         raise HTTPException(
-            status_code=HttpEnum.forbidden,
-            detail="Username already set for this player",
+            status_code=HttpEnum.bad_request, detail="every cannot be negative"
         )
+    profiler.sample_every(every)
+
+
+@app.get("/metrics")
+async def metrics() -> Response:
+    """
+    Endpoint to expose metrics in the Prometheus text format: the requests to
+    each route, the games held in memory and the memory used. Every process
+    has its own metrics, behind router.py this endpoint is served by its first
+    worker only.
+    """
+    by_state = {state: 0 for state in EndGameEnum}
+    logs = chat = snapshots = 0
+    for game in games.resident_games():
+        by_state[game.victory_state] += 1
+        logs += len(game.logs)
+        chat += len(game.chat)
+        snapshots += game.snapshot_size
+
+    text = request_metrics.render() + "".join(
+        family(name, "gauge", description, samples)
+        for name, description, samples in [
+            (
+                "clueless_games",
+                "Games held in memory, by victory state.",
+                [({"victory_state": state.name}, n) for state, n in by_state.items()],
+            ),
+            (
+                "clueless_game_log_entries",
+                "Log entries of the games held in memory.",
+                [({}, logs)],
+            ),
+            (
+                "clueless_game_chat_entries",
+                "Chat messages of the games held in memory.",
+                [({}, chat)],
+            ),
+            (
+                "clueless_state_snapshot_bytes",
+                "Bytes of the encoded /State snapshots held in memory.",
+                [({}, snapshots)],
+            ),
+            (
+                "clueless_process_resident_memory_bytes",
+                "Resident memory of this process.",
+                [({}, resident_memory())],
+            ),
+        ]
+    )
+    return Response(content=text, media_type=CONTENT_TYPE)
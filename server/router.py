@@ -0,0 +1,428 @@
+"""
+Front process spreading games over several worker processes on one machine.
+
+Every worker runs main.py with its own in-memory games. The router hashes the
+key of the game a request is for onto a HashRing of the workers and forwards the
+request to the worker owning that key, so each game is only ever changed by one
+process. New games get their key from the router, which places them on the
+worker owning it. When a worker is added or removed the games whose owner
+changed are moved to their new worker before requests resume. Workers sharing
+a store (see main.py) all serve the games in it, so then only the copies held
+in memory by the games' old workers are dropped.
+
+Run from the server directory with:
+    python router.py --workers 4 --port 8000
+"""
+
+from collections.abc import Mapping
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import Annotated
+import argparse
+import asyncio
+import json
+import os
+import secrets
+import socket
+import subprocess
+import sys
+import time
+import uuid
+
+from fastapi import FastAPI, Header, HTTPException, Request, Response, WebSocket
+import httpx
+import uvicorn
+import websockets
+
+from util.ring import HashRing
+
+# Fields holding the game key in the bodies of the game endpoints
+KEY_FIELDS = ("gameKey", "id", "key", "game_id")
+
+# Headers describing a single connection, which are not passed on
+HOP_HEADERS = {
+    "connection",
+    "content-encoding",
+    "content-length",
+    "host",
+    "keep-alive",
+    "transfer-encoding",
+}
+
+# Headers only the router itself may send to a worker
+ROUTER_HEADERS = {"x-game-key", "x-worker-token"}
+
+
+def shared_storage(env: Mapping[str, str]) -> bool:
+    """
+    Utility function to check whether workers started with an environment keep
+    their games in a store shared between them
+    """
+    return "CLUELESS_STORE_SOCKET" in env or (
+        "CLUELESS_DATABASE" in env and env.get("CLUELESS_SHARED_DATABASE") == "1"
+    )
+
+
+def check_environment(env: Mapping[str, str]) -> None:
+    """
+    Function to refuse starting workers which would keep their games in the same
+    database or archive directory without sharing them (see main.py): each
+    would list, load and overwrite the games of the others
+    """
+    if shared_storage(env):
+        return
+    if "CLUELESS_DATABASE" in env:
+        if env.get("CLUELESS_SHARED_DATABASE") != "1":
+            raise RuntimeError(
+                "Workers cannot use CLUELESS_DATABASE unless "
+                "CLUELESS_SHARED_DATABASE=1 is set."
+            )
+    elif "CLUELESS_ARCHIVE_DIR" in env:
+        raise RuntimeError("Workers cannot share a CLUELESS_ARCHIVE_DIR.")
+
+
+class Worker:
+    """
+    A worker process serving main.py on a local port
+    """
+
+    def __init__(self, url: str, process: subprocess.Popen | None = None) -> None:
+        self.url = url
+        self.process = process
+
+    @classmethod
+    def start(cls, token: str, timeout: float = 30, output=None) -> "Worker":
+        """
+        Start a worker on a free port and wait until it answers requests,
+        the worker inherits the environment of this process. Its output goes
+        to output (as for subprocess.Popen), by default that of this process.
+        """
+        check_environment(os.environ)
+        with socket.socket() as s:
+            s.bind(("127.0.0.1", 0))
+            port = s.getsockname()[1]
+
+        process = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1"]
+            + ["--port", str(port), "--log-level", "warning"],
+            cwd=Path(__file__).parent,
+            env={**os.environ, "CLUELESS_WORKER_TOKEN": token},
+            stdout=output,
+            stderr=output,
+        )
+        worker = cls(f"http://127.0.0.1:{port}", process)
+
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if process.poll() is not None:
+                raise RuntimeError("Worker exited on start up.", process.returncode)
+            try:
+                httpx.get(
+                    f"{worker.url}/internal/games",
+                    headers={"X-Worker-Token": token},
+                    timeout=1,
+                ).raise_for_status()
+                return worker
+            except httpx.HTTPError:
+                time.sleep(0.05)
+        worker.stop()
+        raise RuntimeError("Worker did not start in time.", worker.url)
+
+    def stop(self) -> None:
+        if self.process is not None:
+            self.process.terminate()
+            self.process.wait()
+
+
+class Router:
+    """
+    Decides which worker each request goes to, and moves games between workers
+    when the set of workers changes, shared tells that the workers keep their
+    games in a shared store
+    """
+
+    def __init__(self, workers: list[Worker], token: str, shared: bool = False) -> None:
+        self.workers = {worker.url: worker for worker in workers}
+        self.ring = HashRing(self.workers)
+        self.token = token
+        self.shared = shared
+        self.client: httpx.AsyncClient | None = None
+
+        # Requests wait while games are being moved, and games are only
+        # moved once the requests already forwarded have finished
+        self._ready = asyncio.Event()
+        self._ready.set()
+        self._in_flight = 0
+
+    async def start(self) -> None:
+        self.client = httpx.AsyncClient(timeout=30, follow_redirects=True)
+
+    async def close(self) -> None:
+        if self.client is not None:
+            await self.client.aclose()
+        for worker in self.workers.values():
+            worker.stop()
+
+    def owner(self, key: str | None) -> str:
+        """
+        The url of the worker owning a game, requests which are not for a game
+        go to the first worker
+        """
+        return self.ring.get(key) if key else self.ring.nodes[0]
+
+    async def forward(self, request: Request, path: str) -> Response:
+        """
+        Send a request on to the worker owning its game and return the response
+        """
+        await self._ready.wait()
+        self._in_flight += 1
+        try:
+            body = await request.body()
+            headers = {
+                name: value
+                for name, value in request.headers.items()
+                if name not in HOP_HEADERS and name not in ROUTER_HEADERS
+            }
+            if path.strip("/") == "new_game":
+                key = str(uuid.uuid4())
+                headers["X-Game-Key"] = key
+                headers["X-Worker-Token"] = self.token
+            else:
+                key = request.query_params.get("gameKey") or body_key(body)
+
+            response = await self.client.request(
+                request.method,
+                f"{self.owner(key)}/{path}",
+                params=request.query_params,
+                content=body,
+                headers=headers,
+            )
+        finally:
+            self._in_flight -= 1
+
+        return Response(
+            content=response.content,
+            status_code=response.status_code,
+            headers={
+                name: value
+                for name, value in response.headers.items()
+                if name not in HOP_HEADERS
+            },
+        )
+
+    async def add_worker(self, worker: Worker) -> int:
+        """
+        Add a worker to the ring, returns how many games were moved to it
+        """
+        ring = HashRing(self.ring.nodes + [worker.url], self.ring.replicas)
+        self.workers[worker.url] = worker
+        return await self._rebalance(ring, self.ring.nodes)
+
+    async def remove_worker(self, url: str) -> int:
+        """
+        Move every game off a worker and stop it, returns how many games were moved
+        """
+        if url not in self.workers or len(self.workers) == 1:
+            raise ValueError("Cannot remove this worker.", url)
+        ring = HashRing(
+            [node for node in self.ring.nodes if node != url], self.ring.replicas
+        )
+        moved = await self._rebalance(ring, self.ring.nodes)
+        self.workers.pop(url).stop()
+        return moved
+
+    async def _rebalance(self, ring: HashRing, sources: list[str]) -> int:
+        """
+        Move the games on the source workers whose owner in the new ring is
+        another worker, then switch to the new ring. Games in a shared store
+        stay there, only their old workers' copies are dropped.
+        """
+        self._ready.clear()
+        try:
+            while self._in_flight:
+                await asyncio.sleep(0.01)
+
+            moved = 0
+            headers = {"X-Worker-Token": self.token}
+            for source in sources:
+                response = await self.client.get(
+                    f"{source}/internal/games", headers=headers
+                )
+                response.raise_for_status()
+                for key in response.json():
+                    target = ring.get(key)
+                    if target == source:
+                        continue
+                    if not self.shared:
+                        # copy before removing, a game is never without a worker
+                        game = await self.client.get(
+                            f"{source}/internal/games/{key}", headers=headers
+                        )
+                        game.raise_for_status()
+                        put = await self.client.put(
+                            f"{target}/internal/games/{key}",
+                            content=game.content,
+                            headers=headers,
+                        )
+                        put.raise_for_status()
+                    # a game left on its old worker would be served stale from
+                    # there if the ring went back, stop before switching to it
+                    delete = await self.client.delete(
+                        f"{source}/internal/games/{key}", headers=headers
+                    )
+                    delete.raise_for_status()
+                    moved += 1
+            self.ring = ring
+            return moved
+        finally:
+            self._ready.set()
+
+    async def forward_websocket(self, websocket: WebSocket, path: str) -> None:
+        """
+        Connect a websocket to the worker owning its game and pass messages
+        both ways until either side closes
+        """
+        await self._ready.wait()
+        url = self.owner(websocket.query_params.get("gameKey"))
+        url = "ws" + url.removeprefix("http") + f"/{path}"
+        if websocket.url.query:
+            url += f"?{websocket.url.query}"
+
+        try:
+            upstream = await websockets.connect(url)
+        except (OSError, websockets.exceptions.InvalidHandshake):
+            await websocket.close(code=1008, reason="unknown game key")
+            return
+
+        await websocket.accept()
+
+        async def client_to_worker() -> None:
+            while True:
+                message = await websocket.receive()
+                if message["type"] == "websocket.disconnect":
+                    return
+                await upstream.send(message.get("text") or message.get("bytes"))
+
+        async def worker_to_client() -> None:
+            async for message in upstream:
+                if isinstance(message, str):
+                    await websocket.send_text(message)
+                else:
+                    await websocket.send_bytes(message)
+            await websocket.close()
+
+        tasks = [
+            asyncio.ensure_future(client_to_worker()),
+            asyncio.ensure_future(worker_to_client()),
+        ]
+        try:
+            await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await upstream.close()
+
+
+def body_key(body: bytes) -> str | None:
+    """
+    Utility function to find the game key in a JSON request body
+    """
+    try:
+        data = json.loads(body)
+    except ValueError:
+        return None
+    if not isinstance(data, dict):
+        return None
+    for field in KEY_FIELDS:
+        if isinstance(data.get(field), str):
+            return data[field]
+    return None
+
+
+def create_app(router: Router) -> FastAPI:
+    """
+    Function to build the app the router serves
+    """
+
+    @asynccontextmanager
+    async def lifespan(app: FastAPI):
+        await router.start()
+        yield
+        await router.close()
+
+    app = FastAPI(lifespan=lifespan)
+
+    def check_token(x_worker_token: str | None) -> None:
+        if x_worker_token is None or not secrets.compare_digest(
+            x_worker_token, router.token
+        ):
+            raise HTTPException(status_code=403, detail="Only for administrators.")
+
+    @app.get("/router/workers")
+    async def list_workers(
+        x_worker_token: Annotated[str | None, Header()] = None,
+    ) -> list[str]:
+        check_token(x_worker_token)
+        return router.ring.nodes
+
+    @app.post("/router/workers")
+    async def add_worker(
+        x_worker_token: Annotated[str | None, Header()] = None,
+    ) -> dict:
+        """
+        Start another local worker and move its share of the games to it
+        """
+        check_token(x_worker_token)
+        worker = await asyncio.to_thread(Worker.start, router.token)
+        moved = await router.add_worker(worker)
+        return {"worker": worker.url, "moved": moved}
+
+    @app.delete("/router/workers")
+    async def remove_worker(
+        url: str,
+        x_worker_token: Annotated[str | None, Header()] = None,
+    ) -> dict:
+        """
+        Move every game off a worker to the others and stop it
+        """
+        check_token(x_worker_token)
+        try:
+            moved = await router.remove_worker(url)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Cannot remove this worker.")
+        return {"worker": url, "moved": moved}
+
+    @app.api_route(
+        "/{path:path}", methods=["GET", "POST", "PUT", "PATCH", "DELETE", "OPTIONS"]
+    )
+    async def forward(request: Request, path: str) -> Response:
+        return await router.forward(request, path)
+
+    @app.websocket("/{path:path}")
+    async def forward_websocket(websocket: WebSocket, path: str) -> None:
+        await router.forward_websocket(websocket, path)
+
+    return app
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    args = parser.parse_args()
+
+    # The token lets the router use the workers' internal endpoints and its own
+    # /router endpoints, set it to be able to add and remove workers by hand
+    token = os.environ.get("CLUELESS_WORKER_TOKEN") or secrets.token_urlsafe(32)
+    try:
+        check_environment(os.environ)
+    except RuntimeError as e:
+        parser.error(str(e))
+    workers = [Worker.start(token) for _ in range(args.workers)]
+    router = Router(workers, token, shared_storage(os.environ))
+    uvicorn.run(create_app(router), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,214 @@
+"""
+Plays complete games between bots (see util/bots.py) through the headless engine,
+spread over a pool of processes, and reports throughput and win rates.
+
+Every game is seeded on its own (the seed of game i is --seed + i), so any game
+can be replayed exactly, whichever process played it. Useful to check how many
+games a box can handle and that rule changes do not shift the outcomes.
+
+Run from the server directory with:
+    python simulate.py --games 10000 --players 4 --bots eliminator,random
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict, dataclass, field
+import argparse
+import json
+import os
+import random
+import time
+
+from util import engine
+from util.bots import BOTS
+from util.enums import EndGameEnum
+
+# Logged times are not needed in simulations, a fixed one keeps games reproducible
+TIME = "00:00:00"
+
+
+@dataclass
+class GameResult:
+    seed: int
+    num_players: int
+    turns: int
+    victory_state: EndGameEnum
+    winner: str | None = None
+    winner_bot: str | None = None
+
+
+@dataclass
+class Report:
+    """
+    Statistics over every game of a simulation
+    """
+
+    games: int = 0
+    finished: int = 0
+    turns: int = 0
+    seconds: float = 0.0
+    # wins, and seats played, for each bot and each seat
+    bot_wins: dict[str, int] = field(default_factory=dict)
+    bot_seats: dict[str, int] = field(default_factory=dict)
+    seat_wins: dict[str, int] = field(default_factory=dict)
+
+    def add(self, result: GameResult, bots: list[str]) -> None:
+        self.games += 1
+        self.turns += result.turns
+        if result.victory_state != EndGameEnum.keep_playing:
+            self.finished += 1
+        for i in range(result.num_players):
+            name = bots[i % len(bots)]
+            self.bot_seats[name] = self.bot_seats.get(name, 0) + 1
+        if result.winner is not None:
+            self.bot_wins[result.winner_bot] = (
+                self.bot_wins.get(result.winner_bot, 0) + 1
+            )
+            self.seat_wins[result.winner] = self.seat_wins.get(result.winner, 0) + 1
+
+    def to_dict(self) -> dict:
+        output = asdict(self)
+        output["games_per_second"] = self.games / self.seconds if self.seconds else 0
+        output["turns_per_second"] = self.turns / self.seconds if self.seconds else 0
+        output["win_rate_per_seat"] = {
+            name: self.bot_wins.get(name, 0) / seats
+            for name, seats in self.bot_seats.items()
+        }
+        return output
+
+
+def play_game(
+    seed: int, num_players: int, bots: list[str], max_turns: int = 1000
+) -> GameResult:
+    """
+    Function to play one game between bots, the seats are filled by cycling
+    through the bot names. Games still going after max_turns are abandoned.
+    """
+    rng = random.Random(seed)
+    game, _ = engine.new_game(num_players, rng)
+    seated = {
+        player: BOTS[bots[i % len(bots)]](rng)
+        for i, player in enumerate(game.player_order)
+    }
+
+    turns = 0
+    player = None
+    while game.victory_state == EndGameEnum.keep_playing and turns < max_turns:
+        player = game.player_order[game.current_turn.player]
+        bot = seated[player]
+        if game.current_turn.phase == "move":
+            engine.move(game, player, bot.move(game, player), time=TIME)
+        if game.current_turn.phase == "suggest":
+            person, weapon = bot.suggest(game, player)
+            room = game.get_location(game.get_character(player))
+            events = engine.suggest(
+                game, player, person, weapon, room, time=TIME, rng=rng
+            )
+            bot.observe(game, player, events)
+        accusation = bot.accuse(game, player) or (None, None, None)
+        engine.accuse(game, player, *accusation, time=TIME)
+        turns += 1
+
+    result = GameResult(seed, num_players, turns, game.victory_state)
+    if game.victory_state == EndGameEnum.winner_found:
+        result.winner = player
+        result.winner_bot = seated[player].name
+    return result
+
+
+def _play_seeds(seeds: range, num_players: int, bots: list[str], max_turns: int):
+    return [play_game(seed, num_players, bots, max_turns) for seed in seeds]
+
+
+def simulate(
+    games: int,
+    num_players: int,
+    bots: list[str],
+    seed: int = 0,
+    processes: int | None = None,
+    max_turns: int = 1000,
+) -> tuple[Report, list[GameResult]]:
+    """
+    Function to play a batch of games over a pool of processes
+
+    Returns:
+        The report over all games and the result of each game, in seed order
+    """
+    unknown = [name for name in bots if name not in BOTS]
+    if unknown:
+        raise ValueError("Unknown bots.", unknown)
+
+    processes = processes or os.cpu_count() or 1
+    # a few chunks per process keeps them all busy until the end
+    size = max(1, games // (processes * 4))
+    chunks = [
+        range(start, min(start + size, seed + games))
+        for start in range(seed, seed + games, size)
+    ]
+
+    start = time.perf_counter()
+    if processes == 1:
+        batches = [_play_seeds(chunk, num_players, bots, max_turns) for chunk in chunks]
+    else:
+        with ProcessPoolExecutor(processes) as pool:
+            batches = list(
+                pool.map(
+                    _play_seeds,
+                    chunks,
+                    [num_players] * len(chunks),
+                    [bots] * len(chunks),
+                    [max_turns] * len(chunks),
+                )
+            )
+
+    report = Report()
+    results = [result for batch in batches for result in batch]
+    for result in results:
+        report.add(result, bots)
+    report.seconds = time.perf_counter() - start
+    return report, results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--games", type=int, default=1000)
+    parser.add_argument("--players", type=int, default=4)
+    parser.add_argument(
+        "--bots",
+        default="eliminator",
+        help=f"comma separated, seated in turn, from: {', '.join(BOTS)}",
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--processes", type=int, default=None)
+    parser.add_argument("--max-turns", type=int, default=1000)
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args()
+
+    report, _ = simulate(
+        args.games,
+        args.players,
+        args.bots.split(","),
+        args.seed,
+        args.processes,
+        args.max_turns,
+    )
+    stats = report.to_dict()
+    if args.json:
+        print(json.dumps(stats, indent=2))
+        return
+
+    print(
+        f"{report.games} games ({report.finished} finished) in {report.seconds:.2f}s: "
+        f"{stats['games_per_second']:.0f} games/s, "
+        f"{stats['turns_per_second']:.0f} turns/s, "
+        f"{report.turns / max(report.games, 1):.1f} turns/game"
+    )
+    for name, rate in sorted(stats["win_rate_per_seat"].items()):
+        print(
+            f"  {name:<12} wins {report.bot_wins.get(name, 0):>7}  {rate:.1%} per seat"
+        )
+    for seat, wins in sorted(report.seat_wins.items()):
+        print(f"  {seat:<12} wins {wins:>7}  {wins / report.games:.1%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,201 @@
+from util import engine
+from util.cards import CARDS, CARD_IDS, mask_to_cards
+from util.engine import RuleError
+from util.enums import PlayerEnum, WeaponEnum, RoomEnum, EndGameEnum
+from util.game_map import LOCATION_IDS, LOCATION_BITS, LOCATIONS
+from util.game_state import GameState
+import pytest
+import random
+
+np = pytest.importorskip("numpy")
+from util.batch import (  # noqa: E402
+    ACCUSE,
+    CHARACTERS,
+    MOVE,
+    NONE,
+    PHASES,
+    SUGGEST,
+    GameBatch,
+    choose_bits,
+)
+
+
+def assert_same(batch: GameBatch, games: list[GameState]) -> None:
+    """
+    Utility function to check every game of a batch against the GameState
+    playing the same actions
+    """
+    occupancy = batch.occupancy
+    for i, game in enumerate(games):
+        assert batch.solution_mask[i] == game.solution.mask
+        assert batch.hands[i].tolist() == game.hands
+        assert batch.seen[i].tolist() == [
+            game.seen_cards[player] for player in game.player_order
+        ]
+        assert batch.card_owners[i].tolist() == game.card_owners
+        assert [CHARACTERS[c] for c in batch.characters[i]] == [
+            game.get_character(player) for player in game.player_order
+        ]
+        assert [LOCATIONS[location] for location in batch.locations[i]] == [
+            game.get_location(character) for character in CHARACTERS
+        ]
+        assert occupancy[i] == game.occupancy
+        assert batch.moved_by_suggest[i].tolist() == [
+            game.moved_by_suggest[character] for character in CHARACTERS
+        ]
+        assert batch.turn[i] == game.current_turn.player
+        assert PHASES[batch.phase[i]] == game.current_turn.phase
+        assert batch.active[i].tolist() == [
+            player in game.moveable_players for player in game.player_order
+        ]
+        assert batch.victory[i] == game.victory_state
+
+
+def play_step(batch: GameBatch, games: list[GameState], rng, py_rng) -> None:
+    """
+    Utility function to play one turn of every game in the batch and in the
+    GameStates, random moves and suggestions drawn from rng, an accusation once
+    a player knows the solution and the odd wrong one
+    """
+    movers = batch.ongoing & (batch.phase == MOVE)
+    moves = batch.legal_moves()
+    targets = choose_bits(moves, len(LOCATIONS), rng)
+    for i in np.flatnonzero(movers):
+        player = games[i].player_order[batch.turn[i]]
+        legal = sum(LOCATION_BITS[t] for t in engine.legal_moves(games[i], player))
+        assert moves[i] == legal
+        engine.move(games[i], player, LOCATIONS[targets[i]])
+    batch.move(targets, movers)
+
+    suggesters = batch.ongoing & (batch.phase == SUGGEST)
+    persons = rng.integers(len(PlayerEnum), size=batch.size)
+    weapons = rng.integers(len(WeaponEnum), size=batch.size)
+    shown = np.full(batch.size, NONE)
+    expected = np.full(batch.size, NONE)
+    for i in np.flatnonzero(suggesters):
+        game = games[i]
+        player = game.player_order[batch.turn[i]]
+        room = game.get_location(game.get_character(player))
+        _, disproved = engine.suggest(
+            game,
+            player,
+            list(PlayerEnum)[persons[i]],
+            list(WeaponEnum)[weapons[i]],
+            room,
+            rng=py_rng,
+        )
+        if disproved.card is not None:
+            shown[i] = CARD_IDS[disproved.card]
+            expected[i] = game.player_order.index(disproved.disprover)
+    disprovers, cards = batch.suggest(persons, weapons, suggesters, shown=shown)
+    assert disprovers[suggesters].tolist() == expected[suggesters].tolist()
+    assert cards[suggesters].tolist() == shown[suggesters].tolist()
+
+    accusers = batch.ongoing & (batch.phase == ACCUSE)
+    unknown = batch.current(batch.unknown_cards())
+    accusation = np.full((batch.size, 3), NONE)
+    for i in np.flatnonzero(accusers):
+        game = games[i]
+        player = game.player_order[batch.turn[i]]
+        cards = mask_to_cards(int(unknown[i]))
+        if len(cards) != 3 and py_rng.random() < 0.02:
+            cards = [
+                py_rng.choice(list(PlayerEnum)),
+                py_rng.choice(list(WeaponEnum)),
+                py_rng.choice(list(RoomEnum)),
+            ]
+        if len(cards) == 3:
+            accusation[i] = [
+                list(PlayerEnum).index(cards[0]),
+                list(WeaponEnum).index(cards[1]),
+                list(RoomEnum).index(cards[2]),
+            ]
+            engine.accuse(game, player, *cards)
+        else:
+            engine.accuse(game, player, None, None, None)
+    batch.accuse(*accusation.T, accusers)
+
+
+@pytest.mark.parametrize("num_players", range(2, 7))
+def test_batch_matches_game_state(num_players: int):
+    """
+    Test that games played in a batch stay identical to GameStates dealt from
+    the same seeds and playing the same actions, turn by turn
+    """
+    seeds = range(40)
+    games = [engine.new_game(num_players, random.Random(seed))[0] for seed in seeds]
+    batch = GameBatch.from_games(games)
+    rng = np.random.default_rng(num_players)
+    py_rng = random.Random(num_players)
+
+    assert_same(batch, games)
+    for _ in range(150):
+        play_step(batch, games, rng, py_rng)
+        assert_same(batch, games)
+        if not batch.ongoing.any():
+            break
+
+    # both winning and wrong accusations were played
+    assert (batch.victory == EndGameEnum.winner_found).any()
+    assert (~batch.active).any()
+
+
+def test_new_batch_deals_like_game_state():
+    """
+    Test that a dealt batch follows the rules of GameState: Miss Scarlet first,
+    distinct characters at their starting locations and every card but the
+    solution dealt round the table
+    """
+    batch = GameBatch.new(4, 500, np.random.default_rng(0))
+
+    assert (batch.characters[:, 0] == 0).all()
+    for i in range(batch.size):
+        assert len(set(batch.characters[i].tolist())) == 4
+        game = GameState(
+            4,
+            player_character_mapping={
+                f"player{n + 1}": CHARACTERS[c]
+                for n, c in enumerate(batch.characters[i])
+            },
+        )
+        assert [LOCATIONS[location] for location in batch.locations[i]] == [
+            game.get_location(character) for character in CHARACTERS
+        ]
+
+    every = (1 << len(CARDS)) - 1
+    assert (
+        np.bitwise_or.reduce(batch.hands, axis=1) | batch.solution_mask == every
+    ).all()
+    assert (batch.hands.sum(axis=1) + batch.solution_mask == every).all()
+    # solutions cover every person, weapon and room
+    assert len(set(batch.solution[:, 0].tolist())) == len(PlayerEnum)
+    assert len(set(batch.solution[:, 2].tolist())) == len(RoomEnum)
+
+
+def test_illegal_actions_change_nothing():
+    """
+    Test that an action any of the chosen games cannot take raises a RuleError
+    and leaves every game as it was
+    """
+    games = [engine.new_game(3, random.Random(seed))[0] for seed in range(3)]
+    batch = GameBatch.from_games(games)
+    first = np.array([True, False, False])
+
+    with pytest.raises(RuleError):
+        batch.move(np.full(3, LOCATION_IDS[RoomEnum.kitchen]), first)
+    with pytest.raises(RuleError):
+        batch.suggest(np.zeros(3), np.zeros(3), first)
+    with pytest.raises(RuleError):
+        batch.accuse(np.zeros(3), np.zeros(3), np.zeros(3), first)
+    assert_same(batch, games)
+
+
+def test_choose_bits():
+    rng = np.random.default_rng(0)
+    masks = np.array([0b1, 0b1010, 0, 0b111] * 1000, np.int64)
+    chosen = choose_bits(masks, 4, rng)
+
+    assert (chosen[0::4] == 0).all()
+    assert set(chosen[1::4].tolist()) == {1, 3}
+    assert (chosen[2::4] == NONE).all()
+    assert np.bincount(chosen[3::4]).min() > 250
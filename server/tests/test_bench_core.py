@@ -0,0 +1,22 @@
+from benchmarks.bench_core import BASELINE, CASES, compare
+import json
+
+
+def test_every_case_runs():
+    """
+    Test that the benchmarks still run against the current code, and that
+    each of them has a stored baseline
+    """
+    baseline = json.loads(BASELINE.read_text())["results"]
+    for name, build in CASES.items():
+        fn, calls = build()
+        fn()
+        assert calls >= 1
+        assert name in baseline
+
+
+def test_compare_flags_slower_cases():
+    baseline = {"fast": 100.0, "slow": 100.0, "gone": 100.0}
+    results = {"fast": 80.0, "slow": 126.0, "new": 1e9}
+    assert compare(results, baseline, 0.25) == ["slow"]
+    assert compare(results, baseline, 0.3) == []
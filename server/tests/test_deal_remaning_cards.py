@@ -1,4 +1,5 @@
 from util.game_state import GameState
+from util.cards import CARDS, mask_to_cards
 import pytest
 
 
@@ -23,9 +24,26 @@ def test_hands_dealt(num_players: int):
 
     # check that the solution values are not in anyone's hand
     for hand in hands:
-        for card in hand:
+        for card in mask_to_cards(hand):
             assert (
                 (card != sol.person.value)
                 and (card != sol.weapon.value)
                 and (card != sol.room.value)
             )
+
+
+@pytest.mark.parametrize("num_players", range(2, 7))
+def test_every_card_dealt_once(num_players: int):
+    dummy_game = GameState(num_players)
+
+    # the hands and the solution together hold every card exactly once
+    dealt = dummy_game.solution.mask
+    for hand in dummy_game.hands:
+        assert not dealt & hand
+        dealt |= hand
+    assert dealt == (1 << len(CARDS)) - 1
+
+    # display names are only produced when asked for
+    assert sorted(sum(dummy_game.player_cards, [])) == sorted(
+        card.value for card in mask_to_cards(dealt & ~dummy_game.solution.mask)
+    )
@@ -0,0 +1,132 @@
+from util import engine
+from util.cards import CARDS, mask_to_cards
+from util.engine import RuleError
+from util.enums import PlayerEnum, WeaponEnum, RoomEnum, HallEnum, HttpEnum, EndGameEnum
+from util.events import replay
+from util.game_state import GameState
+import pytest
+import random
+
+
+def play_turn(game: GameState, rng: random.Random) -> None:
+    """
+    Utility function for a simple bot to play the current player's turn,
+    it accuses once it has seen every card outside the solution
+    """
+    player = game.player_order[game.current_turn.player]
+    if game.current_turn.phase == "move":
+        engine.move(game, player, rng.choice(engine.legal_moves(game, player)))
+    if game.current_turn.phase == "suggest":
+        engine.suggest(
+            game,
+            player,
+            rng.choice(list(PlayerEnum)),
+            rng.choice(list(WeaponEnum)),
+            game.get_location(game.get_character(player)),
+            rng=rng,
+        )
+
+    known = game.hands[game.player_order.index(player)] | game.seen_cards[player]
+    unknown = mask_to_cards(((1 << len(CARDS)) - 1) & ~known)
+    if len(unknown) == 3:
+        person, weapon, room = sorted(unknown, key=CARDS.index)
+        engine.accuse(game, player, person, weapon, room)
+    else:
+        engine.accuse(game, player, None, None, None)
+
+
+@pytest.mark.parametrize("num_players", range(2, 7))
+def test_headless_games_finish(num_players: int):
+    """
+    Play whole games through the engine alone and check they end with the
+    right winner and can be rebuilt from their events
+    """
+    rng = random.Random(num_players)
+    game, events = engine.new_game(num_players)
+    first = len(events)
+
+    for _ in range(1000):
+        if game.victory_state != EndGameEnum.keep_playing:
+            break
+        play_turn(game, rng)
+
+    assert game.victory_state == EndGameEnum.winner_found
+    assert "won the game" in game.logs[-1]
+    assert game.event_count > first
+
+
+def test_actions_return_applied_events():
+    game, events = engine.new_game(3)
+    events += engine.join(game, "player1", "alice")
+    events += engine.move(game, "player1", RoomEnum.lounge, time="12:00")
+    suggested, disproved = engine.suggest(
+        game, "player1", PlayerEnum.prof_plum, WeaponEnum.rope, RoomEnum.lounge
+    )
+    events += [suggested, disproved]
+
+    assert game.get_location(PlayerEnum.prof_plum) == RoomEnum.lounge
+    assert game.current_turn.phase == "accuse"
+    assert replay(events).dump_to_json() == game.dump_to_json()
+
+
+def test_rule_errors():
+    """
+    Check actions which are not allowed raise a RuleError with the status
+    the endpoints answer with, and leave the game untouched
+    """
+    game, _ = engine.new_game(3)
+    version = game.version
+
+    cases = [
+        (HttpEnum.forbidden, lambda: engine.new_game(7)),
+        (HttpEnum.not_found, lambda: engine.move(game, "player9", RoomEnum.lounge)),
+        (HttpEnum.bad_request, lambda: engine.move(game, "player1", RoomEnum.study)),
+        (
+            HttpEnum.bad_request,
+            lambda: engine.accuse(game, "player1", None, None, None),
+        ),
+        (
+            HttpEnum.bad_request,
+            lambda: engine.suggest(
+                game, "player1", PlayerEnum.prof_plum, WeaponEnum.rope, None
+            ),
+        ),
+        (
+            HttpEnum.bad_request,
+            lambda: engine.suggest(
+                game,
+                "player1",
+                PlayerEnum.prof_plum,
+                WeaponEnum.rope,
+                RoomEnum.lounge,
+            ),
+        ),
+    ]
+    for status, action in cases:
+        with pytest.raises(RuleError) as error:
+            action()
+        assert error.value.status == status
+    assert game.version == version
+
+    engine.join(game, "player1", "alice")
+    with pytest.raises(RuleError) as error:
+        engine.join(game, "player1", "bob")
+    assert error.value.status == HttpEnum.forbidden
+
+
+def test_legal_moves_skip_occupied_hallways():
+    # Colonel Mustard is not playing, so lounge_to_dining is free
+    game = GameState(
+        3,
+        player_character_mapping={
+            "player2": PlayerEnum.mrs_white,
+            "player3": PlayerEnum.mr_green,
+        },
+    )
+    engine.move(game, "player1", RoomEnum.lounge)
+    game.move_character(game.get_character("player2"), HallEnum.hall_to_lounge)
+
+    assert set(engine.legal_moves(game, "player1")) == {
+        HallEnum.lounge_to_dining,
+        RoomEnum.conservatory,
+    }
@@ -0,0 +1,159 @@
+from fastapi.testclient import TestClient
+from itertools import combinations
+from util import engine
+from util.bots import BOTS
+from util.cards import CARD_BITS, CARDS, ALL_CARDS_MASK, mask_to_cards
+from util.estimator import KIND_NAMES, probabilities, sample
+from util.game_state import GameState
+from util.notebook import KINDS, Notebook
+from tests.util_functions import get_new_default_game_key
+import pytest
+import random
+import time
+
+from main import app, games
+import main
+
+client = TestClient(app)
+
+
+def play(num_players: int, turns: int, seed: int) -> GameState:
+    """
+    Utility function to play the first turns of a game between detective bots
+    """
+    rng = random.Random(seed)
+    game, _ = engine.new_game(num_players, rng)
+    bot = BOTS["detective"](rng)
+    for _ in range(turns):
+        player = game.player_order[game.current_turn.player]
+        if game.current_turn.phase == "move":
+            engine.move(game, player, bot.move(game, player))
+        if game.current_turn.phase == "suggest":
+            room = game.get_location(game.get_character(player))
+            person, weapon = bot.suggest(game, player)
+            engine.suggest(game, player, person, weapon, room, rng=rng)
+        engine.accuse(game, player, None, None, None)
+    return game
+
+
+def exact_probabilities(notebook: Notebook) -> dict:
+    """
+    Utility function to work out the chance of each card being in the solution
+    by counting every deal consistent with a notebook
+    """
+    players = [p for p in range(notebook.num_players) if p != notebook.player]
+    placed = 0
+    for owner in notebook.held:
+        placed |= owner
+
+    def deals(cards: list, players: list) -> int:
+        if not players:
+            return 1
+        player = players[0]
+        free = notebook.sizes[player] - notebook.held[player].bit_count()
+        total = 0
+        for hand in combinations(cards, free):
+            mask = sum(CARD_BITS[card] for card in hand)
+            if mask & ~notebook.possible[player] == 0:
+                rest = [card for card in cards if card not in hand]
+                total += deals(rest, players[1:])
+        return total
+
+    counts = [0] * len(CARDS)
+    for solution in notebook.solutions():
+        mask = sum(CARD_BITS[card] for card in solution)
+        weight = deals(mask_to_cards(ALL_CARDS_MASK & ~placed & ~mask), players)
+        for card in solution:
+            counts[CARDS.index(card)] += weight
+    return probabilities(notebook, counts, sum(counts) // 3)
+
+
+def test_sampling_matches_exact_counts():
+    """
+    Test that the sampled probabilities are close to those from counting
+    every possible deal
+    """
+    game = play(3, 12, seed=5)
+    notebook = game.notebooks["player1"]
+    assert len(notebook.solutions()) > 4
+
+    counts, kept, trials = sample(notebook, 40000, time.monotonic() + 30, seed=0)
+    assert kept == 40000 and trials >= kept
+    estimate = probabilities(notebook, counts, kept)
+    exact = exact_probabilities(notebook)
+    for kind in KIND_NAMES:
+        for card, chance in exact[kind].items():
+            assert estimate[kind][card] == pytest.approx(chance, abs=0.02)
+
+
+def test_sampling_keeps_to_the_time_budget():
+    notebook = play(6, 0, seed=1).notebooks["player1"]
+
+    start = time.monotonic()
+    counts, kept, trials = sample(notebook, 10**9, start + 0.05, seed=0)
+    assert time.monotonic() - start < 0.5
+    assert 0 < kept < 10**9
+    assert sum(counts) == 3 * kept
+
+
+def test_sampling_after_the_deadline():
+    notebook = play(6, 0, seed=1).notebooks["player1"]
+    assert sample(notebook, 10, time.monotonic() - 1, seed=0)[1:] == (0, 0)
+
+
+def test_probabilities_without_samples():
+    """
+    Test that without any kept deal every solution still allowed counts the same
+    """
+    notebook = play(4, 8, seed=2).notebooks["player1"]
+    estimate = probabilities(notebook, [], 0)
+    for kind in KIND_NAMES:
+        assert sum(estimate[kind].values()) == pytest.approx(1)
+    for card in mask_to_cards(notebook.held[0]):
+        for kind in KIND_NAMES:
+            assert estimate[kind].get(card.value, 0) == 0
+
+
+def test_probabilities_endpoint(monkeypatch):
+    key = get_new_default_game_key(3)
+    game = games[key]
+    params = {"gameKey": key, "player": "player1", "budget": 0.05}
+    monkeypatch.setattr(main, "ESTIMATE_SAMPLES", 400)
+
+    # the workers are started with the app, the whole test runs with them
+    with client:
+        response = client.get("/probabilities", params=params)
+        assert response.status_code == 200
+        estimate = response.json()
+        assert estimate["version"] == game.version
+        assert estimate["samples"] >= 400
+        for kind in KIND_NAMES:
+            assert sum(estimate[kind].values()) == pytest.approx(1)
+        for kind, mask in zip(KIND_NAMES, KINDS):
+            for card in mask_to_cards(game.hands[0] & mask):
+                assert estimate[kind][card.value] == 0
+
+        # the estimate is kept until the game changes
+        assert client.get("/probabilities", params=params).json() == estimate
+        engine.chat(game, "player1", "hello")
+        changed = client.get("/probabilities", params=params).json()
+        assert changed["version"] == game.version != estimate["version"]
+
+        # no estimate without any sample, nor is it kept
+        version = game.version
+        engine.chat(game, "player1", "hello again")
+        response = client.get("/probabilities", params={**params, "budget": 0})
+        assert response.status_code == 503
+        assert game.estimates["player1"][0] == version
+
+        # an estimate cut short by its deadline is returned but not kept
+        monkeypatch.setattr(main, "ESTIMATE_SAMPLES", 10**9)
+        short = client.get("/probabilities", params=params).json()
+        assert short["version"] == game.version
+        assert 0 < short["samples"] < 10**9
+        assert game.estimates["player1"][0] == version
+
+        response = client.get("/probabilities", params={**params, "player": "player7"})
+        assert response.status_code == 404
+        response = client.get("/probabilities", params={**params, "gameKey": "nope"})
+        assert response.status_code == 404
@@ -0,0 +1,129 @@
+from fastapi.testclient import TestClient
+from util.enums import PlayerEnum, WeaponEnum, RoomEnum, HallEnum
+from util.events import (
+    Accused,
+    Chatted,
+    Disproved,
+    GameCreated,
+    Joined,
+    Moved,
+    Suggested,
+    event_from_dict,
+    replay,
+)
+from util.game_state import GameState
+from util.store import SQLiteGameStore
+import json
+
+import main
+
+client = TestClient(main.app)
+
+
+def play(game: GameState) -> list:
+    """
+    Utility function to play the opening of a game through events,
+    returning every event applied
+    """
+    events = [
+        GameCreated.from_game(game),
+        Joined("player1", "alice"),
+        Joined("player2", "bob"),
+        Moved("player1", RoomEnum.lounge, "12:00"),
+        Suggested(
+            "player1",
+            PlayerEnum.col_mustard,
+            WeaponEnum.rope,
+            RoomEnum.lounge,
+            "12:01",
+        ),
+        Disproved("player1", None, None, "12:01"),
+        Chatted("player2", "not me", "12:02"),
+        Accused("player1", None, None, None, "12:03"),
+        Moved("player2", HallEnum.lounge_to_dining, "12:04"),
+    ]
+    for event in events:
+        event.apply(game)
+    return events
+
+
+def test_replay_rebuilds_game():
+    """
+    Check replaying a game's events builds exactly the same state
+    """
+    # Colonel Mustard is moved by player1's suggestion, and must not be
+    # player2's character whose move would clear that again
+    game = GameState(3, player_character_mapping={"player2": PlayerEnum.prof_plum})
+    events = play(game)
+
+    rebuilt = replay(events)
+    assert rebuilt.event_count == len(events)
+    assert rebuilt.version == game.version
+    assert json.loads(rebuilt.dump_to_json()) == json.loads(game.dump_to_json())
+    assert rebuilt.moved_by_suggest[PlayerEnum.col_mustard]
+
+
+def test_replay_from_snapshot():
+    """
+    Check applying the tail of the events to a copy of the game part way
+    through gives the same state as replaying all of them
+    """
+    game = GameState(4)
+    events = play(game)
+
+    snapshot = replay(events[:4])
+    assert replay(events[4:], snapshot).dump_to_json() == game.dump_to_json()
+
+
+def test_events_round_trip_json():
+    events = play(GameState(2))
+    events.append(
+        Disproved("player1", "player2", WeaponEnum.knife, "12:05"),
+    )
+    for event in events:
+        data = json.loads(json.dumps(event.to_dict()))
+        assert event_from_dict(data) == event
+
+
+def test_endpoints_record_events(tmp_path, monkeypatch):
+    """
+    Check a game played through the endpoints is rebuilt from the events
+    recorded in the store
+    """
+    store = SQLiteGameStore(tmp_path / "games.db")
+    monkeypatch.setattr(main, "store", store)
+
+    key = client.post("/new_game/", json={"num_players": 3}).json()
+    requests = [
+        ("/username", {"game_id": key, "player": "player1", "username": "a"}),
+        ("/chat", {"key": key, "player": "player1", "message": "hi"}),
+        ("/move", {"id": key, "player": "player1", "location": "lounge"}),
+        (
+            "/suggestion",
+            {
+                "gameKey": key,
+                "player": "player1",
+                "statementDetails": {
+                    "person": PlayerEnum.col_mustard,
+                    "weapon": WeaponEnum.rope,
+                    "room": RoomEnum.lounge,
+                },
+            },
+        ),
+        (
+            "/accusation",
+            {
+                "gameKey": key,
+                "player": "player1",
+                "statementDetails": {"person": None, "weapon": None, "room": None},
+            },
+        ),
+    ]
+    for url, body in requests:
+        assert client.post(url, json=body).status_code == 200
+
+    game = main.games[key]
+    rebuilt = replay(store.events(key))
+    assert rebuilt.event_count == game.event_count == 7
+    assert json.loads(rebuilt.dump_to_json()) == json.loads(game.dump_to_json())
+    store.close()
@@ -0,0 +1,57 @@
+from util.cards import CARD_BITS, cards_to_mask
+from util.enums import PlayerEnum, WeaponEnum, RoomEnum
+from util.game_state import GameState
+import itertools
+import pytest
+
+
+def scan_for_disprover(gs: GameState, suggestor: str, suggestion: int):
+    """
+    The original resolution, walking the players after the suggestor
+    in order and checking each hand
+    """
+    idx = gs.player_order.index(suggestor)
+    for i in range(idx + 1, idx + len(gs.player_order)):
+        i %= len(gs.player_order)
+        overlap = gs.hands[i] & suggestion & ~gs.seen_cards[suggestor]
+        if overlap:
+            return (gs.player_order[i], overlap)
+    return None
+
+
+@pytest.mark.parametrize("num_players", range(2, 7))
+def test_find_disprover_matches_scan(num_players: int):
+    """
+    Check the card owner index finds the same disprover and cards as
+    scanning every hand, for every suggestion and suggestor
+    """
+    gs = GameState(num_players)
+    for i, player in enumerate(gs.player_order):
+        # give each player some seen cards so they get filtered out
+        gs.seen_cards[player] = gs.hands[(i + 1) % num_players] & 0x5555555
+
+    for person, weapon, room in itertools.product(PlayerEnum, WeaponEnum, RoomEnum):
+        suggestion = cards_to_mask([person, weapon, room])
+        for player in gs.player_order:
+            assert gs.find_disprover(player, suggestion) == scan_for_disprover(
+                gs, player, suggestion
+            )
+
+
+def test_eliminated_player_still_disproves():
+    """
+    Check a player who made a wrong accusation keeps disproving
+    """
+    gs = GameState(3)
+    card = gs.hands[1] & -gs.hands[1]
+    gs.moveable_players.remove("player2")
+
+    assert gs.find_disprover("player1", card) == ("player2", card)
+    gs.seen_cards["player1"] |= card
+    assert gs.find_disprover("player1", card) is None
+
+
+def test_solution_cards_never_disprove():
+    gs = GameState(4)
+    assert gs.find_disprover("player1", gs.solution.mask) is None
+    assert gs.solution.mask & CARD_BITS[gs.solution.person]
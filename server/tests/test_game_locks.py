@@ -0,0 +1,198 @@
+from util import engine
+from util.enums import RoomEnum, HallEnum, WeaponEnum
+from util.events import Accused, Moved, Suggested, replay
+from util.game_map import LOCATION_BITS, MAP
+from util.registry import GameRegistry
+from util.store import SQLiteGameStore
+import asyncio
+import httpx
+import json
+import random
+import threading
+
+import main
+
+
+def check_preconditions(events) -> None:
+    """
+    Replay the events of a game one at a time, checking each was applied in
+    the phase of the game that allows it
+    """
+    game = replay(events[:1])
+    for event in events[1:]:
+        phase = game.current_turn.phase
+        if isinstance(event, Moved):
+            assert phase == "move", event
+        elif isinstance(event, Suggested):
+            character = game.get_character(event.player)
+            assert phase == "suggest" or game.moved_by_suggest[character], event
+        elif isinstance(event, Accused):
+            assert phase == "accuse", event
+        event.apply(game)
+
+        hallways = [location for location in game.map if isinstance(location, HallEnum)]
+        assert all(len(game.map[location]) <= 1 for location in hallways)
+        assert game.occupancy == sum(
+            LOCATION_BITS[location] for location in game.map if game.map[location]
+        )
+
+
+async def hammer(client: httpx.AsyncClient, key: str, rounds: int) -> None:
+    """
+    Every round each player tries to move, suggest, accuse and chat at the
+    same time, as if they all thought it was their turn
+    """
+    rng = random.Random(0)
+    for _ in range(rounds):
+        game = main.games[key]
+        requests = []
+        for player in game.player_order:
+            character = game.get_character(player)
+            location = game.get_location(character)
+            target = rng.choice(sorted(MAP[location], key=str))
+            requests.append(
+                ("/move", {"id": key, "player": player, "location": target.value})
+            )
+            if isinstance(location, RoomEnum):
+                details = {
+                    "person": rng.choice(list(game.player_character_mapping.values())),
+                    "weapon": rng.choice(list(WeaponEnum)),
+                    "room": location,
+                }
+                requests.append(
+                    (
+                        "/suggestion",
+                        {"gameKey": key, "player": player, "statementDetails": details},
+                    )
+                )
+            none = {"person": None, "weapon": None, "room": None}
+            requests.append(
+                (
+                    "/accusation",
+                    {"gameKey": key, "player": player, "statementDetails": none},
+                )
+            )
+            requests.append(("/chat", {"key": key, "player": player, "message": "hi"}))
+        rng.shuffle(requests)
+        await asyncio.gather(
+            *(
+                client.post(
+                    url,
+                    content=json.dumps(body, default=str),
+                    headers={"Content-Type": "application/json"},
+                )
+                for url, body in requests
+            )
+        )
+
+
+def test_concurrent_requests_for_one_game(tmp_path, monkeypatch):
+    """
+    Hammer a single game with concurrent requests while every commit is
+    suspended on a shared store, and check every recorded event was valid
+    when it was applied and the game matches its events
+    """
+    store = SQLiteGameStore(tmp_path / "games.db", shared=True)
+    monkeypatch.setattr(main, "store", store)
+    monkeypatch.setattr(main, "games", GameRegistry(archive=store))
+
+    async def run():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(
+            transport=transport, base_url="http://test"
+        ) as client:
+            key = (await client.post("/new_game", json={"num_players": 4})).json()
+            await hammer(client, key, 25)
+            return key
+
+    key = asyncio.run(run())
+    events = store.events(key)
+    assert len(events) > 25
+    check_preconditions(events)
+    assert replay(events).dump_to_json() == main.games[key].dump_to_json()
+    assert len(main.game_locks) == 0
+    store.close()
+
+
+def test_unrecorded_changes_not_served(tmp_path, monkeypatch):
+    """
+    Check that a change is not served while it is being recorded in a shared
+    store, so when another process records a change to the same version first
+    no client has seen this one under that version
+    """
+    store = SQLiteGameStore(tmp_path / "games.db", shared=True)
+    other = SQLiteGameStore(tmp_path / "games.db", shared=True)
+    monkeypatch.setattr(main, "store", store)
+    monkeypatch.setattr(main, "games", GameRegistry(archive=store))
+    recording = threading.Event()
+    release = threading.Event()
+    record = store.record
+
+    def slow_record(*args) -> None:
+        recording.set()
+        release.wait(5)
+        record(*args)
+
+    async def run():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(
+            transport=transport, base_url="http://test"
+        ) as client:
+            key = (await client.post("/new_game", json={"num_players": 2})).json()
+            monkeypatch.setattr(store, "record", slow_record)
+            chat = asyncio.ensure_future(
+                client.post(
+                    "/chat", json={"key": key, "player": "player1", "message": "here"}
+                )
+            )
+            while not recording.is_set():
+                await asyncio.sleep(0.01)
+            elsewhere = other.load(key)
+            other.record(key, engine.chat(elsewhere, "player2", "there"), elsewhere)
+            during = await client.post("/State", params={"gameKey": key})
+            release.set()
+            assert (await chat).status_code == 409
+            after = await client.post("/State", params={"gameKey": key})
+            return during, after
+
+    during, after = asyncio.run(run())
+    assert during.headers["ETag"] == after.headers["ETag"]
+    assert during.json() == after.json()
+    assert len(after.json()["chat"]) == 1
+    assert "there" in after.json()["chat"][0]
+    store.close()
+    other.close()
+
+
+def test_other_games_not_blocked():
+    """
+    Check a request for one game goes through while another game's lock is held
+    """
+
+    async def run():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(
+            transport=transport, base_url="http://test"
+        ) as client:
+            busy = (await client.post("/new_game", json={"num_players": 2})).json()
+            free = (await client.post("/new_game", json={"num_players": 2})).json()
+            async with main.game_locks(busy):
+                response = await asyncio.wait_for(
+                    client.post(
+                        "/chat",
+                        json={"key": free, "player": "player1", "message": "hi"},
+                    ),
+                    timeout=5,
+                )
+                assert response.status_code == 200
+                waiting = asyncio.ensure_future(
+                    client.post(
+                        "/chat",
+                        json={"key": busy, "player": "player1", "message": "hi"},
+                    )
+                )
+                await asyncio.sleep(0.05)
+                assert not waiting.done()
+            assert (await waiting).status_code == 200
+
+    asyncio.run(run())
@@ -0,0 +1,188 @@
+from util.enums import EndGameEnum
+from util.game_state import GameState
+from util.registry import DirectoryArchive, GameRegistry
+import asyncio
+import threading
+import time
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_idle_games_evicted_after_ttl():
+    """
+    Check games not used within the ttl are dropped while games that
+    keep being used stay resident
+    """
+    clock = FakeClock()
+    registry = GameRegistry(ttl=100, clock=clock)
+    registry["idle"] = GameState(2)
+    registry["active"] = GameState(2)
+
+    for _ in range(3):
+        clock.now += 50
+        registry["active"]
+
+    assert "idle" not in registry
+    assert "active" in registry
+
+
+def test_finished_games_evicted_sooner():
+    clock = FakeClock()
+    registry = GameRegistry(ttl=1000, finished_ttl=10, clock=clock)
+    registry["finished"] = GameState(2)
+    registry["finished"].end_game(EndGameEnum.winner_found)
+    registry["playing"] = GameState(2)
+
+    clock.now += 20
+    registry.evict_expired(force=True)
+    assert "finished" not in registry
+    assert "playing" in registry
+
+
+def test_least_recently_used_evicted():
+    """
+    Check that holding more than max_games evicts the game used least recently
+    """
+    registry = GameRegistry(max_games=2)
+    registry["a"] = GameState(2)
+    registry["b"] = GameState(2)
+    registry["a"]
+    registry["c"] = GameState(2)
+
+    assert list(registry) == ["a", "c"]
+
+
+def test_evicted_games_archived_and_reloaded(tmp_path):
+    """
+    Check evicted games are written to the archive and come back
+    unchanged the next time their key is used
+    """
+    registry = GameRegistry(max_games=1, archive=DirectoryArchive(tmp_path))
+    game = GameState(3)
+    game.add_chat("hello")
+    registry["a"] = game
+    registry["b"] = GameState(2)
+
+    assert registry.resident() == 1
+    assert len(registry) == 2
+    assert (tmp_path / "a.game").exists()
+
+    # a fresh registry over the same directory finds the archived game
+    registry = GameRegistry(max_games=1, archive=DirectoryArchive(tmp_path))
+    reloaded = registry["a"]
+    assert reloaded.chat == ["hello"]
+    assert reloaded.hands == game.hands
+    assert reloaded.version == game.version
+    assert not (tmp_path / "a.game").exists()
+
+
+def test_unknown_keys_never_touch_disk(tmp_path):
+    registry = GameRegistry(archive=DirectoryArchive(tmp_path))
+    assert "../escape" not in registry
+    registry.archive.save("../escape", GameState(2))
+    assert not list(tmp_path.parent.glob("escape.game"))
+
+
+class UnlistedArchive(DirectoryArchive):
+    def keys(self) -> set[str]:
+        raise AssertionError("every archived key was listed")
+
+
+def test_truth_never_lists_the_archive(tmp_path):
+    """
+    Check that testing whether there are any games does not go through
+    every archived game
+    """
+    registry = GameRegistry(archive=UnlistedArchive(tmp_path))
+    assert not registry
+    registry["a"] = GameState(2)
+    assert registry
+    registry.evict("a")
+    assert registry.resident() == 0
+    assert registry
+
+
+def test_fetch_reads_archive_in_a_thread(tmp_path):
+    """
+    Check fetch loads archived games off the event loop, that a call cancelled
+    while loading does not lose the game and that concurrent calls share a read
+    """
+    loads = []
+
+    class SlowArchive(DirectoryArchive):
+        def load(self, key: str) -> GameState | None:
+            loads.append((key, threading.current_thread()))
+            time.sleep(0.05)
+            return super().load(key)
+
+    registry = GameRegistry(max_games=1, archive=SlowArchive(tmp_path))
+    registry["a"] = GameState(2)
+    registry["b"] = GameState(2)
+
+    async def run():
+        cancelled = asyncio.ensure_future(registry.fetch("a"))
+        await asyncio.sleep(0.01)
+        cancelled.cancel()
+        # the game has left the archive once the read is done
+        await asyncio.sleep(0.1)
+        assert not (tmp_path / "a.game").exists()
+        assert await registry.fetch("a") is not None
+
+        # loading b archives a again
+        await registry.fetch("b")
+        return await asyncio.gather(
+            registry.fetch("a"), registry.fetch("a"), registry.fetch("unknown")
+        )
+
+    first, second, unknown = asyncio.run(run())
+    assert first is second
+    assert unknown is None
+    # a is read back once it has been written again
+    assert sorted(key for key, _ in loads) == ["a", "a", "b", "unknown"]
+    assert all(thread is not threading.main_thread() for _, thread in loads)
+    assert list(registry) == ["a", "b"]
+    assert registry.resident() == 1
+
+
+def test_evicted_games_written_in_a_thread(tmp_path):
+    """
+    Check games evicted by the awaitable methods are written to the archive
+    off the event loop and are still served while they are written
+    """
+    saves = []
+
+    class SlowArchive(DirectoryArchive):
+        def save(self, key: str, game: GameState) -> None:
+            saves.append((key, threading.current_thread()))
+            time.sleep(0.1)
+            super().save(key, game)
+
+    registry = GameRegistry(max_games=1, archive=SlowArchive(tmp_path))
+
+    async def run():
+        game = GameState(2)
+        await registry.put("a", game)
+        ticks = asyncio.ensure_future(asyncio.sleep(0.01))
+        registry.replace("b", GameState(2))
+        # the loop carries on while a is written
+        await ticks
+        assert saves and not (tmp_path / "a.game").exists()
+        assert "a" in registry
+        assert await registry.fetch_keys() == ["b", "a"]
+        assert (await registry.fetch("a")).version == game.version
+        assert not (tmp_path / "a.game").exists()
+
+        assert await registry.remove("a")
+        await registry.drain()
+        assert not await registry.remove("a")
+
+    asyncio.run(run())
+    assert [key for key, _ in saves] == ["a", "b"]
+    assert all(thread is not threading.main_thread() for _, thread in saves)
+    assert list(registry) == ["b"]
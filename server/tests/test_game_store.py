@@ -0,0 +1,224 @@
+from util.enums import PlayerEnum, WeaponEnum, RoomEnum, HallEnum
+from util.events import Chatted, GameCreated, Joined, Moved, Suggested
+from util.game_state import GameState
+from util.registry import GameRegistry
+from util.store import (
+    MemoryGameStore,
+    SQLiteGameStore,
+    SocketGameStore,
+    VersionConflict,
+    serve_table,
+)
+from multiprocessing import AuthenticationError
+import asyncio
+import os
+import pytest
+import threading
+import time
+
+
+def new_game(store: SQLiteGameStore, key: str, num_players: int = 3) -> GameState:
+    game = GameState(num_players)
+    created = GameCreated.from_game(game)
+    created.apply(game)
+    store.record(key, [created], game)
+    return game
+
+
+def commit(store: SQLiteGameStore, key: str, game: GameState, *events) -> None:
+    for event in events:
+        event.apply(game)
+    store.record(key, events, game)
+
+
+def test_recorded_games_survive_reopen(tmp_path):
+    """
+    Check events recorded through the write-behind queue are in the
+    database once the store is closed and reopened
+    """
+    path = tmp_path / "games.db"
+    store = SQLiteGameStore(path)
+    game = new_game(store, "a")
+    commit(store, "a", game, Joined("player1", "alice"))
+    commit(store, "a", game, Moved("player1", HallEnum.hall_to_lounge, "12:00"))
+    store.close()
+
+    store = SQLiteGameStore(path)
+    assert "a" in store
+    reloaded = store.load("a")
+    assert reloaded.dump_to_json() == game.dump_to_json()
+    assert reloaded.event_count == 3
+    assert [type(event).__name__ for event in store.events("a")] == [
+        "GameCreated",
+        "Joined",
+        "Moved",
+    ]
+    store.close()
+
+
+def test_snapshot_and_tail(tmp_path):
+    """
+    Check a game with more events than the snapshot interval is rebuilt
+    from its latest snapshot and the events after it
+    """
+    store = SQLiteGameStore(tmp_path / "games.db", snapshot_every=4)
+    game = new_game(store, "a")
+    for i in range(9):
+        commit(store, "a", game, Chatted("player1", f"message {i}", "12:00"))
+    commit(
+        store,
+        "a",
+        game,
+        Suggested(
+            "player2",
+            PlayerEnum.mrs_white,
+            WeaponEnum.rope,
+            RoomEnum.kitchen,
+            "12:01",
+        ),
+    )
+    store.flush()
+
+    snapshot = store._connection.execute(
+        "SELECT event_count FROM snapshots WHERE key = 'a'"
+    ).fetchone()
+    assert snapshot == (8,)
+    assert store.load("a").dump_to_json() == game.dump_to_json()
+    store.close()
+
+
+def test_pending_writes_are_readable(tmp_path):
+    """
+    Check a game is readable straight after record, before the
+    background writer would have committed it
+    """
+    store = SQLiteGameStore(tmp_path / "games.db", flush_interval=60)
+    game = new_game(store, "a", 2)
+    commit(store, "a", game, Chatted("player1", "hello", "12:00"))
+    assert store.load("a").chat == game.chat
+
+    store.delete("a")
+    assert "a" not in store
+    assert store.load("a") is None
+    store.close()
+
+
+def test_registry_rehydrates_lazily(tmp_path):
+    """
+    Check a registry backed by the store only loads games when they
+    are asked for
+    """
+    path = tmp_path / "games.db"
+    store = SQLiteGameStore(path)
+    for key in ["a", "b"]:
+        new_game(store, key, 2)
+    store.close()
+
+    registry = GameRegistry(archive=SQLiteGameStore(path))
+    assert registry.resident() == 0
+    assert "a" in registry and len(registry) == 2
+
+    registry["a"].add_chat("hello")
+    assert registry.resident() == 1
+    assert "a" in registry.archive
+    registry.archive.close()
+
+
+def serve(address: str) -> None:
+    """
+    Utility function to serve a table with the key "secret" from a thread
+    """
+    threading.Thread(target=serve_table, args=(address, "secret"), daemon=True).start()
+    for _ in range(100):
+        if os.path.exists(address):
+            break
+        time.sleep(0.01)
+
+
+@pytest.fixture(params=["sqlite", "socket"])
+def shared_stores(request, tmp_path):
+    """
+    Two clients of the same shared store, standing in for two worker processes
+    """
+    if request.param == "sqlite":
+        stores = [SQLiteGameStore(tmp_path / "games.db", shared=True) for _ in "ab"]
+    else:
+        address = str(tmp_path / "games.sock")
+        serve(address)
+        stores = [SocketGameStore(address, "secret") for _ in "ab"]
+    yield stores
+    for store in stores:
+        store.close()
+
+
+def test_memory_store_compare_and_set():
+    store = MemoryGameStore()
+    game = new_game(store, "a", 2)
+    stale = store.load("a")
+
+    commit(store, "a", game, Chatted("player1", "first", "12:00"))
+    with pytest.raises(VersionConflict):
+        commit(store, "a", stale, Chatted("player2", "second", "12:00"))
+    assert store.version("a") == 2
+    assert store.load("a").chat == game.chat
+
+
+def test_workers_share_games(shared_stores):
+    """
+    Check a game changed through one worker's registry is reloaded by
+    another worker's registry the next time it is used
+    """
+    store_a, store_b = shared_stores
+    worker_a = GameRegistry(archive=store_a)
+    worker_b = GameRegistry(archive=store_b)
+    assert not worker_b
+
+    worker_a["a"] = GameState(3)
+    created = GameCreated.from_game(worker_a["a"])
+    commit(store_a, "a", worker_a["a"], created)
+    assert worker_b and "a" in worker_b
+    assert worker_b["a"].event_count == 1
+
+    commit(store_a, "a", worker_a["a"], Chatted("player1", "hello", "12:00"))
+    assert worker_b["a"].chat == worker_a["a"].chat
+    assert worker_b["a"].version == worker_a["a"].version
+
+    commit(store_a, "a", worker_a["a"], Chatted("player1", "again", "12:00"))
+    fetched = asyncio.run(worker_b.fetch("a"))
+    assert fetched.chat == worker_a["a"].chat
+    assert asyncio.run(worker_b.fetch("b")) is None
+
+
+def test_concurrent_change_conflicts(shared_stores):
+    """
+    Check the second of two workers changing the same version of a game
+    gets a VersionConflict and nothing it applied is stored
+    """
+    store_a, store_b = shared_stores
+    game_a = new_game(store_a, "a")
+    game_b = store_b.load("a")
+
+    commit(store_a, "a", game_a, Chatted("player1", "first", "12:00"))
+    with pytest.raises(VersionConflict):
+        commit(store_b, "a", game_b, Chatted("player2", "second", "12:00"))
+
+    assert store_b.version("a") == 2
+    assert store_b.load("a").chat == game_a.chat
+
+
+def test_table_needs_the_key(tmp_path):
+    """
+    Check only clients holding the key can use a served table, and that the
+    table keeps serving after turning one away
+    """
+    address = str(tmp_path / "games.sock")
+    with pytest.raises(ValueError):
+        serve_table(address, "")
+    serve(address)
+
+    with pytest.raises(AuthenticationError):
+        SocketGameStore(address, "guess")
+    store = SocketGameStore(address, "secret")
+    new_game(store, "a", 2)
+    assert store.version("a") == 1
+    store.close()
@@ -1,4 +1,6 @@
+import json
 import pytest
+from fastapi.encoders import jsonable_encoder
 from util.game_state import GameState
 
 
@@ -16,3 +18,33 @@ def test_num_players(num_players: int):
     # check that the solution and map exist as fields in the dictionary
     assert "map" in dummyDict.keys()
     assert "solution" in dummyDict.keys()
+
+
+def test_dump_to_json_matches_dump_to_dict():
+    """
+    Check the cached JSON snapshot encodes the same content FastAPI
+    would produce from dump_to_dict
+    """
+    dummy_game = GameState(6)
+    dummy_game.add_log("a log")
+    dummy_game.add_chat("a chat")
+
+    dummyDict = dummy_game.dump_to_dict()
+    dummyDict["logs"] = list(dummyDict["logs"])
+    dummyDict["chat"] = list(dummyDict["chat"])
+    expected = json.loads(json.dumps(jsonable_encoder(dummyDict)))
+    assert json.loads(dummy_game.dump_to_json()) == expected
+
+
+def test_dump_to_json_cached_per_version():
+    """
+    Check the snapshot is reused while the game is unchanged and
+    rebuilt after a mutation
+    """
+    dummy_game = GameState(3)
+    snapshot = dummy_game.dump_to_json()
+    assert dummy_game.dump_to_json() is snapshot
+
+    dummy_game.add_chat("hello")
+    assert dummy_game.dump_to_json() is not snapshot
+    assert json.loads(dummy_game.dump_to_json())["chat"] == ["hello"]
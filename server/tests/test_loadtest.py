@@ -0,0 +1,74 @@
+from loadtest import legal_moves, load, percentile
+from util import engine
+from util.enums import PlayerEnum, WeaponEnum, RoomEnum
+import asyncio
+import httpx
+import json
+import random
+
+from main import app
+
+
+def test_percentile():
+    ordered = [float(i) for i in range(1, 101)]
+    assert percentile(ordered, 50) == 50
+    assert percentile(ordered, 99) == 99
+    assert percentile(ordered, 100) == 100
+    assert percentile([3.0], 95) == 3
+    assert percentile([], 50) == 0
+
+
+def test_legal_moves_from_state():
+    """
+    Test that the moves worked out from the state sent to clients are
+    those the engine allows
+    """
+    rng = random.Random(4)
+    game, _ = engine.new_game(5, rng)
+    for _ in range(60):
+        player = game.player_order[game.current_turn.player]
+        state = json.loads(game.dump_to_json())
+        moves = engine.legal_moves(game, player)
+        assert legal_moves(state, player) == moves
+        target = rng.choice(moves)
+        engine.move(game, player, target)
+        if isinstance(target, RoomEnum):
+            engine.suggest(
+                game, player, PlayerEnum.mr_green, WeaponEnum.rope, target, rng=rng
+            )
+        engine.accuse(game, player, None, None, None)
+
+
+def test_load_plays_games_through_the_api():
+    """
+    Test that every game of a load test ends without a failed request, and
+    that every endpoint is reported
+    """
+
+    async def run():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(
+            transport=transport, base_url="http://test"
+        ) as client:
+            return await load(
+                client, 6, num_players=3, turns=8, poll_interval=0.01, think=0.002
+            )
+
+    report = asyncio.run(run())
+    stats = report.to_dict()
+    assert report.games == report.finished == 6
+    assert report.turns == 6 * 8
+    assert stats["errors"] == {}
+    assert set(stats["endpoints"]) >= {
+        "/new_game",
+        "/username",
+        "/State",
+        "/State (poll)",
+        "/move",
+        "/accusation",
+    }
+    assert stats["endpoints"]["/accusation"]["count"] == 6 * 8
+    for endpoint in stats["endpoints"].values():
+        assert endpoint["p50_ms"] <= endpoint["p95_ms"] <= endpoint["p99_ms"]
+        assert endpoint["p99_ms"] <= endpoint["max_ms"]
+    json.dumps(stats)
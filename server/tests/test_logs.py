@@ -0,0 +1,151 @@
+from fastapi.testclient import TestClient
+from logging.handlers import QueueListener
+from util import engine
+from util.logs import (
+    BackgroundHandler,
+    JsonFormatter,
+    SamplingFilter,
+    parse_settings,
+)
+from tests.util_functions import get_new_default_game_key
+import io
+import json
+import logging
+import queue
+
+from main import app, games
+
+client = TestClient(app)
+
+
+def make_logger(name: str, handler: logging.Handler) -> logging.Logger:
+    """
+    Utility function to get a logger writing only to the given handler
+    """
+    logger = logging.getLogger(name)
+    logger.handlers = [handler]
+    logger.propagate = False
+    logger.setLevel(logging.DEBUG)
+    return logger
+
+
+def test_parse_settings():
+    assert parse_settings("") == {}
+    assert parse_settings("main=DEBUG, util.store=warning,") == {
+        "main": "DEBUG",
+        "util.store": "warning",
+    }
+
+
+def test_records_are_written_as_json_by_a_background_thread():
+    stream = io.StringIO()
+    output = logging.StreamHandler(stream)
+    output.setFormatter(JsonFormatter())
+    handler = BackgroundHandler(queue.SimpleQueue())
+    listener = QueueListener(handler.queue, output)
+    logger = make_logger("test_logs.json", handler)
+
+    listener.start()
+    logger.info("%s moved to %s", "player1", "study", extra={"game": "abc"})
+    try:
+        raise ValueError("boom")
+    except ValueError:
+        logger.exception("failed")
+    listener.stop()
+
+    moved, failed = [json.loads(line) for line in stream.getvalue().splitlines()]
+    assert moved["message"] == "player1 moved to study"
+    assert moved["level"] == "INFO"
+    assert moved["logger"] == "test_logs.json"
+    assert moved["game"] == "abc"
+    assert "ValueError: boom" in failed["exception"]
+
+
+def test_full_queue_drops_records():
+    handler = BackgroundHandler(queue.SimpleQueue(), size=2)
+    logger = make_logger("test_logs.full", handler)
+    for i in range(5):
+        logger.info("record %d", i)
+    assert handler.queue.qsize() == 2
+    assert handler.dropped == 3
+
+
+def test_sampling_keeps_one_in_n():
+    records = queue.SimpleQueue()
+    handler = BackgroundHandler(records)
+    handler.addFilter(SamplingFilter({"state": 10, "test_logs.noisy": 4}))
+    logger = make_logger("test_logs.sampling", handler)
+    noisy = make_logger("test_logs.noisy", handler)
+
+    for _ in range(100):
+        logger.info("polled", extra={"event": "state"})
+        logger.info("moved", extra={"event": "move"})
+        noisy.info("access")
+    logger.info("once", extra={"sample": 1000})
+
+    kept = [records.get_nowait() for _ in range(records.qsize())]
+    counts = {}
+    for record in kept:
+        counts[record.getMessage()] = counts.get(record.getMessage(), 0) + 1
+    assert counts == {"polled": 10, "moved": 100, "access": 25, "once": 1}
+    assert all(
+        record.sampled == 10 for record in kept if record.getMessage() == "polled"
+    )
+
+
+def test_endpoints_log_structured_events(caplog):
+    """
+    Test that the handlers log one record per action with its event and
+    player, and that every message formats
+    """
+    key = get_new_default_game_key(3)
+    # from the staging room every move is into a room
+    target = engine.legal_moves(games[key], "player1")[0]
+    with caplog.at_level(logging.DEBUG, logger="main"):
+        client.post(
+            "/username",
+            json={"game_id": key, "player": "player1", "username": "alice"},
+        )
+        client.post("/move", json={"player": "player1", "location": target, "id": key})
+        client.post(
+            "/suggestion",
+            json={
+                "gameKey": key,
+                "player": "player1",
+                "statementDetails": {
+                    "person": "Mr. Green",
+                    "weapon": "rope",
+                    "room": target.value,
+                },
+            },
+        )
+        client.post("/chat", json={"key": key, "player": "player1", "message": "hi"})
+        client.post(
+            "/accusation",
+            json={
+                "gameKey": key,
+                "player": "player1",
+                "statementDetails": {"person": None, "weapon": None, "room": None},
+            },
+        )
+
+    records = [record for record in caplog.records if record.name == "main"]
+    assert [record.event for record in records] == [
+        "join",
+        "move",
+        "suggestion",
+        "chat",
+        "accusation",
+    ]
+    for record in records:
+        assert record.game == key
+        assert record.player == "player1"
+        record.getMessage()
+    assert records[1].getMessage() == (
+        f"player1 moved to {target.value}, going to the suggest phase"
+    )
+    assert (
+        records[2]
+        .getMessage()
+        .startswith(f"player1 suggests Mr. Green with the rope in the {target.value}")
+    )
@@ -0,0 +1,122 @@
+from fastapi.testclient import TestClient
+from util.metrics import Histogram, family
+from tests.util_functions import get_new_default_game_key
+import re
+
+from main import app, games
+
+client = TestClient(app)
+
+SAMPLE = re.compile(r"^([a-z_]+)(?:\{(.*)\})? (\S+)$")
+LABEL = re.compile(r'([a-z_]+)="((?:[^"\\]|\\.)*)"')
+
+
+def scrape() -> dict:
+    """
+    Utility function to read /metrics like a Prometheus server would
+
+    Returns:
+        The value of each sample keyed by its name and sorted labels
+    """
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+
+    samples = {}
+    for line in response.text.splitlines():
+        if line.startswith("#"):
+            assert re.match(r"^# (HELP|TYPE) [a-z_]+ .+$", line)
+            continue
+        name, labels, value = SAMPLE.match(line).groups()
+        key = (name, tuple(sorted(LABEL.findall(labels or ""))))
+        samples[key] = float(value)
+    return samples
+
+
+def test_requests_are_counted_per_route():
+    key = get_new_default_game_key(3)
+    before = scrape()
+    for _ in range(3):
+        assert client.post("/State", params={"gameKey": key}).status_code == 200
+    client.get("/no/such/route")
+    after = scrape()
+
+    route = (("method", "POST"), ("route", "/State"))
+    count = ("clueless_http_requests_total", route + (("status", "200"),))
+    assert after[count] - before.get(count, 0) == 3
+    latency_count = ("clueless_http_request_duration_seconds_count", route)
+    assert after[latency_count] - before.get(latency_count, 0) == 3
+    size = ("clueless_http_response_bytes_total", route)
+    assert after[size] - before.get(size, 0) == 3 * len(games[key].dump_to_json())
+
+    unmatched = (
+        "clueless_http_requests_total",
+        (("method", "GET"), ("route", "unmatched"), ("status", "404")),
+    )
+    assert after[unmatched] >= 1
+
+    # the buckets are cumulative and end with every request
+    buckets = sorted(
+        (float(dict(labels)["le"]), value)
+        for (name, labels), value in after.items()
+        if name == "clueless_http_request_duration_seconds_bucket"
+        and set(route) <= set(labels)
+    )
+    counts = [value for _, value in buckets]
+    assert counts == sorted(counts)
+    assert buckets[-1] == (float("inf"), after[latency_count])
+
+
+def test_state_responses_by_kind():
+    key = get_new_default_game_key(3)
+    version = games[key].version
+    client.post("/chat", json={"key": key, "player": "player1", "message": "hi"})
+    before = scrape()
+    full = client.post("/State", params={"gameKey": key})
+    delta = client.post("/State", params={"gameKey": key, "since_version": version})
+    etag = {"If-None-Match": full.headers["ETag"]}
+    assert (
+        client.post("/State", params={"gameKey": key}, headers=etag).status_code == 304
+    )
+    after = scrape()
+
+    assert "since_version" in delta.json()
+    for kind, size in [
+        ("full", len(full.content)),
+        ("delta", len(delta.content)),
+        ("not_modified", 0),
+    ]:
+        count = ("clueless_state_responses_total", (("kind", kind),))
+        assert after[count] - before.get(count, 0) == 1
+        sent = ("clueless_state_response_bytes_total", (("kind", kind),))
+        assert after[sent] - before.get(sent, 0) == size
+    assert len(delta.content) < len(full.content)
+
+
+def test_game_gauges():
+    key = get_new_default_game_key(4)
+    client.post("/chat", json={"key": key, "player": "player1", "message": "hi"})
+    client.post("/State", params={"gameKey": key})
+    samples = scrape()
+
+    resident = games.resident_games()
+    playing = ("clueless_games", (("victory_state", "keep_playing"),))
+    assert samples[playing] == sum(game.victory_state == 0 for game in resident)
+    assert samples[("clueless_game_chat_entries", ())] == sum(
+        len(game.chat) for game in resident
+    )
+    assert samples[("clueless_state_snapshot_bytes", ())] >= len(
+        games[key].dump_to_json()
+    )
+    assert samples[("clueless_process_resident_memory_bytes", ())] > 1 << 20
+
+
+def test_histogram_buckets_and_labels():
+    histogram = Histogram((0.1, 1.0))
+    for value in (0.1, 0.5, 2.0):
+        histogram.observe(value)
+    text = family("latency", "histogram", "Test.", histogram.samples({"a": 'x"\\'}))
+    assert 'latency_bucket{a="x\\"\\\\",le="0.1"} 1' in text
+    assert 'latency_bucket{a="x\\"\\\\",le="1.0"} 2' in text
+    assert 'latency_bucket{a="x\\"\\\\",le="+Inf"} 3' in text
+    assert 'latency_count{a="x\\"\\\\"} 3' in text
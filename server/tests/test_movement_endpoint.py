@@ -3,6 +3,7 @@ from util.functions import get_character_location
 from util.game_state import GameState
 from util.enums import PlayerEnum, HallEnum, RoomEnum, HttpEnum
 from util.movement import validate_move, does_possible_move_exist
+from util.game_map import ADJACENCY_MASKS, LOCATION_BITS, LOCATIONS, MAP
 from tests.data.move_actions import MOVES
 from tests.util_functions import get_new_default_game_key
 import pytest
@@ -67,7 +68,7 @@ def test_bad_player_move():
 
 def test_movement():
     """
-    Test to check that the move_player function removes
+    Test to check that a move removes
     the player from the old location and adds them to
     the new location and validates the movement logic
     """
@@ -151,10 +152,38 @@ def test_possible_move_exist():
     # Assert a valid move exists
     assert does_possible_move_exist(HallEnum.conservatory_to_ballroom, default_gs)
 
-    default_gs.map[RoomEnum.conservatory] = PlayerEnum.mrs_white
+    default_gs.move_character(PlayerEnum.mrs_peacock, RoomEnum.conservatory)
     # Assert a valid move exists
     assert does_possible_move_exist(RoomEnum.conservatory, default_gs)
 
-    default_gs.map[HallEnum.billiard_to_ballroom] = PlayerEnum.prof_plum
+    default_gs.move_character(PlayerEnum.prof_plum, HallEnum.billiard_to_ballroom)
     # Assert no possible move exists
     assert not does_possible_move_exist(RoomEnum.ballroom, default_gs)
+
+
+def test_character_location_index_follows_moves():
+    """
+    Check that the character location index and the map agree after
+    characters are moved around
+    """
+    gs = GameState(3)
+    gs.move_character(PlayerEnum.miss_scarlet, RoomEnum.lounge)
+    gs.move_character(PlayerEnum.prof_plum, RoomEnum.lounge)
+    gs.move_character(PlayerEnum.miss_scarlet, HallEnum.lounge_to_dining)
+
+    for location, characters in gs.map.items():
+        for character in characters:
+            assert get_character_location(character, gs) == location
+    assert len(gs.character_locations) == len(PlayerEnum)
+    assert gs.map[RoomEnum.lounge] == [PlayerEnum.prof_plum]
+
+
+def test_adjacency_masks_match_map():
+    """
+    Check the compiled adjacency bitmasks describe the same board as MAP
+    """
+    for location, neighbours in MAP.items():
+        for other in LOCATIONS:
+            assert bool(ADJACENCY_MASKS[location] & LOCATION_BITS[other]) == (
+                other in neighbours
+            )
@@ -0,0 +1,167 @@
+from fastapi.testclient import TestClient
+from util import engine
+from util.bots import BOTS
+from util.cards import CARD_BITS, PERSON_MASK, cards_to_mask, mask_to_cards
+from util.enums import PlayerEnum, WeaponEnum, RoomEnum, EndGameEnum
+from util.events import replay
+from util.game_state import GameSolution, GameState
+from util.notebook import SOLUTION, Notebook
+from tests.util_functions import get_new_default_game_key
+import pytest
+import random
+
+from main import app, games
+
+client = TestClient(app)
+
+SOLUTION_CARDS = [PlayerEnum.mrs_white, WeaponEnum.rope, RoomEnum.study]
+
+
+def check_notebooks(game: GameState) -> None:
+    """
+    Utility function to check that no notebook of a game has deduced
+    anything which is not true
+    """
+    truth = (game.solution.person, game.solution.weapon, game.solution.room)
+    owners = dict(enumerate(game.hands))
+    owners[SOLUTION] = game.solution.mask
+    for notebook in game.notebooks.values():
+        assert truth in notebook.solutions()
+        for owner, cards in owners.items():
+            assert notebook.held[owner] & ~cards == 0
+            assert cards & ~notebook.possible[owner] == 0
+
+
+@pytest.mark.parametrize("num_players", range(2, 7))
+def test_notebooks_only_deduce_the_truth(num_players: int):
+    """
+    Test that while bots play whole games, including wrong accusations, every
+    notebook only ever holds true facts
+    """
+    for seed in range(15):
+        rng = random.Random(seed)
+        game, _ = engine.new_game(num_players, rng)
+        names = list(BOTS)
+        bots = {
+            player: BOTS[names[i % len(names)]](rng)
+            for i, player in enumerate(game.player_order)
+        }
+        while game.victory_state == EndGameEnum.keep_playing:
+            player = game.player_order[game.current_turn.player]
+            bot = bots[player]
+            if game.current_turn.phase == "move":
+                engine.move(game, player, bot.move(game, player))
+            if game.current_turn.phase == "suggest":
+                room = game.get_location(game.get_character(player))
+                person, weapon = bot.suggest(game, player)
+                events = engine.suggest(game, player, person, weapon, room, rng=rng)
+                bot.observe(game, player, events)
+            engine.accuse(game, player, *(bot.accuse(game, player) or [None] * 3))
+            check_notebooks(game)
+
+
+def test_undisproved_suggestion_solves():
+    """
+    Test that a suggestion nobody can disprove puts every card the player
+    does not hold in the solution
+    """
+    game = GameState(3, GameSolution(*SOLUTION_CARDS))
+    notebook = game.notebooks["player1"]
+    assert len(notebook.solutions()) > 1
+
+    notebook.suggested(cards_to_mask(SOLUTION_CARDS))
+    notebook.disproved(None, None)
+    assert notebook.solutions() == [tuple(SOLUTION_CARDS)]
+    assert notebook.holders(RoomEnum.study) == [SOLUTION]
+
+
+def test_players_passed_over_hold_none_of_the_cards():
+    """
+    Test that the players asked before the disprover are known not to hold
+    any of the suggested cards, and the disprover to hold the shown card
+    """
+    game = GameState(4, GameSolution(*SOLUTION_CARDS))
+    notebook = game.notebooks["player1"]
+    # a suggestion of a person held by the last player and two solution cards
+    card = mask_to_cards(game.hands[3] & PERSON_MASK)[0]
+    suggestion = cards_to_mask([card, WeaponEnum.rope, RoomEnum.study])
+
+    notebook.suggested(suggestion)
+    notebook.disproved(3, card)
+    for owner in (1, 2):
+        assert notebook.possible[owner] & suggestion == 0
+    assert notebook.held[3] & CARD_BITS[card]
+    assert notebook.shown == CARD_BITS[card]
+
+
+def test_full_hands_and_wrong_accusations():
+    """
+    Test that knowing every card of a hand rules the hand's owner out of holding
+    anything else, and that a wrong accusation rules out its last unknown card
+    """
+    hands = [
+        cards_to_mask([PlayerEnum.miss_scarlet, WeaponEnum.knife]),
+        cards_to_mask([PlayerEnum.prof_plum, WeaponEnum.wrench]),
+    ]
+    notebook = Notebook(0, hands)
+    notebook.suggested(cards_to_mask([PlayerEnum.prof_plum, WeaponEnum.rope]))
+    notebook.disproved(1, PlayerEnum.prof_plum)
+    assert notebook.possible[1] != notebook.held[1]
+
+    notebook.suggested(cards_to_mask([PlayerEnum.mr_green, WeaponEnum.wrench]))
+    notebook.disproved(1, WeaponEnum.wrench)
+    # both cards of player2's hand are known, the rest is in the solution
+    assert notebook.possible[1] == notebook.held[1] == hands[1]
+    assert notebook.holders(RoomEnum.kitchen) == [SOLUTION]
+    assert notebook.holders(WeaponEnum.rope) == [SOLUTION]
+
+    notebook.accused(
+        cards_to_mask([PlayerEnum.mr_green, WeaponEnum.rope, RoomEnum.hall])
+    )
+    assert (PlayerEnum.mr_green, WeaponEnum.rope, RoomEnum.hall) not in (
+        notebook.solutions()
+    )
+
+
+def test_notebooks_survive_replay():
+    """
+    Test that notebooks rebuilt from the events of a game hold the same as
+    the notebooks kept up to date while it was played
+    """
+    rng = random.Random(3)
+    game, events = engine.new_game(4, rng)
+    bot = BOTS["detective"](rng)
+    for _ in range(40):
+        if game.victory_state:
+            break
+        player = game.player_order[game.current_turn.player]
+        if game.current_turn.phase == "move":
+            events += engine.move(game, player, bot.move(game, player))
+        if game.current_turn.phase == "suggest":
+            room = game.get_location(game.get_character(player))
+            person, weapon = bot.suggest(game, player)
+            events += engine.suggest(game, player, person, weapon, room, rng=rng)
+        events += engine.accuse(game, player, None, None, None)
+
+    replayed = replay(events)
+    for player, notebook in game.notebooks.items():
+        assert replayed.notebooks[player].__dict__ == notebook.__dict__
+
+
+def test_hint_endpoint():
+    key = get_new_default_game_key(3)
+    game = games[key]
+
+    response = client.get("/hint", params={"gameKey": key, "player": "player1"})
+    assert response.status_code == 200
+    hint = response.json()
+    assert hint["solutions"] == len(game.notebooks["player1"].solutions())
+    assert hint["accusation"] is None
+    for card in mask_to_cards(game.hands[0]):
+        assert hint["holders"][card.value] == ["player1"]
+    assert game.solution.room.value in hint["candidates"]
+
+    response = client.get("/hint", params={"gameKey": key, "player": "player9"})
+    assert response.status_code == 404
+    response = client.get("/hint", params={"gameKey": "nope", "player": "player1"})
+    assert response.status_code == 404
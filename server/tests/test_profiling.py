@@ -0,0 +1,81 @@
+from fastapi.testclient import TestClient
+from tests.util_functions import get_new_default_game_key
+from util.profiling import KEEP, RequestProfiler
+
+import main
+
+client = TestClient(main.app)
+
+TOKEN = {"X-Profile-Token": "secret"}
+
+
+def test_profile_on_demand(monkeypatch):
+    monkeypatch.setattr(main.profiler, "token", "secret")
+    key = get_new_default_game_key(3)
+
+    response = client.post("/State", params={"gameKey": key})
+    assert "x-profile-id" not in response.headers
+    response = client.post(
+        "/State", params={"gameKey": key}, headers={"X-Profile": "wrong"}
+    )
+    assert "x-profile-id" not in response.headers
+
+    response = client.post(
+        "/State", params={"gameKey": key}, headers={"X-Profile": "secret"}
+    )
+    assert response.status_code == 200
+    profile_id = response.headers["x-profile-id"]
+
+    profile = client.get(f"/internal/profiles/{profile_id}", headers=TOKEN).json()
+    assert profile["path"] == "/State"
+    assert profile["query"] == f"gameKey={key}"
+    functions = [entry["function"] for entry in profile["functions"]]
+    assert any("gameState" in function for function in functions)
+    own = [entry["own_ms"] for entry in profile["functions"]]
+    assert own == sorted(own, reverse=True)
+
+    listed = client.get("/internal/profiles", headers=TOKEN).json()
+    assert profile_id in [profile["id"] for profile in listed["profiles"]]
+
+    response = client.get(f"/internal/profiles/{profile_id}")
+    assert response.status_code == 403
+    response = client.get("/internal/profiles/nope", headers=TOKEN)
+    assert response.status_code == 404
+
+
+def test_sampled_hot_spots(monkeypatch):
+    monkeypatch.setattr(main.profiler, "token", "secret")
+    key = get_new_default_game_key(3)
+
+    assert client.put("/internal/profiles?every=2", headers=TOKEN).status_code == 200
+    try:
+        for _ in range(4):
+            client.post("/State", params={"gameKey": key})
+        hot = client.get(
+            "/internal/profiles", params={"sort": "cumulative"}, headers=TOKEN
+        ).json()
+    finally:
+        client.put("/internal/profiles?every=0", headers=TOKEN)
+
+    assert hot["every"] == 2
+    assert hot["sampled"] == 2
+    cumulative = [entry["cumulative_ms"] for entry in hot["hot_spots"]]
+    assert cumulative and cumulative == sorted(cumulative, reverse=True)
+    assert any("gameState" in entry["function"] for entry in hot["hot_spots"])
+
+    assert client.put("/internal/profiles?every=2").status_code == 403
+    response = client.put("/internal/profiles?every=-1", headers=TOKEN)
+    assert response.status_code == 400
+
+
+def test_one_request_profiled_at_a_time():
+    profiler = RequestProfiler(every=2)
+    assert [profiler.count() for _ in range(4)] == [False, True, False, True]
+
+    assert profiler.claim() and not profiler.claim()
+    profiler.release({}, sampled=True)
+    assert profiler.claim()
+    for number in range(KEEP + 1):
+        profiler.release({}, sampled=False, profile={"id": str(number)})
+    assert len(profiler.window) == 1
+    assert list(profiler.profiles) == [str(number) for number in range(1, KEEP + 1)]
@@ -0,0 +1,145 @@
+from fastapi.testclient import TestClient
+from router import Router, Worker, check_environment, create_app, shared_storage
+from util.ring import HashRing
+from util.store import SQLiteGameStore
+import asyncio
+import httpx
+import os
+import pytest
+import secrets
+
+
+def test_ring_moves_few_keys():
+    """
+    Check keys are spread over every node and that adding a node only
+    moves keys onto the new node, roughly its share of them
+    """
+    keys = [f"game-{i}" for i in range(4000)]
+    ring = HashRing(["a", "b", "c"])
+    before = {key: ring.get(key) for key in keys}
+    for node in "abc":
+        assert list(before.values()).count(node) > len(keys) / 6
+
+    ring.add("d")
+    moved = [key for key in keys if ring.get(key) != before[key]]
+    assert all(ring.get(key) == "d" for key in moved)
+    assert len(keys) / 8 < len(moved) < len(keys) / 2.5
+
+    ring.remove("d")
+    assert {key: ring.get(key) for key in keys} == before
+
+
+def test_router_with_local_workers():
+    """
+    Play games through a router in front of real worker processes, adding and
+    removing a worker part way through, and check every game stays reachable
+    on the worker owning it
+    """
+    token = secrets.token_urlsafe()
+    router = Router([Worker.start(token) for _ in range(2)], token)
+    admin = {"X-Worker-Token": token}
+
+    with TestClient(create_app(router)) as client:
+        keys = [
+            client.post("/new_game/", json={"num_players": 3}).json() for _ in range(12)
+        ]
+        for key in keys:
+            response = client.post(
+                "/chat", json={"key": key, "player": "player1", "message": key}
+            )
+            assert response.status_code == 200
+
+        def check_games():
+            for key in keys:
+                state = client.post(f"/State?gameKey={key}")
+                assert state.status_code == 200
+                assert key in state.json()["chat"][0]
+            for url in router.ring.nodes:
+                held = httpx.get(f"{url}/internal/games", headers=admin)
+                for key in held.json():
+                    assert router.owner(key) == url
+
+        check_games()
+        with client.websocket_connect(f"/updates?gameKey={keys[0]}") as websocket:
+            assert keys[0] in websocket.receive_json()["chat"][0]
+
+        added = client.post("/router/workers", headers=admin).json()
+        assert len(router.ring) == 3
+        check_games()
+
+        first = router.ring.nodes[0]
+        removed = client.delete(
+            "/router/workers", params={"url": first}, headers=admin
+        ).json()
+        assert removed["worker"] == first and first not in router.ring
+        check_games()
+
+        assert added["moved"] > 0
+        assert client.post("/router/workers").status_code == 403
+
+
+def test_rebalance_over_a_shared_store(tmp_path, monkeypatch):
+    """
+    Check adding and removing workers which share a database leaves the games
+    and their recorded events in it, only moving which worker serves them
+    """
+    monkeypatch.setenv("CLUELESS_DATABASE", str(tmp_path / "games.db"))
+    monkeypatch.setenv("CLUELESS_SHARED_DATABASE", "1")
+    assert shared_storage(os.environ)
+    token = secrets.token_urlsafe()
+    router = Router([Worker.start(token) for _ in range(2)], token, shared=True)
+    store = SQLiteGameStore(tmp_path / "games.db", shared=True)
+
+    with TestClient(create_app(router)) as client:
+        keys = [
+            client.post("/new_game/", json={"num_players": 3}).json() for _ in range(8)
+        ]
+        for key in keys:
+            client.post("/chat", json={"key": key, "player": "player1", "message": key})
+        events = {key: store.events(key) for key in keys}
+        assert all(len(recorded) > 1 for recorded in events.values())
+
+        admin = {"X-Worker-Token": token}
+        client.post("/router/workers", headers=admin)
+        client.delete(
+            "/router/workers", params={"url": router.ring.nodes[0]}, headers=admin
+        )
+        assert {key: store.events(key) for key in keys} == events
+        for key in keys:
+            state = client.post(f"/State?gameKey={key}").json()
+            assert key in state["chat"][0]
+    store.close()
+
+
+def test_rebalance_stops_when_a_game_is_not_removed():
+    """
+    Check a game which could not be removed from its old worker stops the
+    move, so the ring is not switched with the game on both workers
+    """
+
+    def worker(request: httpx.Request) -> httpx.Response:
+        if request.method == "GET" and request.url.path == "/internal/games":
+            return httpx.Response(200, json=[f"game-{i}" for i in range(20)])
+        if request.method == "DELETE":
+            return httpx.Response(500)
+        return httpx.Response(200, content=b"game")
+
+    async def run(router: Router) -> None:
+        router.client = httpx.AsyncClient(transport=httpx.MockTransport(worker))
+        with pytest.raises(httpx.HTTPStatusError):
+            await router.add_worker(Worker("http://c"))
+        await router.client.aclose()
+
+    router = Router([Worker("http://a"), Worker("http://b")], "token")
+    before = router.ring
+    asyncio.run(run(router))
+    assert router.ring is before
+
+
+def test_workers_never_share_unshared_storage():
+    check_environment({})
+    check_environment({"CLUELESS_DATABASE": "a.db", "CLUELESS_SHARED_DATABASE": "1"})
+    check_environment({"CLUELESS_STORE_SOCKET": "a.sock", "CLUELESS_DATABASE": "a.db"})
+    for env in [{"CLUELESS_DATABASE": "a.db"}, {"CLUELESS_ARCHIVE_DIR": "games"}]:
+        with pytest.raises(RuntimeError):
+            check_environment(env)
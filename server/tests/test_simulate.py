@@ -0,0 +1,120 @@
+from simulate import play_game, simulate
+from util import engine
+from util.bots import BOTS, DISTANCES, Bot, EliminationBot
+from util.cards import cards_to_mask
+from util.events import Disproved, Suggested
+from util.enums import PlayerEnum, WeaponEnum, RoomEnum, EndGameEnum
+from util.game_state import GameSolution, GameState
+import pytest
+import random
+
+
+def test_same_seed_same_game():
+    """
+    Test that a game is fully determined by its seed
+    """
+    bots = ["eliminator", "random", "gambler"]
+    for seed in range(20):
+        assert play_game(seed, 4, bots) == play_game(seed, 4, bots)
+    assert [play_game(seed, 4, bots) for seed in range(20)] != [
+        play_game(0, 4, bots) for _ in range(20)
+    ]
+
+
+def test_processes_play_the_same_games():
+    """
+    Test that the games do not depend on how they are spread over processes
+    """
+    bots = ["eliminator", "gambler"]
+    _, alone = simulate(30, 3, bots, seed=100, processes=1)
+    _, pooled = simulate(30, 3, bots, seed=100, processes=2)
+    assert alone == pooled
+    assert [result.seed for result in alone] == list(range(100, 130))
+
+
+@pytest.mark.parametrize("bot", BOTS)
+def test_bots_finish_games(bot: str):
+    """
+    Test that every bot plays games to the end, in any number of players
+    """
+    for num_players in range(2, 7):
+        report, results = simulate(10, num_players, [bot], processes=1)
+        assert report.finished == len(results) == 10
+        for result in results:
+            assert result.victory_state in (
+                EndGameEnum.winner_found,
+                EndGameEnum.no_winners,
+            )
+
+
+def test_report():
+    """
+    Test that the report adds up over the games played
+    """
+    bots = ["eliminator", "random"]
+    report, results = simulate(40, 5, bots, processes=1)
+    stats = report.to_dict()
+
+    assert report.games == 40
+    assert report.turns == sum(result.turns for result in results)
+    # seats alternate between the bots, starting from the first
+    assert report.bot_seats == {"eliminator": 120, "random": 80}
+    assert sum(report.bot_wins.values()) == sum(report.seat_wins.values())
+    assert sum(report.bot_wins.values()) == sum(
+        result.winner is not None for result in results
+    )
+    assert stats["games_per_second"] > 0
+    assert stats["win_rate_per_seat"]["eliminator"] == pytest.approx(
+        report.bot_wins.get("eliminator", 0) / 120
+    )
+
+
+def test_unknown_bot():
+    with pytest.raises(ValueError):
+        simulate(1, 3, ["eliminator", "cheater"])
+
+
+def test_bot_learns_from_undisproved_suggestion():
+    """
+    Test that a suggestion nobody can disprove tells the bot its unseen cards
+    are in the solution
+    """
+    solution = GameSolution(PlayerEnum.mrs_white, WeaponEnum.rope, RoomEnum.study)
+    game = GameState(3, solution)
+    player = game.player_order[0]
+    game.seen_cards[player] |= cards_to_mask([PlayerEnum.miss_scarlet])
+    bot = Bot(random.Random(0))
+
+    events = [
+        Suggested(
+            player, PlayerEnum.miss_scarlet, WeaponEnum.rope, RoomEnum.study, "x"
+        ),
+        Disproved(player, None, None, "x"),
+    ]
+    bot.observe(game, player, events)
+    assert bot.solved == cards_to_mask([WeaponEnum.rope, RoomEnum.study])
+
+    candidates = bot.candidates(game, player)
+    assert candidates & cards_to_mask(WeaponEnum) == cards_to_mask([WeaponEnum.rope])
+    assert candidates & cards_to_mask(RoomEnum) == cards_to_mask([RoomEnum.study])
+
+
+def test_eliminator_moves_towards_unknown_rooms():
+    """
+    Test that the eliminator takes a step towards the nearest room it has
+    not ruled out, instead of wandering
+    """
+    solution = GameSolution(PlayerEnum.mrs_white, WeaponEnum.rope, RoomEnum.kitchen)
+    game = GameState(2, solution, {"player1": PlayerEnum.miss_scarlet})
+    player = "player1"
+    # everything but the solution's room has been ruled out
+    game.seen_cards[player] |= cards_to_mask(
+        room for room in RoomEnum if room != RoomEnum.kitchen
+    )
+    bot = EliminationBot(random.Random(0))
+    start = game.get_location(PlayerEnum.miss_scarlet)
+
+    for _ in range(DISTANCES[start][RoomEnum.kitchen]):
+        engine.move(game, player, bot.move(game, player))
+        game.current_turn.phase = "move"
+    assert game.get_location(PlayerEnum.miss_scarlet) == RoomEnum.kitchen
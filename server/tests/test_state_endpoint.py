@@ -0,0 +1,109 @@
+from fastapi.testclient import TestClient
+from util.enums import HallEnum, PlayerEnum, RoomEnum
+from tests.util_functions import get_new_default_game_key
+
+from main import app, games
+
+client = TestClient(app)
+
+
+def test_state_returns_version_and_etag():
+    """
+    Check that the state endpoint reports the game version both
+    in the body and as an ETag header
+    """
+    key = get_new_default_game_key(2)
+    response = client.post(f"/State?gameKey={key}")
+    assert response.status_code == 200
+    assert response.json()["version"] == games[key].version
+    assert response.headers["ETag"] == f'"{games[key].version}"'
+
+
+def test_state_not_modified():
+    """
+    Check that a client holding the current version gets an empty
+    304 response, through either since_version or If-None-Match
+    """
+    key = get_new_default_game_key(2)
+    version = games[key].version
+
+    response = client.post(f"/State?gameKey={key}&since_version={version}")
+    assert response.status_code == 304
+    assert response.content == b""
+
+    response = client.post(
+        f"/State?gameKey={key}", headers={"If-None-Match": f'"{version}"'}
+    )
+    assert response.status_code == 304
+
+    response = client.post(f"/State?gameKey={key}&since_version={version - 1}")
+    assert response.status_code == 200
+
+
+def test_mutations_bump_version():
+    """
+    Check that every endpoint which changes the game moves the
+    version forward so polling clients see the change
+    """
+    key = get_new_default_game_key(6)
+
+    version = games[key].version
+    client.post(
+        "/username", json={"game_id": key, "player": "player1", "username": "a"}
+    )
+    assert games[key].version > version
+
+    version = games[key].version
+    client.post("/chat", json={"key": key, "player": "player1", "message": "hi"})
+    assert games[key].version > version
+
+    version = games[key].version
+    client.post(
+        "/move", json={"player": "player1", "location": RoomEnum.lounge, "id": key}
+    )
+    assert games[key].version > version
+
+    response = client.post(f"/State?gameKey={key}&since_version={version}")
+    assert response.status_code == 200
+    assert response.json()["game_phase"]["phase"] == "suggest"
+
+
+def test_state_returns_changes_since_version():
+    """
+    Check that a client passing an older version only receives the
+    log and chat entries and map locations changed after it
+    """
+    key = get_new_default_game_key(6)
+    client.post("/chat", json={"key": key, "player": "player1", "message": "old"})
+    version = games[key].version
+
+    client.post("/chat", json={"key": key, "player": "player1", "message": "new"})
+    client.post(
+        "/move", json={"player": "player1", "location": RoomEnum.lounge, "id": key}
+    )
+
+    response = client.post(f"/State?gameKey={key}&since_version={version}")
+    assert response.status_code == 200
+    changes = response.json()
+    assert changes["since_version"] == version
+    assert changes["version"] == games[key].version
+    assert len(changes["chat"]) == 1 and "new" in changes["chat"][0]
+    assert len(changes["logs"]) == 1
+    assert changes["map"] == {
+        str(HallEnum.hall_to_lounge.value): [],
+        RoomEnum.lounge.value: [PlayerEnum.miss_scarlet.value],
+    }
+    assert changes["game_phase"]["phase"] == "suggest"
+
+
+def test_state_falls_back_to_full_snapshot():
+    """
+    Check that versions the change journal cannot answer get the
+    full game state instead
+    """
+    key = get_new_default_game_key(2)
+    for version in [-1, games[key].version + 1]:
+        response = client.post(f"/State?gameKey={key}&since_version={version}")
+        assert response.status_code == 200
+        assert "since_version" not in response.json()
+        assert "solution" in response.json()
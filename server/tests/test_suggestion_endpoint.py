@@ -214,3 +214,32 @@ def test_good_suggestion_returns_card_or_no_card_if_solution_or_hand():
         RoomEnum.lounge,
         games[key],
     ), "No card was returned, when one should have been!"
+
+
+def test_suggestion_does_not_dump_state(monkeypatch):
+    """
+    Check resolving a suggestion reads the game through its accessors
+    rather than materialising the whole state
+    """
+    key = get_new_default_game_key(6)
+    client.post(
+        "/move", json={"player": "player1", "location": RoomEnum.lounge, "id": key}
+    )
+
+    def fail():
+        raise AssertionError("dump_to_dict called")
+
+    monkeypatch.setattr(games[key], "dump_to_dict", fail)
+    response = client.post(
+        "/suggestion/",
+        json={
+            "gameKey": key,
+            "player": "player1",
+            "statementDetails": {
+                "person": PlayerEnum.prof_plum,
+                "weapon": WeaponEnum.knife,
+                "room": RoomEnum.lounge,
+            },
+        },
+    )
+    assert response.status_code == 200
@@ -0,0 +1,44 @@
+from fastapi.testclient import TestClient
+from starlette.websockets import WebSocketDisconnect
+from util.enums import RoomEnum
+from tests.util_functions import get_new_default_game_key
+import pytest
+
+from main import app, games, hub
+
+client = TestClient(app)
+
+
+def test_bad_key_updates():
+    """
+    Check that listening to an unknown game closes the connection
+    """
+    with pytest.raises(WebSocketDisconnect):
+        with client.websocket_connect("/updates?gameKey=bad") as websocket:
+            websocket.receive_json()
+
+
+def test_updates_pushed_on_commit():
+    """
+    Check that a listener first gets the full state and then the
+    changes committed by the chat and move endpoints
+    """
+    key = get_new_default_game_key(6)
+    with client.websocket_connect(f"/updates?gameKey={key}") as websocket:
+        state = websocket.receive_json()
+        assert state["version"] == games[key].version
+        assert "solution" in state
+        assert hub.listener_count(key) == 1
+
+        client.post("/chat", json={"key": key, "player": "player1", "message": "hi"})
+        update = websocket.receive_json()
+        assert update["since_version"] == state["version"]
+        assert len(update["chat"]) == 1
+
+        client.post(
+            "/move", json={"player": "player1", "location": RoomEnum.lounge, "id": key}
+        )
+        update = websocket.receive_json()
+        assert update["version"] == games[key].version
+        assert update["game_phase"]["phase"] == "suggest"
+        assert RoomEnum.lounge.value in update["map"]
@@ -0,0 +1,367 @@
+"""
+Many games with the same number of players held in NumPy arrays, one row per
+game, so every game can take its next action in a single vectorized step. The
+rules are those of util/engine.py and the board and cards use the same ids and
+bitmasks as util/game_map.py and util/cards.py, so a game in a batch can be
+checked against a GameState playing the same actions.
+
+NumPy is an optional dependency of the server, install it with:
+    pip install ".[batch]"
+"""
+
+import numpy as np
+
+from util.cards import CARDS, CARD_IDS
+from util.engine import RuleError
+from util.enums import PlayerEnum, WeaponEnum, RoomEnum, HttpEnum, EndGameEnum
+from util.game_map import ADJACENCY_MASKS, HALLWAY_MASK, LOCATION_IDS, LOCATIONS
+from util.game_state import SOLUTION_OWNER, STARTING_LOCATIONS, GameState
+
+# Phases of a turn, in the order of util.game_state.TurnPhase
+MOVE, SUGGEST, ACCUSE = 0, 1, 2
+PHASES = ["move", "suggest", "accuse"]
+
+# Players and cards which are absent, e.g. nobody disproved a suggestion
+NONE = -1
+
+CHARACTERS = list(PlayerEnum)
+NUM_CHARACTERS = len(CHARACTERS)
+
+# Bitmask of the locations next to each location, indexed by location id
+ADJACENCY = np.array([ADJACENCY_MASKS[location] for location in LOCATIONS], np.int64)
+ROOMS = np.array([isinstance(location, RoomEnum) for location in LOCATIONS])
+STAGING = LOCATION_IDS[RoomEnum.staging]
+STARTS = np.array([LOCATION_IDS[STARTING_LOCATIONS[c]] for c in CHARACTERS], np.int8)
+
+# Card id of each person, weapon and room, indexed by position in their enum
+PERSON_CARDS = np.array([CARD_IDS[c] for c in PlayerEnum], np.int8)
+WEAPON_CARDS = np.array([CARD_IDS[c] for c in WeaponEnum], np.int8)
+ROOM_CARDS = np.array([CARD_IDS[c] for c in RoomEnum], np.int8)
+# The card of each location, NONE for hallways
+LOCATION_CARDS = np.array(
+    [CARD_IDS[location] if location in CARD_IDS else NONE for location in LOCATIONS],
+    np.int8,
+)
+
+
+def bits(ids: np.ndarray) -> np.ndarray:
+    """
+    Function to turn an array of ids into an array of bitmasks with those bits set
+    """
+    return np.left_shift(np.int64(1), ids.astype(np.int64))
+
+
+def choose_bits(masks: np.ndarray, width: int, rng: np.random.Generator) -> np.ndarray:
+    """
+    Function to pick one set bit of each bitmask uniformly at random
+
+    Args:
+        masks {np.ndarray}: The bitmasks to pick from
+        width {int}: The highest number of bits a mask can have
+        rng {np.random.Generator}: Source of the random picks
+
+    Returns:
+        The id of the picked bit of each mask, NONE for masks without any set
+    """
+    held = (masks[:, None] >> np.arange(width, dtype=np.int64)) & 1
+    counts = held.sum(axis=1)
+    picks = (rng.random(len(masks)) * counts).astype(np.int64)
+    chosen = np.argmax(np.cumsum(held, axis=1) > picks[:, None], axis=1)
+    return np.where(counts > 0, chosen, NONE)
+
+
+class GameBatch:
+    """
+    A batch of games with the same number of players. Each array has a row per
+    game, players are indexed by their position in the turn order and
+    characters, locations and cards by their position in PlayerEnum, LOCATIONS
+    and CARDS.
+
+    Actions take an array with a value per game and apply to the games given by
+    a boolean mask, by default every unfinished game in the phase the action is
+    made in. When any of those games cannot take the action a RuleError is
+    raised and no game is changed.
+    """
+
+    def __init__(self, num_players: int, size: int) -> None:
+        if num_players < 2 or 6 < num_players:
+            raise ValueError("The number of player must be in the range 2-6")
+        self.num_players = num_players
+        self.size = size
+
+        # the solution as card ids and as a card bitmask
+        self.solution = np.zeros((size, 3), np.int8)
+        self.solution_mask = np.zeros(size, np.int64)
+        # card bitmasks of each player's hand and the cards they have seen
+        self.hands = np.zeros((size, num_players), np.int64)
+        self.seen = np.zeros((size, num_players), np.int64)
+        # which player holds each card, SOLUTION_OWNER for the solution
+        self.card_owners = np.full((size, len(CARDS)), SOLUTION_OWNER, np.int8)
+
+        self.characters = np.zeros((size, num_players), np.int8)
+        self.locations = np.full((size, NUM_CHARACTERS), STAGING, np.int8)
+        self.moved_by_suggest = np.zeros((size, NUM_CHARACTERS), bool)
+
+        self.turn = np.zeros(size, np.int8)
+        self.phase = np.full(size, MOVE, np.int8)
+        # players who have not made a wrong accusation
+        self.active = np.ones((size, num_players), bool)
+        self.victory = np.full(size, EndGameEnum.keep_playing, np.int8)
+
+        self._rows = np.arange(size)
+
+    @classmethod
+    def new(cls, num_players: int, size: int, rng: np.random.Generator) -> "GameBatch":
+        """
+        Function to deal a batch of new games the way GameState does: a random
+        solution, the other cards dealt in card order round the table, Miss
+        Scarlet for the first player and random characters for the others
+        """
+        batch = cls(num_players, size)
+        batch.solution[:, 0] = PERSON_CARDS[rng.integers(len(PERSON_CARDS), size=size)]
+        batch.solution[:, 1] = WEAPON_CARDS[rng.integers(len(WEAPON_CARDS), size=size)]
+        batch.solution[:, 2] = ROOM_CARDS[rng.integers(len(ROOM_CARDS), size=size)]
+
+        others = np.tile(np.arange(1, NUM_CHARACTERS, dtype=np.int8), (size, 1))
+        characters = np.concatenate(
+            [np.zeros((size, 1), np.int8), rng.permuted(others, axis=1)], axis=1
+        )
+        batch._deal(characters[:, :num_players])
+        return batch
+
+    @classmethod
+    def from_games(cls, games: list[GameState]) -> "GameBatch":
+        """
+        Function to copy games which have just been dealt into a batch
+        """
+        batch = cls(len(games[0].player_order), len(games))
+        characters = np.zeros((len(games), batch.num_players), np.int8)
+        for i, game in enumerate(games):
+            if len(game.player_order) != batch.num_players:
+                raise ValueError("Games in a batch need the same number of players.")
+            solution = game.solution
+            batch.solution[i] = [
+                CARD_IDS[solution.person],
+                CARD_IDS[solution.weapon],
+                CARD_IDS[solution.room],
+            ]
+            characters[i] = [
+                CHARACTERS.index(game.get_character(player))
+                for player in game.player_order
+            ]
+        batch._deal(characters)
+        return batch
+
+    def _deal(self, characters: np.ndarray) -> None:
+        self.solution_mask = np.bitwise_or.reduce(bits(self.solution), axis=1)
+
+        # every card but the solution goes round the table in card order
+        in_deck = (self.solution_mask[:, None] >> np.arange(len(CARDS))) & 1 == 0
+        order = np.cumsum(in_deck, axis=1) - 1
+        self.card_owners = np.where(
+            in_deck, order % self.num_players, SOLUTION_OWNER
+        ).astype(np.int8)
+        for player in range(self.num_players):
+            held = bits(np.arange(len(CARDS))) * (self.card_owners == player)
+            self.hands[:, player] = held.sum(axis=1)
+
+        self.characters = characters
+        self.locations[self._rows[:, None], characters] = STARTS[characters]
+
+    # State derived from the arrays
+
+    @property
+    def ongoing(self) -> np.ndarray:
+        return self.victory == EndGameEnum.keep_playing
+
+    @property
+    def occupancy(self) -> np.ndarray:
+        """
+        Bitmask of the locations holding at least one character in each game
+        """
+        return np.bitwise_or.reduce(bits(self.locations), axis=1)
+
+    def current(self, values: np.ndarray) -> np.ndarray:
+        """
+        The value of the current player of each game, from an array with a
+        column per player
+        """
+        return values[self._rows, self.turn]
+
+    def current_characters(self) -> np.ndarray:
+        return self.current(self.characters)
+
+    def current_locations(self) -> np.ndarray:
+        return self.locations[self._rows, self.current_characters()]
+
+    def legal_moves(self) -> np.ndarray:
+        """
+        Bitmask of the locations the current player of each game can move to,
+        adjacent locations except occupied hallways
+        """
+        return ADJACENCY[self.current_locations()] & ~(self.occupancy & HALLWAY_MASK)
+
+    def unknown_cards(self) -> np.ndarray:
+        """
+        Card bitmask of the cards each player has neither been dealt nor seen
+        """
+        every = (1 << len(CARDS)) - 1
+        return every & ~(self.hands | self.seen)
+
+    def _games(self, games: np.ndarray | None, phase: np.ndarray) -> np.ndarray:
+        if games is None:
+            return self.ongoing & phase
+        if np.any(games & ~(self.ongoing & phase)):
+            raise RuleError(HttpEnum.bad_request, "Game phase does not allow this.")
+        return games
+
+    # Actions
+
+    def move(self, targets: np.ndarray, games: np.ndarray | None = None) -> None:
+        """
+        Move the current player of each game to a target location id. Entering
+        a room moves the game to the suggestion phase, otherwise it moves to the
+        accusation phase.
+        """
+        games = self._games(games, self.phase == MOVE)
+        targets = np.asarray(targets, np.int64)
+        legal = (self.legal_moves() >> np.where(games, targets, 0)) & 1
+        if np.any(games & (legal == 0)):
+            raise RuleError(HttpEnum.bad_request, "Invalid location to move to.")
+
+        rows = self._rows[games]
+        characters = self.current_characters()[games]
+        self.moved_by_suggest[rows, characters] = False
+        self.locations[rows, characters] = targets[games]
+        self.phase[games] = np.where(ROOMS[targets[games]], SUGGEST, ACCUSE)
+
+    def suggest(
+        self,
+        persons: np.ndarray,
+        weapons: np.ndarray,
+        games: np.ndarray | None = None,
+        rng: np.random.Generator | None = None,
+        shown: np.ndarray | None = None,
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Make a suggestion of a character and weapon (their positions in PlayerEnum
+        and WeaponEnum) in the room the current player of each game is in. The
+        suggested character is moved into the room and the first player after
+        the suggestor holding suggested cards the suggestor has not seen shows
+        one of them, picked with rng or given as card ids in shown.
+
+        Returns:
+            The disprover and the card id they showed in each game, NONE for
+            both in games where nobody could disprove the suggestion
+        """
+        characters = self.current_characters()
+        suggesting = (self.phase == SUGGEST) | self.moved_by_suggest[
+            self._rows, characters
+        ]
+        games = self._games(games, suggesting)
+        rooms = self.current_locations()
+        if np.any(games & ~ROOMS[rooms]):
+            raise RuleError(HttpEnum.forbidden, "Suggestor is not in a room.")
+
+        persons = np.asarray(persons, np.int64)
+        weapons = np.asarray(weapons, np.int64)
+        cards = np.stack(
+            [
+                PERSON_CARDS[np.where(games, persons, 0)],
+                WEAPON_CARDS[np.where(games, weapons, 0)],
+                LOCATION_CARDS[rooms],
+            ],
+            axis=1,
+        ).astype(np.int64)
+
+        # distance round the table from the suggestor to the owner of each card
+        # which the suggestor has not seen, the closest owner disproves
+        owners = np.take_along_axis(self.card_owners, cards, axis=1).astype(np.int64)
+        turn = self.turn.astype(np.int64)[:, None]
+        unseen = (self.current(self.seen)[:, None] >> cards) & 1 == 0
+        held = unseen & (owners != SOLUTION_OWNER) & (owners != turn)
+        distances = np.where(held, (owners - turn) % self.num_players, NUM_CHARACTERS)
+        closest = distances.min(axis=1)
+        disproved = games & (closest < NUM_CHARACTERS)
+        showable = np.where(distances == closest[:, None], bits(cards), 0)
+        showable = np.bitwise_or.reduce(showable, axis=1) * disproved
+
+        if shown is None:
+            shown = choose_bits(showable, len(CARDS), rng or np.random.default_rng())
+        else:
+            shown = np.asarray(shown, np.int64)
+            in_hand = (showable >> np.where(disproved, shown, 0)) & 1
+            if np.any(disproved & (in_hand == 0)):
+                raise RuleError(HttpEnum.bad_request, "Card cannot be shown.")
+        disprovers = np.where(
+            disproved, (turn[:, 0] + closest) % self.num_players, NONE
+        )
+        shown = np.where(disproved, shown, NONE)
+
+        rows = self._rows[games]
+        self.moved_by_suggest[rows, characters[games]] = False
+        self.locations[rows, persons[games]] = rooms[games]
+        others = persons[games] != characters[games]
+        self.moved_by_suggest[rows[others], persons[games][others]] = True
+
+        rows = self._rows[disproved]
+        self.seen[rows, self.turn[disproved]] |= bits(shown[disproved])
+        self._next_phase(games, ACCUSE)
+        return disprovers.astype(np.int8), shown.astype(np.int8)
+
+    def accuse(
+        self,
+        persons: np.ndarray,
+        weapons: np.ndarray,
+        rooms: np.ndarray,
+        games: np.ndarray | None = None,
+    ) -> None:
+        """
+        Accuse a character, weapon and room (their positions in PlayerEnum,
+        WeaponEnum and RoomEnum), or pass in games where all three are NONE. A
+        correct accusation wins the game, a wrong one leaves the player only
+        able to disprove suggestions.
+        """
+        games = self._games(games, self.phase == ACCUSE)
+        persons = np.asarray(persons, np.int64)
+        passing = games & (persons == NONE)
+        accusing = games & ~passing
+
+        accused = np.stack(
+            [
+                PERSON_CARDS[np.where(accusing, persons, 0)],
+                WEAPON_CARDS[np.where(accusing, weapons, 0)],
+                ROOM_CARDS[np.where(accusing, rooms, 0)],
+            ],
+            axis=1,
+        )
+        correct = np.bitwise_or.reduce(bits(accused), axis=1) == self.solution_mask
+        winners = accusing & correct
+        losers = accusing & ~correct
+        self.victory[winners] = EndGameEnum.winner_found
+
+        accusers = self.turn.copy()
+        self._next_player(passing | losers)
+        self.active[self._rows[losers], accusers[losers]] = False
+        self.victory[losers & ~self.active.any(axis=1)] = EndGameEnum.no_winners
+        self._next_phase(passing | losers, MOVE)
+
+    # Turn order
+
+    def _next_player(self, games: np.ndarray) -> None:
+        # games with a single player left keep their turn
+        games = games & (self.active.sum(axis=1) > 1)
+        offsets = np.arange(1, self.num_players + 1)
+        candidates = (self.turn[:, None] + offsets) % self.num_players
+        step = np.argmax(np.take_along_axis(self.active, candidates, axis=1), axis=1)
+        self.turn = np.where(games, candidates[self._rows, step], self.turn).astype(
+            np.int8
+        )
+
+    def _next_phase(self, games: np.ndarray, phase: int) -> None:
+        if phase == MOVE:
+            # players in a room with every way out blocked skip to accusing
+            adjacent = ADJACENCY[self.current_locations()]
+            free = (adjacent & ~HALLWAY_MASK) | (adjacent & ~self.occupancy)
+            phase = np.where(free != 0, MOVE, ACCUSE)
+        self.phase = np.where(games, phase, self.phase).astype(np.int8)
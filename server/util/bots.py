@@ -0,0 +1,167 @@
+from util import engine
+from util.cards import (
+    ALL_CARDS_MASK,
+    PERSON_MASK,
+    WEAPON_MASK,
+    ROOM_MASK,
+    cards_to_mask,
+    mask_to_cards,
+)
+from util.enums import PlayerEnum, WeaponEnum, RoomEnum, HallEnum
+from util.events import Event
+from util.game_map import MAP
+from util.game_state import GameState
+from collections import deque
+import random
+
+Accusation = tuple[PlayerEnum, WeaponEnum, RoomEnum]
+
+
+def _distances(start: RoomEnum | HallEnum) -> dict[RoomEnum | HallEnum, int]:
+    distances = {start: 0}
+    queue = deque([start])
+    while queue:
+        location = queue.popleft()
+        for neighbour in MAP[location]:
+            if neighbour not in distances:
+                distances[neighbour] = distances[location] + 1
+                queue.append(neighbour)
+    return distances
+
+
+# Number of moves between any two locations, ignoring other characters
+DISTANCES = {location: _distances(location) for location in MAP}
+
+
+def unknown_cards(game: GameState, player: str) -> int:
+    """
+    Function to get the bitmask of the cards a player has neither been dealt
+    nor been shown, the solution is always among them
+    """
+    hand = game.hands[game.player_order.index(player)]
+    return ALL_CARDS_MASK & ~(hand | game.seen_cards[player])
+
+
+class Bot:
+    """
+    Base class of the strategies that play games in the simulator. A bot only
+    uses what its player could know: its hand, the cards it has been shown, the
+    outcome of its own suggestions and the board. All randomness comes from the
+    rng it is given, so games played by bots can be reproduced from a seed.
+    """
+
+    name = "random"
+
+    def __init__(self, rng: random.Random) -> None:
+        self.rng = rng
+        # cards known to be in the solution
+        self.solved = 0
+
+    def candidates(self, game: GameState, player: str) -> int:
+        """
+        The bitmask of the cards which could still be in the solution
+        """
+        unknown = unknown_cards(game, player)
+        for mask in (PERSON_MASK, WEAPON_MASK, ROOM_MASK):
+            if self.solved & mask:
+                unknown &= ~mask | self.solved
+        return unknown
+
+    def observe(self, game: GameState, player: str, events: list[Event]) -> None:
+        """
+        Learn from the outcome of a suggestion made by this bot. When nobody
+        could disprove it, every suggested card the player has not seen or
+        been dealt is in the solution.
+        """
+        suggested, disproved = events
+        if disproved.disprover is None:
+            suggestion = [suggested.person, suggested.weapon, suggested.room]
+            self.solved |= cards_to_mask(suggestion) & unknown_cards(game, player)
+
+    def move(self, game: GameState, player: str) -> RoomEnum | HallEnum:
+        return self.rng.choice(engine.legal_moves(game, player))
+
+    def suggest(self, game: GameState, player: str) -> tuple[PlayerEnum, WeaponEnum]:
+        return self.rng.choice(list(PlayerEnum)), self.rng.choice(list(WeaponEnum))
+
+    def accuse(self, game: GameState, player: str) -> Accusation | None:
+        """
+        Accuse once a single candidate is left for each part of the solution
+        """
+        candidates = mask_to_cards(self.candidates(game, player))
+        if len(candidates) == 3:
+            return tuple(candidates)
+        return None
+
+
+class EliminationBot(Bot):
+    """
+    Heads for the nearest other room it has not ruled out and only suggests
+    cards it has not seen, so every disproved suggestion shows it something new
+    """
+
+    name = "eliminator"
+
+    def move(self, game: GameState, player: str) -> RoomEnum | HallEnum:
+        moves = engine.legal_moves(game, player)
+        # the solution's room is always a candidate, but the staging room
+        # cannot be entered from anywhere
+        location = game.get_location(game.get_character(player))
+        targets = mask_to_cards(self.candidates(game, player) & ROOM_MASK)
+        targets = [room for room in targets if room != location] or targets
+        steps = {
+            target: min(DISTANCES[target].get(room, len(MAP)) for room in targets)
+            for target in moves
+        }
+        closest = min(steps.values())
+        return self.rng.choice([target for target in moves if steps[target] == closest])
+
+    def suggest(self, game: GameState, player: str) -> tuple[PlayerEnum, WeaponEnum]:
+        candidates = self.candidates(game, player)
+        return (
+            self.rng.choice(mask_to_cards(candidates & PERSON_MASK)),
+            self.rng.choice(mask_to_cards(candidates & WEAPON_MASK)),
+        )
+
+
+class GamblerBot(EliminationBot):
+    """
+    Plays like the eliminator but guesses an accusation as soon as there are
+    at most two candidates left for each part of the solution
+    """
+
+    name = "gambler"
+
+    def accuse(self, game: GameState, player: str) -> Accusation | None:
+        candidates = self.candidates(game, player)
+        choices = [
+            mask_to_cards(candidates & mask)
+            for mask in (PERSON_MASK, WEAPON_MASK, ROOM_MASK)
+        ]
+        if all(len(cards) <= 2 for cards in choices):
+            return tuple(self.rng.choice(cards) for cards in choices)
+        return None
+
+
+class DetectiveBot(EliminationBot):
+    """
+    Plays like the eliminator but reasons with its player's notebook (see
+    util/notebook.py), which also deduces cards from the size of every hand
+    and from the wrong accusations of the other players
+    """
+
+    name = "detective"
+
+    def candidates(self, game: GameState, player: str) -> int:
+        return game.notebooks[player].candidates
+
+    def accuse(self, game: GameState, player: str) -> Accusation | None:
+        solutions = game.notebooks[player].solutions()
+        if len(solutions) == 1:
+            return solutions[0]
+        return None
+
+
+BOTS: dict[str, type[Bot]] = {
+    bot.name: bot for bot in [Bot, EliminationBot, GamblerBot, DetectiveBot]
+}
@@ -0,0 +1,49 @@
+from typing import Iterable
+from util.enums import PlayerEnum, WeaponEnum, RoomEnum
+
+Card = PlayerEnum | WeaponEnum | RoomEnum
+
+# Every card in the game in a fixed order, a card's id is its index in this list
+# and a set of cards (a hand, the solution, the cards a player has seen) is an
+# int with the bits of those ids set.
+CARDS: list[Card] = list(PlayerEnum) + list(WeaponEnum) + list(RoomEnum)
+CARD_IDS = {card: i for i, card in enumerate(CARDS)}
+CARD_BITS = {card: 1 << i for i, card in enumerate(CARDS)}
+
+
+def cards_to_mask(cards: Iterable[Card | str | None]) -> int:
+    """
+    Function to encode a collection of cards as a bitmask, cards can be given
+    as enums or their string values and None entries are skipped
+    """
+    mask = 0
+    for card in cards:
+        if card is not None:
+            mask |= CARD_BITS[card]
+    return mask
+
+
+def mask_to_cards(mask: int) -> list[Card]:
+    """
+    Function to decode a bitmask into the list of cards it holds, in card id order
+    """
+    cards = []
+    while mask:
+        low_bit = mask & -mask
+        cards.append(CARDS[low_bit.bit_length() - 1])
+        mask ^= low_bit
+    return cards
+
+
+def mask_to_strings(mask: int) -> list[str]:
+    """
+    Function to decode a bitmask into the display names of its cards
+    """
+    return [card.value for card in mask_to_cards(mask)]
+
+
+# Every card of each kind, a solution has exactly one card of each
+PERSON_MASK = cards_to_mask(PlayerEnum)
+WEAPON_MASK = cards_to_mask(WeaponEnum)
+ROOM_MASK = cards_to_mask(RoomEnum)
+ALL_CARDS_MASK = PERSON_MASK | WEAPON_MASK | ROOM_MASK
@@ -0,0 +1,186 @@
+from util.actions import MoveAction
+from util.cards import cards_to_mask, mask_to_cards
+from util.enums import PlayerEnum, WeaponEnum, RoomEnum, HallEnum, HttpEnum
+from util.events import (
+    Accused,
+    Chatted,
+    Disproved,
+    Event,
+    GameCreated,
+    Joined,
+    Moved,
+    Suggested,
+)
+from util.functions import get_time
+from util.game_map import ADJACENCY_MASKS, HALLWAY_MASK, LOCATION_BITS, LOCATIONS
+from util.game_state import GameState
+from util.movement import validate_move
+import random
+
+# The rules of the game, independent of the server. Every action checks it is
+# allowed, then builds the events it results in, applies them to the game and
+# returns them so the caller can record or publish them. Actions which are not
+# allowed raise a RuleError and leave the game untouched.
+#
+# The endpoints in main.py are thin wrappers around these functions, anything
+# else (tests, simulations, bots) can play games with them directly.
+
+
+class RuleError(Exception):
+    """
+    Raised when an action is not allowed by the rules or the state of the game,
+    status is the HTTP status the endpoints answer with
+    """
+
+    def __init__(self, status: HttpEnum, detail: str) -> None:
+        super().__init__(detail)
+        self.status = status
+        self.detail = detail
+
+
+def _apply(game: GameState, events: list[Event]) -> list[Event]:
+    for event in events:
+        event.apply(game)
+    return events
+
+
+def new_game(
+    num_players: int, rng: random.Random | None = None
+) -> tuple[GameState, list[Event]]:
+    """
+    Function to deal a new game, drawing the solution and characters from rng
+    if it is given
+
+    Returns:
+        The game and the events that created it
+    """
+    try:
+        game = GameState(num_players, rng=rng)
+    except ValueError:
+        raise RuleError(HttpEnum.forbidden, "Invalid number of players.")
+    return game, _apply(game, [GameCreated.from_game(game)])
+
+
+def join(game: GameState, player: str, username: str) -> list[Event]:
+    """
+    Function for a player to take their seat in the game under a username
+    """
+    if player not in game.player_username_mapping:
+        raise RuleError(HttpEnum.not_found, "Player is unknown to the game")
+    if game.player_username_mapping[player]:
+        raise RuleError(HttpEnum.forbidden, "Username already set for this player")
+    return _apply(game, [Joined(player, username)])
+
+
+def move(
+    game: GameState,
+    player: str,
+    location: RoomEnum | HallEnum | None,
+    time: str | None = None,
+) -> list[Event]:
+    """
+    Function to move a player's character. Entering a room moves the game to
+    the suggestion phase, otherwise it moves to the accusation phase.
+    """
+    try:
+        current_location = game.get_location(game.get_character(player))
+    except KeyError:
+        raise RuleError(HttpEnum.not_found, "Player not found on Map.")
+
+    status, detail = validate_move(MoveAction(player, location), current_location, game)
+    if status != HttpEnum.good:
+        raise RuleError(status, detail)
+
+    # Moving also resets the character being marked as moved by a suggestion
+    return _apply(game, [Moved(player, location, time or get_time())])
+
+
+def suggest(
+    game: GameState,
+    player: str,
+    person: PlayerEnum | None,
+    weapon: WeaponEnum | None,
+    room: RoomEnum | HallEnum | None,
+    time: str | None = None,
+    rng: random.Random | None = None,
+) -> list[Event]:
+    """
+    Function for a player to make a suggestion in the room they are in. The
+    suggested character is moved into the room, and the first player after the
+    suggestor holding one of the suggested cards (that the suggestor has not
+    seen) shows them one of those cards at random.
+
+    Returns:
+        The Suggested event followed by the Disproved event, which holds the
+        disprover and card or None for both if nobody could disprove it
+    """
+    if not player:
+        raise RuleError(HttpEnum.bad_request, "player making suggestion is unspecified")
+    if person is None or weapon is None or room is None:
+        raise RuleError(HttpEnum.bad_request, "suggestion details unspecified")
+
+    try:
+        # get the character represented by the current player
+        character = game.get_character(player)
+    except KeyError:
+        raise RuleError(HttpEnum.not_found, "Suggestor is unknown to the game")
+
+    if game.current_turn.phase != "suggest" and not game.moved_by_suggest[character]:
+        raise RuleError(HttpEnum.bad_request, "Game phase not in the suggestion phase")
+
+    # Ensure the suggestor is in the same room as the suggestion they are making
+    if game.get_location(character) != room:
+        raise RuleError(
+            HttpEnum.forbidden,
+            "Suggestor is unable to make this suggestion -- suggestor is not in the room where the suggestion is being made",
+        )
+
+    suggested = Suggested(player, person, weapon, room, time or get_time())
+
+    # find the first player after the suggestor, in player order, holding a card
+    # from the suggestion that the suggestor has not seen before
+    disprover = game.find_disprover(player, cards_to_mask([person, weapon, room]))
+    if disprover:
+        # if there are any overlapping cards, show one of them randomly
+        shown_by, overlap = disprover
+        card = (rng or random).choice(mask_to_cards(overlap))
+        disproved = Disproved(player, shown_by, card, suggested.time)
+    else:
+        disproved = Disproved(player, None, None, suggested.time)
+
+    return _apply(game, [suggested, disproved])
+
+
+def accuse(
+    game: GameState,
+    player: str,
+    person: PlayerEnum | None,
+    weapon: WeaponEnum | None,
+    room: RoomEnum | HallEnum | None,
+    time: str | None = None,
+) -> list[Event]:
+    """
+    Function for a player to make an accusation, or pass on making one when all
+    details are None. A correct accusation wins the game, a wrong one leaves the
+    player only able to disprove suggestions.
+    """
+    if game.current_turn.phase != "accuse":
+        raise RuleError(HttpEnum.bad_request, "Game phase not in the accusation phase")
+    return _apply(game, [Accused(player, person, weapon, room, time or get_time())])
+
+
+def chat(
+    game: GameState, player: str, message: str, time: str | None = None
+) -> list[Event]:
+    if player not in game.player_username_mapping:
+        raise RuleError(HttpEnum.not_found, "Player is unknown to the game")
+    return _apply(game, [Chatted(player, message, time or get_time())])
+
+
+def legal_moves(game: GameState, player: str) -> list[RoomEnum | HallEnum]:
+    """
+    Function to list every location a player's character can move to
+    """
+    location = game.get_location(game.get_character(player))
+    reachable = ADJACENCY_MASKS[location] & ~(game.occupancy & HALLWAY_MASK)
+    return [target for target in LOCATIONS if reachable & LOCATION_BITS[target]]
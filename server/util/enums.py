@@ -53,11 +53,13 @@ class HttpEnum(IntEnum):
     forbidden = 403
     not_found = 404
     timeout = 408
+    conflict = 409
     good = 200
     created = 201
     accepted = 202
     no_content = 204
     internal_error = 500
+    service_unavailable = 503
 
 
 class EndGameEnum(IntEnum):
@@ -0,0 +1,104 @@
+from itertools import accumulate
+import random
+import time
+
+from util.cards import CARDS, CARD_BITS, ALL_CARDS_MASK, mask_to_cards
+from util.notebook import KINDS, SOLUTION, Notebook
+
+# Names of the kinds of cards, in the order of notebook.KINDS
+KIND_NAMES = ("person", "weapon", "room")
+
+# Trials between two looks at the clock
+CHECK_EVERY = 256
+
+
+def sample(
+    notebook: Notebook, samples: int, deadline: float, seed: int
+) -> tuple[list[int], int, int]:
+    """
+    Function to draw random deals of the cards consistent with everything a
+    notebook knows, until enough are found or time.monotonic() passes the
+    deadline. The clock is the same for every process on a machine, so the
+    deadline can be set by the process handing the work out, which also
+    covers the time the work waited for a worker. Each trial picks
+    one of the solutions the notebook allows at random and shuffles the other
+    unplaced cards into the hands, the trial is kept if every player could
+    hold the cards they got. As the number of shuffles is the same for every
+    solution, the solutions of the kept deals follow the chance of each one
+    being right when the cards were dealt at random.
+
+    Returns:
+        How many kept deals had each card (by card id) in the solution, how
+        many deals were kept and how many were tried
+    """
+    rng = random.Random(seed)
+    possible, held, sizes = notebook.possible, notebook.held, notebook.sizes
+    players = [
+        player for player in range(notebook.num_players) if player != notebook.player
+    ]
+
+    # the cards of each kind the solution could be, as bits
+    choices = [
+        [CARD_BITS[card] for card in mask_to_cards(notebook.candidates & kind)]
+        for kind in KINDS
+    ]
+    # the cards nobody is known to hold, and where each player's free slots end
+    placed = 0
+    for owner in range(SOLUTION, notebook.num_players):
+        placed |= held[owner]
+    unplaced = ALL_CARDS_MASK & ~placed
+    ends = list(
+        accumulate(sizes[player] - held[player].bit_count() for player in players)
+    )
+    accusations = set(notebook.accusations)
+
+    counts = [0] * len(CARDS)
+    kept = trials = 0
+    while kept < samples:
+        if trials % CHECK_EVERY == 0 and time.monotonic() > deadline:
+            break
+        trials += 1
+
+        person, weapon, room = (rng.choice(bits) for bits in choices)
+        solution = person | weapon | room
+        if solution in accusations:
+            continue
+
+        cards = [CARD_BITS[card] for card in mask_to_cards(unplaced & ~solution)]
+        rng.shuffle(cards)
+        start = 0
+        for player, end in zip(players, ends):
+            hand = 0
+            for card in cards[start:end]:
+                hand |= card
+            if hand & ~possible[player]:
+                break
+            start = end
+        else:
+            kept += 1
+            for card in (person, weapon, room):
+                counts[card.bit_length() - 1] += 1
+
+    return counts, kept, trials
+
+
+def probabilities(notebook: Notebook, counts: list[int], kept: int) -> dict:
+    """
+    Function to turn the counts of kept deals into the chance of each card
+    being in the solution, for each kind of card. Without any kept deal every
+    solution the notebook allows is taken to be as likely as the others.
+    """
+    if not kept:
+        counts = [0] * len(CARDS)
+        solutions = notebook.solutions()
+        for solution in solutions:
+            for card in solution:
+                counts[CARDS.index(card)] += 1
+        kept = len(solutions)
+
+    return {
+        name: {
+            card.value: counts[CARDS.index(card)] / kept for card in mask_to_cards(kind)
+        }
+        for name, kind in zip(KIND_NAMES, KINDS)
+    }
@@ -0,0 +1,295 @@
+from dataclasses import dataclass, fields
+from types import UnionType
+from typing import Dict, Iterable, get_args, get_origin, get_type_hints
+from util.enums import PlayerEnum, WeaponEnum, RoomEnum, HallEnum, EndGameEnum
+from util.functions import location_str
+from util.game_state import GameSolution, GameState
+from util.cards import cards_to_mask
+
+
+@dataclass(frozen=True)
+class Event:
+    """
+    Base class of everything that can happen in a game. A game is the result of
+    applying its events in order to the state built by its GameCreated event,
+    events carry everything needed (including the time they happened and any
+    random choices) so replaying them rebuilds exactly the same state.
+    """
+
+    def apply(self, game: GameState) -> None:
+        """
+        Apply the event to a game, changing it in place
+        """
+        self._apply(game)
+        game.event_count += 1
+
+    def _apply(self, game: GameState) -> None:
+        raise NotImplementedError
+
+    def to_dict(self) -> dict:
+        """
+        Member function that converts the event into plain JSON friendly values
+        """
+        output = {"type": type(self).__name__}
+        for field in fields(self):
+            output[field.name] = _encode(getattr(self, field.name))
+        return output
+
+
+@dataclass(frozen=True)
+class GameCreated(Event):
+    """
+    Always the first event of a game, holds everything that was randomly chosen
+    when the game was set up
+    """
+
+    num_players: int
+    person: PlayerEnum
+    weapon: WeaponEnum
+    room: RoomEnum
+    player_character_mapping: Dict[str, PlayerEnum]
+
+    @classmethod
+    def from_game(cls, game: GameState) -> "GameCreated":
+        return cls(
+            num_players=len(game.player_order),
+            person=game.solution.person,
+            weapon=game.solution.weapon,
+            room=game.solution.room,
+            player_character_mapping=dict(game.player_character_mapping),
+        )
+
+    def create(self) -> GameState:
+        """
+        Build the game this event describes
+        """
+        game = GameState(
+            self.num_players,
+            GameSolution(self.person, self.weapon, self.room),
+            dict(self.player_character_mapping),
+        )
+        game.event_count = 1
+        return game
+
+    def apply(self, game: GameState) -> None:
+        # The game is built from this event by create(), so applying it
+        # to an existing game only has to count it
+        game.event_count += 1
+
+
+@dataclass(frozen=True)
+class Joined(Event):
+    player: str
+    username: str
+
+    def _apply(self, game: GameState) -> None:
+        game.set_username(self.player, self.username)
+        game.add_log(
+            f'"{self.username}" has joined the game as {game.get_character(self.player).value}'
+        )
+
+
+@dataclass(frozen=True)
+class Moved(Event):
+    player: str
+    location: HallEnum | RoomEnum
+    time: str
+
+    def _apply(self, game: GameState) -> None:
+        character = game.get_character(self.player)
+        game.reset_player_moved_by_suggest(character)
+        game.move_character(character, self.location)
+
+        # Players entering a room can make a suggestion,
+        # players in Hallways can still make Accusations
+        if isinstance(self.location, RoomEnum):
+            game.next_phase("suggest")
+        else:
+            game.next_phase("accuse")
+
+        game.add_log(
+            f"{self.time} - {character.value} moved to {location_str(self.location)}."
+        )
+
+
+@dataclass(frozen=True)
+class Suggested(Event):
+    player: str
+    person: PlayerEnum
+    weapon: WeaponEnum
+    room: HallEnum | RoomEnum
+    time: str
+
+    def _apply(self, game: GameState) -> None:
+        character = game.get_character(self.player)
+        game.reset_player_moved_by_suggest(character)
+
+        game.add_log(
+            f"{game.player_username_mapping[self.player]} suggests {self.person.value} with the {self.weapon.value} in the {self.room.value}"
+        )
+        game.add_log(
+            f"{self.time} - Moving suggested character {self.person.value} to {location_str(self.room)}"
+        )
+
+        # Move the suggested character into the room and mark them as having
+        # been moved by a suggestion, unless they made it
+        game.move_character(self.person, self.room)
+        if self.person != character:
+            game.set_player_moved_by_suggest(self.person)
+        game.notebooks[self.player].suggested(
+            cards_to_mask([self.person, self.weapon, self.room])
+        )
+
+
+@dataclass(frozen=True)
+class Disproved(Event):
+    """
+    The outcome of a suggestion, disprover and card are None when nobody could
+    disprove it
+    """
+
+    suggestor: str
+    disprover: str | None
+    card: PlayerEnum | WeaponEnum | RoomEnum | None
+    time: str
+
+    def _apply(self, game: GameState) -> None:
+        username = game.player_username_mapping[self.suggestor]
+        disprover = (
+            None if self.disprover is None else game.player_order.index(self.disprover)
+        )
+        game.notebooks[self.suggestor].disproved(disprover, self.card)
+        if self.card is not None:
+            game.mark_seen(self.suggestor, self.card)
+            game.add_log(f"{self.time} - {username}'s suggestion was disproved.")
+        else:
+            game.add_log(f"{self.time} - {username}'s suggestion was not disproved.")
+        game.next_phase("accuse")
+
+
+@dataclass(frozen=True)
+class Accused(Event):
+    """
+    An accusation, or the player passing on making one when every detail is None
+    """
+
+    player: str
+    person: PlayerEnum | None
+    weapon: WeaponEnum | None
+    room: HallEnum | RoomEnum | None
+    time: str
+
+    def _apply(self, game: GameState) -> None:
+        username = game.player_username_mapping[self.player]
+
+        # No accusation, move to the next player
+        if not (self.person or self.weapon or self.room):
+            game.add_log(f"{self.time} - {username} opted to not make an accusation.")
+            game.next_player()
+            game.next_phase("move")
+            return
+
+        game.add_log(
+            f"{self.time} - {username} made an accusation of {self.person.value} in {location_str(self.room)} with the {self.weapon.value}."
+        )
+        # If the accusation is correct, end the game
+        if cards_to_mask([self.person, self.weapon, self.room]) == game.solution.mask:
+            game.add_log(
+                f"{self.time} - {username} uncovered all the Clues and won the game!"
+            )
+            game.end_game(EndGameEnum.winner_found)
+        # Otherwise, the player can continue playing only as an observor to disprove
+        # suggestions; i.e. they cannot move, make suggestions or accusations.
+        else:
+            game.add_log(
+                f"{self.time} - {username}'s accusation was incorrect; they are now a spectator"
+            )
+            for notebook in game.notebooks.values():
+                notebook.accused(cards_to_mask([self.person, self.weapon, self.room]))
+            game.next_player()
+            game.moveable_players.remove(self.player)
+            if len(game.moveable_players) == 0:
+                game.end_game(EndGameEnum.no_winners)
+            game.next_phase("move")
+
+
+@dataclass(frozen=True)
+class Chatted(Event):
+    player: str
+    message: str
+    time: str
+
+    def _apply(self, game: GameState) -> None:
+        game.add_chat(
+            f'{self.time} - {game.player_username_mapping[self.player]}: "{self.message}"'
+        )
+
+
+EVENT_TYPES = {
+    cls.__name__: cls
+    for cls in [GameCreated, Joined, Moved, Suggested, Disproved, Accused, Chatted]
+}
+
+# The fields of each event type with their type hints, resolving the hints is
+# far slower than decoding an event so it is only done once
+EVENT_FIELDS = {
+    name: [(field.name, get_type_hints(cls)[field.name]) for field in fields(cls)]
+    for name, cls in EVENT_TYPES.items()
+}
+
+
+def event_from_dict(data: dict) -> Event:
+    """
+    Function to rebuild an event from the output of Event.to_dict
+    """
+    name = data["type"]
+    return EVENT_TYPES[name](
+        **{field: _decode(hint, data[field]) for field, hint in EVENT_FIELDS[name]}
+    )
+
+
+def replay(events: Iterable[Event], game: GameState | None = None) -> GameState:
+    """
+    Function to rebuild a game from its events. If a game (usually a snapshot) is
+    given the events are applied on top of it, otherwise the first event must be
+    the game's GameCreated event.
+    """
+    events = iter(events)
+    if game is None:
+        created = next(events)
+        if not isinstance(created, GameCreated):
+            raise ValueError("A game must start with a GameCreated event.", created)
+        game = created.create()
+    for event in events:
+        event.apply(game)
+    return game
+
+
+def _encode(value):
+    if isinstance(value, (PlayerEnum, WeaponEnum, RoomEnum, HallEnum)):
+        return value.value
+    if isinstance(value, dict):
+        return {key: _encode(item) for key, item in value.items()}
+    return value
+
+
+def _decode(hint, value):
+    if value is None:
+        return None
+    if isinstance(hint, UnionType):
+        for option in get_args(hint):
+            if option is type(None):
+                continue
+            try:
+                return _decode(option, value)
+            except (ValueError, TypeError):
+                continue
+        raise ValueError("Value does not match any type.", hint, value)
+    if get_origin(hint) is dict:
+        _, item_hint = get_args(hint)
+        return {key: _decode(item_hint, item) for key, item in value.items()}
+    if hint in (PlayerEnum, WeaponEnum, RoomEnum, HallEnum):
+        return hint(value)
+    if hint in (int, str) and not isinstance(value, hint):
+        raise TypeError("Unexpected value.", hint, value)
+    return value
@@ -20,6 +20,26 @@ def location_str(location: RoomEnum | HallEnum) -> str:
         return f"hallway{location.value}"
 
 
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    """
+    Function to check an If-None-Match header against the current ETag
+
+    Args:
+        if_none_match {str | None}: The raw header value sent by the client
+        etag {str}: The ETag of the current resource
+
+    Returns:
+        True if the client's copy is current, False otherwise
+    """
+    if not if_none_match:
+        return False
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*" or candidate.removeprefix("W/") == etag:
+            return True
+    return False
+
+
 def get_character_location(
     character: PlayerEnum | None, gs: GameState
 ) -> RoomEnum | HallEnum:
@@ -34,7 +54,7 @@ def get_character_location(
         location {RoomEnum | HallEnum}: The location of the player
         None: If the player does not exist, should NOT happen
     """
-    for location in gs.map:
-        if character in gs.map[location]:
-            return location
-    raise ValueError("Character not found.", character)
+    try:
+        return gs.character_locations[character]
+    except KeyError:
+        raise ValueError("Character not found.", character)
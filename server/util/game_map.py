@@ -71,3 +71,34 @@ MAP = {
         ]
     ),
 }
+
+# The board compiled into bitmasks, every location gets an integer id (its
+# position in LOCATIONS) and a set of locations is an int with those bits set.
+# This turns adjacency and occupancy checks into a couple of bitwise operations.
+LOCATIONS = list(RoomEnum) + list(HallEnum)
+LOCATION_IDS = {location: i for i, location in enumerate(LOCATIONS)}
+LOCATION_BITS = {location: 1 << i for i, location in enumerate(LOCATIONS)}
+
+ADJACENCY_MASKS = {
+    location: sum(LOCATION_BITS[neighbour] for neighbour in neighbours)
+    for location, neighbours in MAP.items()
+}
+
+HALLWAY_MASK = sum(LOCATION_BITS[hallway] for hallway in HallEnum)
+
+
+def can_move_from(location: RoomEnum | HallEnum, occupancy: int) -> bool:
+    """
+    Function to check if a character at the given location has anywhere to go
+
+    Args:
+        location {RoomEnum | HallEnum}: The location of the character
+        occupancy {int}: Bitmask of every occupied location
+
+    Returns:
+        True if a possible move exists, False otherwise
+    """
+    adjacent = ADJACENCY_MASKS[location]
+    # Rooms (including secret passageways) can always be entered,
+    # hallways only when empty
+    return bool(adjacent & ~HALLWAY_MASK or adjacent & ~occupancy)
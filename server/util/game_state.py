@@ -1,7 +1,20 @@
 from enum import Enum
 from util.enums import PlayerEnum, RoomEnum, HallEnum, WeaponEnum, EndGameEnum
-from util.game_map import MAP
+from util.game_map import LOCATION_BITS, can_move_from
+from util.notebook import Notebook
+from util.cards import (
+    Card,
+    CARDS,
+    CARD_BITS,
+    CARD_IDS,
+    cards_to_mask,
+    mask_to_cards,
+    mask_to_strings,
+)
 from typing import Dict
+from collections import deque
+import json
+import pickle
 from dataclasses import dataclass
 from datetime import datetime
 import random
@@ -15,6 +28,13 @@ STARTING_LOCATIONS = {
     PlayerEnum.prof_plum: HallEnum.study_to_lib,
 }
 
+# Value of GameState.card_owners for the cards in the solution
+SOLUTION_OWNER = -1
+
+# How many versions of history a game keeps for serving incremental updates,
+# clients further behind than this get a full snapshot instead
+CHANGE_JOURNAL_SIZE = 256
+
 
 class TurnPhase(str, Enum):
     move = "move"
@@ -28,7 +48,8 @@ class GameSolution:
     game's correct answer. If you want the solution to have specific values
     for test/debug purposes, then you can pass in a person, weapon, and/or
     room to the initializer. These arguments are optional, and If you don't
-    pass them in, they will be set as a random value.
+    pass them in, they will be set as a random value, drawn from rng if it is
+    given so the solution can be reproduced from a seed.
     """
 
     def __init__(
@@ -36,10 +57,13 @@ class GameSolution:
         person: PlayerEnum | None = None,
         weapon: WeaponEnum | None = None,
         room: RoomEnum | None = None,
+        rng: random.Random | None = None,
     ) -> None:
-        self.weapon = weapon if weapon else random.choice(list(WeaponEnum))
-        self.person = person if person else random.choice(list(PlayerEnum))
-        self.room = room if room else random.choice(list(RoomEnum))
+        rng = rng or random
+        self.weapon = weapon if weapon else rng.choice(list(WeaponEnum))
+        self.person = person if person else rng.choice(list(PlayerEnum))
+        self.room = room if room else rng.choice(list(RoomEnum))
+        self.mask = cards_to_mask([self.person, self.weapon, self.room])
 
     def print(self):
         print("Weapon:", self.weapon.value)
@@ -65,6 +89,20 @@ class GameTurn:
         return msg
 
 
+@dataclass
+class ChangeRecord:
+    """
+    This class records what a single version of the game state changed,
+    the log and chat lengths are stored after the change was applied so
+    entries newer than a version can be sliced off the end of each list
+    """
+
+    version: int
+    log_count: int
+    chat_count: int
+    cells: tuple = ()
+
+
 @dataclass
 class GameEvent:
     """
@@ -91,7 +129,8 @@ class GameState:
     game state object. Optionally you can pass in a GameSolution object
     if you want to have a specific solution for debug/testing purposes.
     If you leave out the solution argument then a random solution will
-    be generated for this game.
+    be generated for this game. Everything random about a new game is drawn
+    from rng if it is given, so a game can be reproduced from a seed.
     """
 
     def __init__(
@@ -99,10 +138,12 @@ class GameState:
         num_players: int,
         solution: GameSolution | None = None,
         player_character_mapping: Dict[str, PlayerEnum] | None = None,
+        rng: random.Random | None = None,
     ):
-        self.solution: GameSolution = solution if solution else GameSolution()
+        self.solution: GameSolution = solution if solution else GameSolution(rng=rng)
 
-        self.player_cards: list[list[str]] = self.deal_remaining_cards(num_players)
+        # Card bitmasks (see util/cards.py) of each player's hand, in player order
+        self.hands: list[int] = self.deal_remaining_cards(num_players)
         self.player_clues: list[list[str]] = [[] for _ in range(num_players)]
         self.current_turn: GameTurn = GameTurn()
 
@@ -114,23 +155,32 @@ class GameState:
         self.player_character_mapping: Dict[str, PlayerEnum] = (
             player_character_mapping if player_character_mapping else {}
         )
-        allCharacters = list(PlayerEnum)
+        # Characters given in the mapping are kept, the rest are picked at random
+        given = dict(self.player_character_mapping)
+        allCharacters = [c for c in PlayerEnum if c not in given.values()]
         for i in range(num_players):
+            player_id = "player" + str(i + 1)
+            if player_id in given:
+                randCharacter = given[player_id]
             # First player is always Miss Scarlet
-            if i == 0:
+            elif i == 0:
                 # Miss Scarlet will be the first in the list
                 randCharacter = allCharacters[0]
+                allCharacters.remove(randCharacter)
             else:
-                randCharacter = random.choice(allCharacters)
-
-            player_id = "player" + str(i + 1)
+                randCharacter = (rng or random).choice(allCharacters)
+                allCharacters.remove(randCharacter)
             self.player_character_mapping[player_id] = randCharacter
-            allCharacters.remove(randCharacter)
 
             self.moveable_players.append(player_id)
             self.player_order.append(player_id)
             self.player_username_mapping[player_id] = ""
 
+        # Where each character is, map holds the same information per location
+        # and both are kept in step by move_character
+        self.character_locations: Dict[PlayerEnum, RoomEnum | HallEnum] = {}
+        # Bitmask of the locations holding at least one character, see game_map
+        self.occupancy: int = 0
         self.map: Dict[RoomEnum | HallEnum, list[PlayerEnum]] = {}
         for item in list(RoomEnum) + list(HallEnum):
             self.map[item] = []
@@ -143,11 +193,25 @@ class GameState:
         for character in list(PlayerEnum):
             self.moved_by_suggest[character] = False
 
-        # sets for validating responses for the suggestion endpoint
+        # Which player holds each card, indexed by card id. Hands never change
+        # after the deal so this is built once, SOLUTION_OWNER marks the solution
+        self.card_owners: list[int] = [SOLUTION_OWNER] * len(CARDS)
+        for i, hand in enumerate(self.hands):
+            for card in mask_to_cards(hand):
+                self.card_owners[CARD_IDS[card]] = i
+
+        # card bitmasks for validating responses for the suggestion endpoint
         # uses the same keys (e.g., "player1") for cards each player has seen
-        self.playerHasSeen: Dict[str, set] = {}
+        self.seen_cards: Dict[str, int] = {}
         for K in self.player_character_mapping.keys():
-            self.playerHasSeen[K] = set()
+            self.seen_cards[K] = 0
+
+        # What each player has worked out about where the cards are, kept up
+        # to date by the events (see util/notebook.py)
+        self.notebooks: Dict[str, Notebook] = {
+            player: Notebook(i, self.hands)
+            for i, player in enumerate(self.player_order)
+        }
 
         self.victory_state = EndGameEnum.keep_playing
 
@@ -155,41 +219,213 @@ class GameState:
 
         self.chat: list[str] = []
 
+        # Bumped on every mutation so clients can tell whether their copy of
+        # the state is stale without downloading it again
+        self.version: int = 0
+        self.changes: deque[ChangeRecord] = deque(
+            [ChangeRecord(0, 0, 0)], maxlen=CHANGE_JOURNAL_SIZE
+        )
+
+        # How many events (see util/events.py) have been applied to this game
+        self.event_count: int = 0
+
+        # JSON encoded dump_to_dict output, reused until the version changes
+        self._snapshot: tuple[int, bytes] | None = None
+
+        # Solution probabilities served by /probabilities for each player, with
+        # the version they were estimated at
+        self.estimates: Dict[str, tuple[int, dict]] = {}
+
+    def __getstate__(self) -> dict:
+        # The cached snapshot and estimates are rebuilt on demand, no need to
+        # store them
+        state = self.__dict__.copy()
+        state["_snapshot"] = None
+        state["estimates"] = {}
+        return state
+
+    def copy(self) -> "GameState":
+        """
+        Utility function to get a copy of the game sharing nothing with it,
+        without the cached snapshot and estimates
+        """
+        return pickle.loads(pickle.dumps(self, pickle.HIGHEST_PROTOCOL))
+
+    def touch(self, *cells: RoomEnum | HallEnum) -> int:
+        """
+        Utility function to mark the game state as modified; returns the new version
+
+        Any map locations whose occupants changed should be passed in so they
+        are included in incremental updates
+        """
+        self.version += 1
+        self.changes.append(
+            ChangeRecord(self.version, len(self.logs), len(self.chat), cells)
+        )
+        return self.version
+
+    def add_log(self, message: str) -> None:
+        """
+        Utility function to append a message to the game log
+        """
+        self.logs.append(message)
+        self.touch()
+
+    def add_chat(self, message: str) -> None:
+        """
+        Utility function to append a message to the game chat
+        """
+        self.chat.append(message)
+        self.touch()
+
+    def set_username(self, player: str, username: str) -> None:
+        """
+        Utility function to assign a username to a player id
+        """
+        self.player_username_mapping[player] = username
+        self.touch()
+
+    def end_game(self, state: EndGameEnum) -> None:
+        """
+        Utility function to set the final victory state of the game
+        """
+        self.victory_state = state
+        self.touch()
+
+    @property
+    def player_cards(self) -> list[list[str]]:
+        """
+        The display names of the cards in each player's hand, in player order
+        """
+        return [mask_to_strings(hand) for hand in self.hands]
+
+    @property
+    def playerHasSeen(self) -> Dict[str, set[str]]:
+        """
+        The display names of the cards each player has been shown
+        """
+        return {
+            player: set(mask_to_strings(seen))
+            for player, seen in self.seen_cards.items()
+        }
+
+    def get_character(self, player: str) -> PlayerEnum:
+        """
+        Utility function to get the character a player id is playing as,
+        raises a KeyError for unknown players
+        """
+        return self.player_character_mapping[player]
+
+    def get_location(self, character: PlayerEnum) -> RoomEnum | HallEnum:
+        """
+        Utility function to get where a character is on the board,
+        raises a KeyError for unknown characters
+        """
+        return self.character_locations[character]
+
+    def find_disprover(self, suggestor: str, suggestion: int) -> tuple[str, int] | None:
+        """
+        Finds the first player after the suggestor, in player order, holding a card
+        from the suggestion (a card bitmask) which the suggestor has not seen yet.
+        Eliminated players still hold their cards and can disprove.
+
+        Returns:
+            The player and a bitmask of the cards they can show,
+            or None if nobody can disprove the suggestion
+        """
+        start = self.player_order.index(suggestor)
+        num_players = len(self.player_order)
+
+        closest = None
+        cards = 0
+        for card in mask_to_cards(suggestion & ~self.seen_cards[suggestor]):
+            owner = self.card_owners[CARD_IDS[card]]
+            if owner == SOLUTION_OWNER or owner == start:
+                continue
+            distance = (owner - start) % num_players
+            if closest is None or distance < closest:
+                closest = distance
+                cards = CARD_BITS[card]
+            elif distance == closest:
+                cards |= CARD_BITS[card]
+
+        if closest is None:
+            return None
+        return (self.player_order[(start + closest) % num_players], cards)
+
+    def mark_seen(self, player: str, card: Card | str) -> None:
+        """
+        Utility function to record that a player has been shown a card
+        """
+        self.seen_cards[player] |= CARD_BITS[card]
+        self.touch()
+
     def set_player_positions(self) -> None:
         """
         Utility function to set starting character positions
         """
+        for location in self.map:
+            self.map[location] = []
+        self.character_locations = {}
+        self.occupancy = 0
+
         characters_chosen = []
         for player in self.player_order:
             character = self.player_character_mapping[player]
             self.map[STARTING_LOCATIONS[character]] = [character]
+            self.character_locations[character] = STARTING_LOCATIONS[character]
             characters_chosen.append(character)
 
         if len(characters_chosen) != 6:
             for character in list(PlayerEnum):
                 if character not in characters_chosen:
                     self.map[RoomEnum.staging].append(character)
+                    self.character_locations[character] = RoomEnum.staging
+
+        for location in self.character_locations.values():
+            self.occupancy |= LOCATION_BITS[location]
+
+    def move_character(
+        self, character: PlayerEnum, target_location: RoomEnum | HallEnum
+    ) -> None:
+        """
+        Utility function to move a character to a new location, keeping the
+        map and the character location index consistent
+        """
+        current_location = self.character_locations[character]
+        self.map[current_location].remove(character)
+        self.map[target_location].append(character)
+        self.character_locations[character] = target_location
+
+        if not self.map[current_location]:
+            self.occupancy &= ~LOCATION_BITS[current_location]
+        self.occupancy |= LOCATION_BITS[target_location]
+        self.touch(current_location, target_location)
 
     def set_player_moved_by_suggest(self, player: PlayerEnum) -> None:
         """
         A utility function to mark a player as being moved by a suggestion
         """
         self.moved_by_suggest[player] = True
+        self.touch()
 
     def reset_player_moved_by_suggest(self, player: PlayerEnum) -> None:
         """
         A utility function to reset a player having been moved by a suggestion
         """
-        self.moved_by_suggest[player] = False
+        if self.moved_by_suggest[player]:
+            self.moved_by_suggest[player] = False
+            self.touch()
 
-    def deal_remaining_cards(self, num_players: int) -> list[list[str]]:
+    def deal_remaining_cards(self, num_players: int) -> list[int]:
         """
         This function will take in a game solution and split all
-        remaining cards into a list of n lists according to the number of players, each list
-        represents the cards a player is dealt at the beginning of the game
+        remaining cards into a list of n hands according to the number of players, each hand
+        is a card bitmask (see util/cards.py) of the cards a player is dealt at the beginning
+        of the game
 
         solution -- the correct solution (person, weapon, place) to a specific game of clue
-        num_players -- how many players, ie how many lists do the remaining cards need to be
+        num_players -- how many players, ie how many hands do the remaining cards need to be
         split into
         """
         if num_players < 2 or 6 < num_players:
@@ -206,21 +442,13 @@ class GameState:
         remaining_rooms.remove(self.solution.room)
 
         # deal all remaining items to players in order
-        player_hands = [[] for _ in range(num_players)]
+        player_hands = [0 for _ in range(num_players)]
 
         # use a global counter for all of these loops to keep the
         # total number of cards per person consistent
         i = 0
-        for person in remaining_people:
-            player_hands[i % num_players].append(person.value)
-            i += 1
-
-        for weapon in remaining_weapons:
-            player_hands[i % num_players].append(weapon.value)
-            i += 1
-
-        for room in remaining_rooms:
-            player_hands[i % num_players].append(room.value)
+        for card in remaining_people + remaining_weapons + remaining_rooms:
+            player_hands[i % num_players] |= CARD_BITS[card]
             i += 1
 
         return player_hands
@@ -242,6 +470,7 @@ class GameState:
                 continue
             else:
                 break
+        self.touch()
 
     def next_phase(self, desired_phase: str):
         """
@@ -256,42 +485,27 @@ class GameState:
         if desired_phase != "move":
             self.current_turn.phase = desired_phase
         else:
-            current_location = None
-            for location in self.map:
-                if (
-                    self.player_character_mapping[
-                        self.player_order[self.current_turn.player]
-                    ]
-                    in self.map[location]
-                ):
-                    current_location = location
-
-            if not current_location:
+            current_location = self.character_locations.get(
+                self.player_character_mapping[
+                    self.player_order[self.current_turn.player]
+                ]
+            )
+
+            if current_location is None:
                 print(
                     "Wat!? We couldn't find the player in the map. The server will probably implode now."
                 )
 
-            hall_count = 0
-            player_count = 0
-            for location in MAP[current_location]:
-                if type(location) is HallEnum:
-                    hall_count += 1
-                if self.map[location]:
-                    player_count += 1
-
-            # If the adjacent locations are not all Hallways there is a valid move
-            # A secret Passageway counts as an adjacent room not hallway
-            if hall_count != len(MAP[current_location]):
+            if can_move_from(current_location, self.occupancy):
                 self.current_turn.phase = "move"
-            # Otherwise check if all adjacent hallways are occupied
+            # Otherwise the player is in a room where all adjacent hallways are occupied
             else:
-                if player_count != len(MAP[current_location]):
-                    self.current_turn.phase = "move"
-                else:
-                    self.current_turn.phase = "accuse"
-                    self.logs.append(
-                        f"{self.current_turn.player} cannot make a valid move, skipping to accusation phase."
-                    )
+                self.current_turn.phase = "accuse"
+                self.logs.append(
+                    f"{self.current_turn.player} cannot make a valid move, skipping to accusation phase."
+                )
+
+        self.touch()
 
     def get_current_player(self) -> PlayerEnum:
         """
@@ -316,6 +530,7 @@ class GameState:
         outputDict["player_username_mapping"] = self.player_username_mapping
 
         outputDict["victory_state"] = self.victory_state
+        outputDict["version"] = self.version
 
         # player cards
         for i, card_list in enumerate(self.player_cards):
@@ -338,3 +553,76 @@ class GameState:
         outputDict["moved_by_suggest"] = self.moved_by_suggest
 
         return outputDict
+
+    def dump_to_json(self) -> bytes:
+        """
+        Member function that returns dump_to_dict already encoded as JSON.
+        The encoded bytes are cached for the current version, so every reader
+        of an unchanged game shares the same immutable snapshot and the
+        encoding work is only done once per change.
+        """
+        if self._snapshot is None or self._snapshot[0] != self.version:
+            encoded = json.dumps(
+                self.dump_to_dict(),
+                ensure_ascii=False,
+                separators=(",", ":"),
+                default=list,
+            ).encode("utf-8")
+            self._snapshot = (self.version, encoded)
+        return self._snapshot[1]
+
+    @property
+    def snapshot_size(self) -> int:
+        """
+        Size in bytes of the snapshot encoded by dump_to_json, 0 if it is not
+        encoded for the current version
+        """
+        if self._snapshot is None or self._snapshot[0] != self.version:
+            return 0
+        return len(self._snapshot[1])
+
+    def dump_changes_since(self, version: int) -> dict | None:
+        """
+        Member function that returns only what changed after the given version:
+        new log and chat entries, map locations whose occupants changed and the
+        small fields which are always sent in full. Returns None when the version
+        is too old (or unknown) to be answered from the change journal, in which
+        case the caller should fall back to dump_to_dict
+        """
+        oldest = self.changes[0].version
+        if version < oldest or version > self.version:
+            return None
+        since = self.changes[version - oldest]
+
+        cells = set()
+        for i in range(version - oldest + 1, len(self.changes)):
+            cells.update(self.changes[i].cells)
+
+        outputDict = {}
+        outputDict["since_version"] = version
+        outputDict["version"] = self.version
+        outputDict["victory_state"] = self.victory_state
+        outputDict["moved_by_suggest"] = self.moved_by_suggest
+        outputDict["player_username_mapping"] = self.player_username_mapping
+        outputDict["playerHasSeen"] = self.playerHasSeen
+        outputDict["game_phase"] = {
+            "phase": self.current_turn.phase,
+            "player": self.player_order[self.current_turn.player],
+        }
+        outputDict["map"] = {cell: self.map[cell] for cell in cells}
+        outputDict["logs"] = self.logs[since.log_count :][::-1]
+        outputDict["chat"] = self.chat[since.chat_count :][::-1]
+
+        return outputDict
+
+    def dump_changes_to_json(self, version: int) -> bytes | None:
+        """
+        Member function that returns dump_changes_since encoded as JSON the same
+        way as dump_to_json, None when the version is too old (or unknown)
+        """
+        changes = self.dump_changes_since(version)
+        if changes is None:
+            return None
+        return json.dumps(
+            changes, ensure_ascii=False, separators=(",", ":"), default=list
+        ).encode("utf-8")
@@ -0,0 +1,24 @@
+from weakref import WeakValueDictionary
+import asyncio
+
+
+class KeyedLocks:
+    """
+    One asyncio lock per game key. Handlers hold the lock of their game from
+    reading it until their changes are committed, so requests for the same game
+    are handled one at a time while requests for different games still run
+    concurrently. A lock only exists while a handler holds or waits for it.
+    """
+
+    def __init__(self) -> None:
+        self._locks: WeakValueDictionary[str, asyncio.Lock] = WeakValueDictionary()
+
+    def __call__(self, key: str | None) -> asyncio.Lock:
+        lock = self._locks.get(key)
+        if lock is None:
+            lock = asyncio.Lock()
+            self._locks[key] = lock
+        return lock
+
+    def __len__(self) -> int:
+        return len(self._locks)
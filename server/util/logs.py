@@ -0,0 +1,176 @@
+from logging.handlers import QueueHandler, QueueListener
+import atexit
+import json
+import logging
+import queue
+import sys
+import time
+
+# Attributes of every LogRecord, anything else on a record was given in extra
+# and is written as a field of its own (but for uvicorn's terminal colors)
+RECORD_ATTRIBUTES = set(logging.makeLogRecord({}).__dict__) | {
+    "message",
+    "sample",
+    "color_message",
+}
+
+# Loggers of the server running the app, which write from the event loop with
+# handlers of their own unless taken over
+SERVER_LOGGERS = ("uvicorn", "uvicorn.error", "uvicorn.access")
+
+# Records waiting for the background thread, past this new records are dropped
+# rather than letting a slow stream hold up requests
+QUEUE_SIZE = 10000
+
+
+def parse_settings(text: str) -> dict[str, str]:
+    """
+    Utility function to read "name=value,name=value" settings, as used by
+    CLUELESS_LOG_LEVELS and CLUELESS_LOG_SAMPLE
+    """
+    settings = {}
+    for item in text.split(","):
+        if item.strip():
+            name, _, value = item.partition("=")
+            settings[name.strip()] = value.strip()
+    return settings
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    Writes each record as one line of JSON: the time, level, logger and message
+    along with every field given in the extra of the logging call
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        fields = {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(record.created))
+            + f".{int(record.msecs):03d}Z",
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for name, value in record.__dict__.items():
+            if name not in RECORD_ATTRIBUTES:
+                fields[name] = value
+        if record.exc_info:
+            record.exc_text = record.exc_text or self.formatException(record.exc_info)
+        if record.exc_text:
+            fields["exception"] = record.exc_text
+        return json.dumps(fields, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Keeps one record in every rate[event] of the records logged with that
+    event in their extra (e.g. extra={"event": "move"}), or in every
+    rate[name] of the records of the logger with that name. Other records
+    are all kept. A record can also carry its own rate as extra={"sample": n}.
+    Kept records of a sampled event say how many records they stand for in
+    their "sampled" field.
+    """
+
+    def __init__(self, rates: dict[str, int] | None = None) -> None:
+        super().__init__()
+        self.rates = rates or {}
+        self.counts: dict[str, int] = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        event = getattr(record, "event", None)
+        rate = (
+            getattr(record, "sample", None)
+            or self.rates.get(event)
+            or self.rates.get(record.name)
+        )
+        if not rate or rate <= 1:
+            return True
+        key = event or record.name
+        count = self.counts.get(key, 0)
+        self.counts[key] = count + 1
+        if count % rate:
+            return False
+        record.sampled = rate
+        return True
+
+
+class BackgroundHandler(QueueHandler):
+    """
+    Hands records to a QueueListener writing them from its own thread, so
+    formatting and writing never happen on the event loop. The message is
+    only formatted by the listener, so the arguments of a logging call
+    must not be changed after it.
+    """
+
+    def __init__(self, records: queue.SimpleQueue, size: int = QUEUE_SIZE) -> None:
+        super().__init__(records)
+        self.size = size
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # tracebacks hold on to every frame, turn them into text now
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        # a SimpleQueue has no size limit but is several times cheaper to put
+        # to than a Queue, qsize is only an estimate which is good enough here
+        if self.queue.qsize() >= self.size:
+            self.dropped += 1
+            return
+        self.queue.put_nowait(record)
+
+
+def setup_logging(
+    level: str = "INFO",
+    levels: dict[str, str] | None = None,
+    rates: dict[str, int] | None = None,
+    structured: bool = True,
+    stream=None,
+) -> QueueListener:
+    """
+    Function to send every log record through a background thread, including
+    those of the server running the app (see SERVER_LOGGERS)
+
+    Args:
+        level: level of the root logger
+        levels: level of other loggers, by logger name (e.g. {"util.store": "DEBUG"})
+        rates: sampling rate of high volume events, see SamplingFilter
+        structured: write JSON lines if True, plain text otherwise
+        stream: where to write, stderr by default
+
+    Returns:
+        The started listener, stopped on exit once it has written what is left
+    """
+    output = logging.StreamHandler(stream or sys.stderr)
+    output.setFormatter(
+        JsonFormatter()
+        if structured
+        else logging.Formatter("%(levelname)s: %(name)s: %(message)s")
+    )
+
+    # Records are only written with the fields below, skip looking up where each
+    # logging call was made from and which thread and process made it
+    logging._srcfile = None
+    logging.logThreads = logging.logProcesses = logging.logMultiprocessing = False
+
+    handler = BackgroundHandler(queue.SimpleQueue())
+    handler.addFilter(SamplingFilter(rates))
+    root = logging.getLogger()
+    for old in list(root.handlers):
+        root.removeHandler(old)
+    root.addHandler(handler)
+    root.setLevel(level.upper())
+    for name in SERVER_LOGGERS:
+        server_logger = logging.getLogger(name)
+        for old in list(server_logger.handlers):
+            server_logger.removeHandler(old)
+        server_logger.propagate = True
+    for name, name_level in (levels or {}).items():
+        logging.getLogger(name).setLevel(name_level.upper())
+
+    listener = QueueListener(handler.queue, output, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
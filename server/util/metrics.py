@@ -0,0 +1,234 @@
+from bisect import bisect_left
+import os
+import resource
+import time
+
+# Upper bounds, in seconds, of the request latency histogram buckets
+LATENCY_BUCKETS = (
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+)
+
+# Content type of the Prometheus text exposition format
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    escaped = (
+        (name, str(value).replace("\\", r"\\").replace('"', r"\"").replace("\n", r"\n"))
+        for name, value in labels.items()
+    )
+    return "{" + ",".join(f'{name}="{value}"' for name, value in escaped) + "}"
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+def family(
+    name: str, kind: str, description: str, samples: list[tuple[dict, float]]
+) -> str:
+    """
+    Function to write one metric in the Prometheus text format
+
+    Args:
+        name: name of the metric
+        kind: its type, "counter", "gauge" or "histogram"
+        description: one line describing it
+        samples: the labels and value of each sample, for histograms the
+            labels may hold the suffix of the sample name under "__suffix__"
+    """
+    lines = [f"# HELP {name} {description}", f"# TYPE {name} {kind}"]
+    for labels, value in samples:
+        labels = dict(labels)
+        suffix = labels.pop("__suffix__", "")
+        lines.append(f"{name}{suffix}{_labels(labels)} {_number(value)}")
+    return "\n".join(lines) + "\n"
+
+
+class Histogram:
+    """
+    Counts of observed values in cumulative buckets, as Prometheus histograms
+    """
+
+    def __init__(self, buckets: tuple[float, ...] = LATENCY_BUCKETS) -> None:
+        self.buckets = buckets
+        # the last count is for values above every bucket
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def samples(self, labels: dict) -> list[tuple[dict, float]]:
+        """
+        The samples of the histogram for the given labels
+        """
+        samples = []
+        total = 0
+        for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+            total += count
+            samples.append(
+                ({"__suffix__": "_bucket", **labels, "le": _number(bound)}, total)
+            )
+        samples.append(({"__suffix__": "_sum", **labels}, self.sum))
+        samples.append(({"__suffix__": "_count", **labels}, self.count))
+        return samples
+
+
+class RequestMetrics:
+    """
+    Counts, latency histograms and bytes sent of the HTTP requests to each
+    route, kept by MetricsMiddleware. Routes are the path templates of the
+    app (e.g. /internal/games/{key}), requests matching none are counted
+    under "unmatched" so unknown paths cannot add labels without bound.
+    """
+
+    def __init__(self) -> None:
+        self.requests: dict[tuple[str, str, int], int] = {}
+        self.latency: dict[tuple[str, str], Histogram] = {}
+        self.response_bytes: dict[tuple[str, str], int] = {}
+        # /State responses and the bytes of their bodies, by kind of response
+        self.state_responses: dict[str, int] = {}
+        self.state_bytes: dict[str, int] = {}
+
+    def observe(
+        self, method: str, route: str, status: int, seconds: float, size: int
+    ) -> None:
+        key = (method, route)
+        self.requests[key + (status,)] = self.requests.get(key + (status,), 0) + 1
+        histogram = self.latency.get(key)
+        if histogram is None:
+            histogram = self.latency[key] = Histogram()
+        histogram.observe(seconds)
+        self.response_bytes[key] = self.response_bytes.get(key, 0) + size
+
+    def observe_state(self, kind: str, size: int) -> None:
+        """
+        Count a /State response of the given kind: "full" for the whole state,
+        "delta" for the changes since a version or "not_modified" for a 304
+        """
+        self.state_responses[kind] = self.state_responses.get(kind, 0) + 1
+        self.state_bytes[kind] = self.state_bytes.get(kind, 0) + size
+
+    def render(self) -> str:
+        """
+        The metrics in the Prometheus text format
+        """
+        return (
+            family(
+                "clueless_http_requests_total",
+                "counter",
+                "HTTP requests handled, by route and status.",
+                [
+                    ({"method": method, "route": route, "status": status}, count)
+                    for (method, route, status), count in sorted(self.requests.items())
+                ],
+            )
+            + family(
+                "clueless_http_request_duration_seconds",
+                "histogram",
+                "Time from receiving an HTTP request to sending all of its response.",
+                [
+                    sample
+                    for (method, route), histogram in sorted(self.latency.items())
+                    for sample in histogram.samples({"method": method, "route": route})
+                ],
+            )
+            + family(
+                "clueless_http_response_bytes_total",
+                "counter",
+                "Bytes of HTTP response bodies sent, by route.",
+                [
+                    ({"method": method, "route": route}, size)
+                    for (method, route), size in sorted(self.response_bytes.items())
+                ],
+            )
+            + family(
+                "clueless_state_responses_total",
+                "counter",
+                "/State responses, by kind: full state, delta or not_modified.",
+                [
+                    ({"kind": kind}, n)
+                    for kind, n in sorted(self.state_responses.items())
+                ],
+            )
+            + family(
+                "clueless_state_response_bytes_total",
+                "counter",
+                "Bytes of /State response bodies sent, by kind.",
+                [({"kind": kind}, n) for kind, n in sorted(self.state_bytes.items())],
+            )
+        )
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware recording every HTTP request in a RequestMetrics, websocket
+    connections are passed through as they are
+    """
+
+    def __init__(self, app, metrics: RequestMetrics) -> None:
+        self.app = app
+        self.metrics = metrics
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status = 500
+        size = 0
+
+        async def record(message) -> None:
+            nonlocal status, size
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            elif message["type"] == "http.response.body":
+                size += len(message.get("body", b""))
+                if not message.get("more_body", False):
+                    # the router sets the matched route on the scope
+                    route = scope.get("route")
+                    self.metrics.observe(
+                        scope["method"],
+                        getattr(route, "path", "unmatched"),
+                        status,
+                        time.perf_counter() - start,
+                        size,
+                    )
+            await send(message)
+
+        await self.app(scope, receive, record)
+
+
+def resident_memory() -> int:
+    """
+    Utility function to get the resident set size of this process in bytes,
+    where /proc is missing it is the peak size instead
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # reported in bytes on macOS and in kilobytes elsewhere
+        return peak if os.uname().sysname == "Darwin" else peak * 1024
@@ -1,30 +1,7 @@
 from util.game_state import GameState
-from util.enums import PlayerEnum, RoomEnum, HallEnum, HttpEnum
+from util.enums import RoomEnum, HallEnum, HttpEnum
 from util.actions import MoveAction
-from util.game_map import MAP
-
-
-def move_player(
-    character: PlayerEnum | None,
-    target_location: RoomEnum | HallEnum | None,
-    current_location: RoomEnum | HallEnum | None,
-    gs: GameState,
-) -> None:
-    """
-    Function to move a player in the map within the game state.
-    Removes player from current location and adds them to the new location.
-    Atomized function, no safe guards employed
-
-    Args:
-        movement {MoveAction}: The Move desired by the player
-        current_location {RoomEnum | HallEnum}: Current location of player
-        gs {GameState}: Current game state
-
-    Returns:
-        None
-    """
-    gs.map[current_location].remove(character)
-    gs.map[target_location].append(character)
+from util.game_map import ADJACENCY_MASKS, HALLWAY_MASK, LOCATION_BITS, can_move_from
 
 
 def validate_move(
@@ -47,12 +24,14 @@ def validate_move(
     if gs.current_turn.phase != "move":
         return (HttpEnum.bad_request, "Wrong phase of the game to perform a move.")
 
+    target = LOCATION_BITS.get(movement.location, 0)
+
     # Check if desired location is adjacent to the current location
-    if movement.location not in MAP[current_location]:
+    if not ADJACENCY_MASKS[current_location] & target:
         return (HttpEnum.bad_request, "Invalid location to move to.")
 
     # Check if desired location is a Hallway and if that hallway is occupied
-    if isinstance(movement.location, HallEnum) and len(gs.map[movement.location]) >= 1:
+    if gs.occupancy & HALLWAY_MASK & target:
         return (HttpEnum.bad_request, "Cannot move to an occupied hallway.")
 
     # Great Success!
@@ -69,21 +48,4 @@ def does_possible_move_exist(
     Returns:
         True if a possible move exists, False otherwise
     """
-    hall_count = 0
-    player_count = 0
-    for location in MAP[current_location]:
-        if type(location) is HallEnum:
-            hall_count += 1
-        if gs.map[location]:
-            player_count += 1
-
-    # If the adjacent locations are not all Hallways return True
-    # A secret Passageway counts as an adjacent room not hallway
-    if hall_count != len(MAP[current_location]):
-        return True
-    # Otherwise check if all adjacent hallways are occupied
-    else:
-        if player_count != len(MAP[current_location]):
-            return True
-        else:
-            return False
+    return can_move_from(current_location, gs.occupancy)
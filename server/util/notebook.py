@@ -0,0 +1,174 @@
+from itertools import product
+
+from util.cards import (
+    ALL_CARDS_MASK,
+    CARDS,
+    CARD_BITS,
+    PERSON_MASK,
+    WEAPON_MASK,
+    ROOM_MASK,
+    Card,
+    mask_to_cards,
+    mask_to_strings,
+)
+
+# Owner index of the solution, the same as util.game_state.SOLUTION_OWNER so the
+# owners of a notebook are indexed like GameState.card_owners
+SOLUTION = -1
+
+KINDS = (PERSON_MASK, WEAPON_MASK, ROOM_MASK)
+
+
+class Notebook:
+    """
+    The detective notebook of one player: for every owner (each player, and the
+    solution at index SOLUTION) the card bitmask of the cards it could hold and
+    of the cards it is known to hold. It only uses what the player knows: their
+    hand, the size of every hand, the outcome of their own suggestions and the
+    wrong accusations made by anyone.
+
+    Every observation changes a few bits and then runs the deduction rules until
+    nothing changes. Cards an owner could hold only ever get removed and cards
+    it is known to hold only ever get added, so this always ends and never needs
+    to start over from the whole history of the game.
+    """
+
+    def __init__(self, player: int, hands: list[int]) -> None:
+        self.player = player
+        self.num_players = len(hands)
+        # number of cards each owner holds, the solution last
+        self.sizes = [hand.bit_count() for hand in hands] + [len(KINDS)]
+
+        others = ALL_CARDS_MASK & ~hands[player]
+        self.possible = [others] * (self.num_players + 1)
+        self.held = [0] * (self.num_players + 1)
+        self.possible[player] = self.held[player] = hands[player]
+
+        # cards shown to the player, and the wrong accusations as card bitmasks
+        self.shown = 0
+        self.accusations: list[int] = []
+        # the player's suggestion waiting for its outcome
+        self._suggestion = 0
+        self._propagate()
+
+    def suggested(self, suggestion: int) -> None:
+        """
+        Record the card bitmask of a suggestion made by the player
+        """
+        self._suggestion = suggestion
+
+    def disproved(self, disprover: int | None, card: Card | None) -> None:
+        """
+        Record the outcome of the player's last suggestion. Each player asked
+        before the disprover, or everybody if nobody could disprove it, holds
+        none of the suggested cards the player had not been shown yet.
+        """
+        unseen = self._suggestion & ~self.shown
+        stop = self.player if disprover is None else disprover
+        other = (self.player + 1) % self.num_players
+        while other != stop:
+            self.possible[other] &= ~unseen
+            other = (other + 1) % self.num_players
+
+        if card is not None:
+            self.shown |= CARD_BITS[card]
+            self.held[disprover] |= CARD_BITS[card]
+        self._suggestion = 0
+        self._propagate()
+
+    def accused(self, accusation: int) -> None:
+        """
+        Record the card bitmask of a wrong accusation by any player
+        """
+        self.accusations.append(accusation)
+        self._propagate()
+
+    def _propagate(self) -> None:
+        possible, held, sizes = self.possible, self.held, self.sizes
+        owners = range(SOLUTION, self.num_players)
+        while True:
+            before = (possible.copy(), held.copy())
+
+            # a card is held by one owner, and the only one who could hold it
+            placed = once = twice = 0
+            for owner in owners:
+                placed |= held[owner]
+                twice |= once & possible[owner]
+                once |= possible[owner]
+            for owner in owners:
+                possible[owner] &= held[owner] | ~placed
+                held[owner] |= possible[owner] & ~twice
+
+            # owners known to hold a full hand hold nothing else, owners
+            # which could only hold a full hand hold all of it
+            for owner in owners:
+                if held[owner].bit_count() >= sizes[owner]:
+                    possible[owner] &= held[owner]
+                elif possible[owner].bit_count() <= sizes[owner]:
+                    held[owner] |= possible[owner]
+
+            # the solution has one card of each kind, and is none of the
+            # wrong accusations
+            for kind in KINDS:
+                candidates = possible[SOLUTION] & kind
+                if candidates.bit_count() == 1:
+                    held[SOLUTION] |= candidates
+                elif held[SOLUTION] & kind:
+                    possible[SOLUTION] &= held[SOLUTION] | ~kind
+            for accusation in self.accusations:
+                missing = accusation & ~held[SOLUTION]
+                if missing.bit_count() == 1:
+                    possible[SOLUTION] &= ~missing
+
+            if (possible, held) == before:
+                return
+
+    @property
+    def candidates(self) -> int:
+        """
+        The card bitmask of the cards which could still be in the solution
+        """
+        return self.possible[SOLUTION]
+
+    def solutions(self) -> list[tuple[Card, Card, Card]]:
+        """
+        Every solution (person, weapon, room) which is still possible
+        """
+        return [
+            solution
+            for solution in product(
+                *(mask_to_cards(self.candidates & kind) for kind in KINDS)
+            )
+            if sum(CARD_BITS[card] for card in solution) not in self.accusations
+        ]
+
+    def holders(self, card: Card) -> list[int]:
+        """
+        The owners which could hold a card, SOLUTION for the solution
+        """
+        bit = CARD_BITS[card]
+        return [
+            owner
+            for owner in range(SOLUTION, self.num_players)
+            if self.possible[owner] & bit
+        ]
+
+    def to_dict(self, player_order: list[str]) -> dict:
+        """
+        The notebook as served by the /hint endpoint, owners are given by their
+        player id or "solution"
+        """
+        names = dict(enumerate(player_order))
+        names[SOLUTION] = "solution"
+        solutions = self.solutions()
+        return {
+            "solutions": len(solutions),
+            "candidates": mask_to_strings(self.candidates),
+            "accusation": (
+                [card.value for card in solutions[0]] if len(solutions) == 1 else None
+            ),
+            "holders": {
+                card.value: [names[owner] for owner in self.holders(card)]
+                for card in CARDS
+            },
+        }
@@ -0,0 +1,208 @@
+from collections import OrderedDict, deque
+import cProfile
+import hmac
+import pstats
+import time
+import uuid
+
+# Sampled requests whose function timings make up the rolling hot spots
+WINDOW = 200
+
+# On-demand profiles kept for /internal/profiles, the oldest is dropped first
+KEEP = 20
+
+# Functions listed in a profile
+TOP = 30
+
+
+def function_stats(profile: cProfile.Profile) -> dict[str, tuple[int, float, float]]:
+    """
+    Utility function to get the calls, own seconds and cumulative seconds of
+    every function seen by a profile, keyed by "file:line(function)"
+    """
+    return {
+        pstats.func_std_string(function): (calls, own, cumulative)
+        for function, (_, calls, own, cumulative, _) in pstats.Stats(
+            profile
+        ).stats.items()
+    }
+
+
+def top_functions(
+    stats: dict[str, tuple[int, float, float]], top: int = TOP, sort: str = "own"
+) -> list[dict]:
+    """
+    Utility function to list the functions taking the most time, by own time
+    (sort="own") or cumulative time (sort="cumulative")
+    """
+    index = 1 if sort == "own" else 2
+    hottest = sorted(stats.items(), key=lambda item: item[1][index], reverse=True)
+    return [
+        {
+            "function": function,
+            "calls": calls,
+            "own_ms": own * 1e3,
+            "cumulative_ms": cumulative * 1e3,
+        }
+        for function, (calls, own, cumulative) in hottest[:top]
+    ]
+
+
+class RequestProfiler:
+    """
+    Profiles HTTP requests with cProfile, either on demand or as a sample of
+    the traffic:
+
+        token -- requests with this value in an X-Profile header are profiled
+            and the profile is kept, its id returned in an X-Profile-Id header
+        every -- one request in this many is profiled and its timings added to
+            the rolling hot spots over the last WINDOW sampled requests, 0 or
+            None to sample none
+
+    Only one request is profiled at a time, one arriving while another is
+    profiled is not. Handlers run on the event loop, so a profile also
+    holds whatever other requests ran while it was taken, but not the work
+    handed to threads or processes.
+    """
+
+    def __init__(self, token: str | None = None, every: int | None = None) -> None:
+        self.token = token
+        self.every = every
+        self.profiles: OrderedDict[str, dict] = OrderedDict()
+        self.window: deque[dict[str, tuple[int, float, float]]] = deque(maxlen=WINDOW)
+        self._requests = 0
+        self._busy = False
+
+    def authorized(self, token: str | None) -> bool:
+        """
+        Utility function to check a token against the profiling token
+        """
+        return (
+            self.token is not None
+            and token is not None
+            and hmac.compare_digest(self.token, token)
+        )
+
+    def sample_every(self, every: int) -> None:
+        """
+        Sample one request in every from now on, 0 to stop sampling. The hot
+        spots gathered so far are dropped.
+        """
+        self.every = every
+        self.window.clear()
+        self._requests = 0
+
+    def count(self) -> bool:
+        """
+        Count a request, true when it is one of the sampled ones
+        """
+        if not self.every:
+            return False
+        self._requests += 1
+        return self._requests % self.every == 0
+
+    def claim(self) -> bool:
+        """
+        Take the profiler for a request, false while another one is profiled
+        """
+        if self._busy:
+            return False
+        self._busy = True
+        return True
+
+    def release(
+        self,
+        stats: dict[str, tuple[int, float, float]],
+        sampled: bool,
+        profile: dict | None = None,
+    ) -> None:
+        """
+        Give the profiler back once a request is profiled, adding its timings
+        to the hot spots if it was sampled and keeping its profile if it was
+        taken on demand
+        """
+        self._busy = False
+        if sampled:
+            self.window.append(stats)
+        if profile is not None:
+            self.profiles[profile["id"]] = profile
+            while len(self.profiles) > KEEP:
+                self.profiles.popitem(last=False)
+
+    def hot_spots(self, top: int = TOP, sort: str = "own") -> list[dict]:
+        """
+        The functions taking the most time over the sampled requests in the
+        window, with their time added up over all of them
+        """
+        totals: dict[str, tuple[int, float, float]] = {}
+        for stats in self.window:
+            for function, (calls, own, cumulative) in stats.items():
+                before = totals.get(function, (0, 0.0, 0.0))
+                totals[function] = (
+                    before[0] + calls,
+                    before[1] + own,
+                    before[2] + cumulative,
+                )
+        return top_functions(totals, top, sort)
+
+
+class ProfilingMiddleware:
+    """
+    ASGI middleware profiling the HTTP requests picked by a RequestProfiler
+    """
+
+    def __init__(self, app, profiler: RequestProfiler) -> None:
+        self.app = app
+        self.profiler = profiler
+
+    async def __call__(self, scope, receive, send) -> None:
+        profiler = self.profiler
+        if scope["type"] != "http" or (profiler.token is None and not profiler.every):
+            await self.app(scope, receive, send)
+            return
+
+        on_demand = False
+        if profiler.token is not None:
+            for name, value in scope["headers"]:
+                if name == b"x-profile":
+                    on_demand = profiler.authorized(value.decode("latin-1"))
+        sampled = profiler.count()
+        if not (on_demand or sampled) or not profiler.claim():
+            await self.app(scope, receive, send)
+            return
+
+        profile_id = uuid.uuid4().hex if on_demand else None
+
+        async def tag(message) -> None:
+            if profile_id is not None and message["type"] == "http.response.start":
+                headers = list(message.get("headers", []))
+                headers.append((b"x-profile-id", profile_id.encode()))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        profile = cProfile.Profile()
+        start = time.perf_counter()
+        profile.enable()
+        try:
+            await self.app(scope, receive, tag)
+        finally:
+            profile.disable()
+            seconds = time.perf_counter() - start
+
+            stats = function_stats(profile)
+            profiler.release(
+                stats,
+                sampled,
+                (
+                    {
+                        "id": profile_id,
+                        "method": scope["method"],
+                        "path": scope["path"],
+                        "query": scope["query_string"].decode("latin-1"),
+                        "ms": seconds * 1e3,
+                        "functions": top_functions(stats),
+                    }
+                    if on_demand
+                    else None
+                ),
+            )
@@ -0,0 +1,68 @@
+import asyncio
+from typing import Dict
+
+
+class UpdateHub:
+    """
+    The update hub keeps track of every client listening for changes to a
+    game and wakes them up whenever a handler commits a change to it.
+
+    Subscribers only receive a notification that the game changed, it is up
+    to them to read the new state (usually with GameState.dump_changes_since).
+    Multiple notifications for a subscriber that has not caught up yet are
+    collapsed into one, so a slow client never builds up a backlog.
+    """
+
+    def __init__(self) -> None:
+        self.subscribers: Dict[str, Dict[asyncio.Queue, asyncio.AbstractEventLoop]] = {}
+
+    def subscribe(self, key: str) -> asyncio.Queue:
+        """
+        Register a new listener for the given game key, must be called from
+        within the event loop which will wait on the returned queue
+        """
+        queue = asyncio.Queue(maxsize=1)
+        self.subscribers.setdefault(key, {})[queue] = asyncio.get_running_loop()
+        return queue
+
+    def unsubscribe(self, key: str, queue: asyncio.Queue) -> None:
+        """
+        Remove a listener, dropping the game's entry once nobody is listening
+        """
+        listeners = self.subscribers.get(key)
+        if listeners is None:
+            return
+        listeners.pop(queue, None)
+        if not listeners:
+            del self.subscribers[key]
+
+    def publish(self, key: str) -> None:
+        """
+        Notify every listener of the given game that it has changed. Safe to call
+        from any thread or event loop.
+        """
+        for queue, loop in list(self.subscribers.get(key, {}).items()):
+            try:
+                running = asyncio.get_running_loop()
+            except RuntimeError:
+                running = None
+
+            if running is loop:
+                _notify(queue)
+            else:
+                try:
+                    loop.call_soon_threadsafe(_notify, queue)
+                except RuntimeError:
+                    # The listener's event loop has already shut down
+                    self.unsubscribe(key, queue)
+
+    def listener_count(self, key: str) -> int:
+        """
+        Utility function to get how many clients are listening to a game
+        """
+        return len(self.subscribers.get(key, {}))
+
+
+def _notify(queue: asyncio.Queue) -> None:
+    if queue.empty():
+        queue.put_nowait(True)
@@ -0,0 +1,439 @@
+from collections import OrderedDict
+from collections.abc import MutableMapping
+from pathlib import Path
+from typing import Callable, Iterator
+from util.enums import EndGameEnum
+from util.game_state import GameState
+from util.store import GameStore
+import asyncio
+import logging
+import pickle
+import re
+import time
+import zlib
+
+# Game keys are uuids, anything else is never looked up on disk
+VALID_KEY = re.compile(r"[A-Za-z0-9-]+")
+
+logger = logging.getLogger(__name__)
+
+
+class DirectoryArchive:
+    """
+    Stores evicted games as compressed pickles, one file per game key, in
+    the given directory. Games written here are only ever read back by the
+    server itself.
+    """
+
+    shared = False
+
+    def __init__(self, path: str | Path) -> None:
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self._keys = {file.stem for file in self.path.glob("*.game")}
+
+    def _file(self, key: str) -> Path:
+        return self.path / f"{key}.game"
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._keys
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def keys(self) -> set[str]:
+        return set(self._keys)
+
+    def save(self, key: str, game: GameState) -> None:
+        if not VALID_KEY.fullmatch(key):
+            return
+        data = zlib.compress(pickle.dumps(game, pickle.HIGHEST_PROTOCOL))
+        self._file(key).write_bytes(data)
+        self._keys.add(key)
+
+    def load(self, key: str) -> GameState | None:
+        """
+        Moves an archived game back into memory, the file is removed so a stale
+        copy is never loaded once the game has changed again
+        """
+        if key not in self._keys:
+            return None
+        game = pickle.loads(zlib.decompress(self._file(key).read_bytes()))
+        self.delete(key)
+        return game
+
+    def delete(self, key: str) -> None:
+        if key in self._keys:
+            self._file(key).unlink(missing_ok=True)
+            self._keys.discard(key)
+
+
+class GameRegistry(MutableMapping):
+    """
+    The registry holds every game the server knows about, keyed by game key.
+    It behaves like the plain dict it replaces, but also tracks when each game
+    was last used so that idle games can be evicted:
+
+        ttl -- seconds a game can go unused before it is evicted
+        finished_ttl -- the same for games that have already ended
+        max_games -- how many games can be held in memory, the least recently
+            used game is evicted when this is exceeded
+
+    If an archive is given evicted games are written to it rather than dropped,
+    and are transparently loaded back the next time their key is used. If the
+    archive is a shared GameStore, other processes may change its games, so the
+    version of a resident game is checked against the store every time it is
+    used and the game is reloaded if it is out of date.
+
+    Code running on an event loop should use fetch, put, replace, remove and
+    fetch_keys in place of games.get(key), games[key] = game, del games[key]
+    and list(games). They wait on the archive in a worker thread, and games
+    they evict are written to it by a background task, see drain.
+    """
+
+    def __init__(
+        self,
+        ttl: float | None = None,
+        finished_ttl: float | None = None,
+        max_games: int | None = None,
+        archive: DirectoryArchive | GameStore | None = None,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.ttl = ttl
+        self.finished_ttl = finished_ttl
+        self.max_games = max_games
+        self.archive = archive
+        self.clock = clock
+
+        # Resident games, least recently used first
+        self._games: OrderedDict[str, GameState] = OrderedDict()
+        self._last_access: dict[str, float] = {}
+        self._last_sweep = clock()
+
+        # Games being read from the archive by fetch, keyed by game key
+        self._loading: dict[str, asyncio.Future] = {}
+
+        # Evicted games not written to the archive yet, and the tasks writing
+        # them, a game is served from here until it has been written
+        self._evicted: dict[str, GameState] = {}
+        self._saving: dict[str, asyncio.Future] = {}
+
+    def __getitem__(self, key: str) -> GameState:
+        if key not in self._games and key in self._evicted:
+            self._insert(key, self._evicted.pop(key))
+        if (
+            key in self._games
+            and self.archive is not None
+            and self.archive.shared
+            # a game which has not been recorded yet has no version
+            and (self.archive.version(key) or 0) != self._games[key].event_count
+        ):
+            self.drop(key)
+        if key not in self._games:
+            game = self.archive.load(key) if self.archive is not None else None
+            if game is None:
+                raise KeyError(key)
+            self._insert(key, game)
+        else:
+            self._games.move_to_end(key)
+            self._last_access[key] = self.clock()
+        game = self._games[key]
+        self.evict_expired()
+        return game
+
+    def __setitem__(self, key: str, game: GameState) -> None:
+        if self.archive is not None and not self.archive.shared:
+            self.archive.delete(key)
+        self._insert(key, game)
+        self.evict_expired()
+
+    def __delitem__(self, key: str) -> None:
+        found = key in self._games or key in self._evicted
+        self.drop(key)
+        if self.archive is not None and key in self.archive:
+            self.archive.delete(key)
+        elif not found:
+            raise KeyError(key)
+
+    async def fetch(self, key: str) -> GameState | None:
+        """
+        Awaitable games.get(key) for the event loop: the archive is read in a
+        worker thread, as it may be a database or another process. Concurrent
+        calls for a key which is not in memory share one read.
+        """
+        game = await self._held(key)
+        if game is not None and self.archive is not None and self.archive.shared:
+            version = await asyncio.to_thread(self.archive.version, key)
+            # unless the game was replaced while the version was read
+            if self._games.get(key) is game and (version or 0) != game.event_count:
+                self.drop(key)
+            game = await self._held(key)
+        if game is None:
+            if self.archive is None:
+                return None
+            loading = self._loading.get(key)
+            if loading is None:
+                loading = asyncio.ensure_future(
+                    asyncio.to_thread(self.archive.load, key)
+                )
+                self._loading[key] = loading
+                loading.add_done_callback(lambda _: self._loaded(key, loading))
+            # waiting callers being cancelled must not lose a game the read has
+            # already taken out of the archive
+            await asyncio.shield(loading)
+            # in case this call woke up before the done callback ran
+            self._loaded(key, loading)
+            game = await self._held(key)
+            if game is None:
+                return None
+        self._games.move_to_end(key)
+        self._last_access[key] = self.clock()
+        self._expire()
+        self._archive_later()
+        return game
+
+    async def _held(self, key: str) -> GameState | None:
+        """
+        The game held in memory for key, after moving it back from the evicted
+        games if it has not been written to the archive yet
+        """
+        # a game is only read back from the archive once it has been written
+        while key in self._saving:
+            await asyncio.wait({self._saving[key]})
+        if key not in self._games and key in self._evicted:
+            self._insert(key, self._evicted.pop(key))
+        return self._games.get(key)
+
+    def _loaded(self, key: str, loading: asyncio.Future) -> None:
+        if self._loading.get(key) is loading:
+            del self._loading[key]
+        if loading.cancelled() or loading.exception() is not None:
+            return
+        # a game held in memory by now is at least as new as the one read
+        if (
+            loading.result() is not None
+            and key not in self._games
+            and key not in self._evicted
+        ):
+            self._insert(key, loading.result())
+
+    async def put(self, key: str, game: GameState) -> None:
+        """
+        Awaitable games[key] = game for the event loop, the archived copy is
+        deleted in a worker thread. A shared store keeps its copy, which holds
+        the game's recorded events as well.
+        """
+        if self.archive is not None and not self.archive.shared:
+            # the copy being written would otherwise be left behind
+            while key in self._saving:
+                await asyncio.wait({self._saving[key]})
+            await asyncio.to_thread(self.archive.delete, key)
+        self._insert(key, game)
+        self._expire()
+        self._archive_later()
+
+    async def remove(self, key: str) -> bool:
+        """
+        Awaitable del games[key] for the event loop, false if there was no
+        game to remove
+        """
+        while key in self._saving:
+            await asyncio.wait({self._saving[key]})
+        found = key in self._games or key in self._evicted
+        self.drop(key)
+        if self.archive is not None and await asyncio.to_thread(
+            self.archive.__contains__, key
+        ):
+            await asyncio.to_thread(self.archive.delete, key)
+            found = True
+        return found
+
+    async def fetch_keys(self) -> list[str]:
+        """
+        Awaitable list(games) for the event loop, the archive is listed in a
+        worker thread
+        """
+        archived = (
+            await asyncio.to_thread(self.archive.keys)
+            if self.archive is not None
+            else set()
+        )
+        held = list(self._games) + [
+            key for key in self._evicted if key not in self._games
+        ]
+        return held + sorted(archived.difference(held))
+
+    def replace(self, key: str, game: GameState) -> None:
+        """
+        Hold game in memory as the current copy of key without touching the
+        archive, used on the event loop once its changes have been recorded there
+        """
+        self._insert(key, game)
+        self._expire()
+        self._archive_later()
+
+    async def drain(self) -> None:
+        """
+        Wait until every evicted game has been written to the archive
+        """
+        self._archive_later()
+        while self._saving:
+            await asyncio.wait(set(self._saving.values()))
+
+    def __contains__(self, key: object) -> bool:
+        return (
+            key in self._games
+            or key in self._evicted
+            or (self.archive is not None and key in self.archive)
+        )
+
+    def __iter__(self) -> Iterator[str]:
+        held = list(self._games) + [
+            key for key in self._evicted if key not in self._games
+        ]
+        yield from held
+        if self.archive is not None:
+            # a durable archive also holds copies of resident games
+            yield from (key for key in self.archive.keys() if key not in held)
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+    def __bool__(self) -> bool:
+        # checked on every poll, unlike len() it never lists the archive
+        return (
+            bool(self._games)
+            or bool(self._evicted)
+            or (self.archive is not None and bool(self.archive))
+        )
+
+    def resident(self) -> int:
+        """
+        Utility function to get how many games are currently held in memory
+        """
+        return len(self._games)
+
+    def resident_keys(self) -> list[str]:
+        """
+        Utility function to get the keys of the games currently held in memory
+        """
+        return list(self._games)
+
+    def resident_games(self) -> list[GameState]:
+        """
+        Utility function to get the games currently held in memory, without
+        marking them as used or loading archived ones
+        """
+        return list(self._games.values())
+
+    def _insert(self, key: str, game: GameState) -> None:
+        # an evicted copy not written yet is older than this one
+        self._evicted.pop(key, None)
+        self._games[key] = game
+        self._games.move_to_end(key)
+        self._last_access[key] = self.clock()
+        while self.max_games is not None and len(self._games) > self.max_games:
+            self._evict(next(iter(self._games)))
+
+    def drop(self, key: str) -> None:
+        """
+        Forget the copy of a game held in memory without archiving it, used when
+        it no longer matches the archived game
+        """
+        if key in self._games:
+            del self._games[key]
+            del self._last_access[key]
+        self._evicted.pop(key, None)
+
+    def evict(self, key: str) -> None:
+        """
+        Remove a game from memory, archiving it if there is an archive
+        """
+        self._evict(key)
+        self._archive_now()
+
+    def _evict(self, key: str) -> None:
+        game = self._games.pop(key)
+        del self._last_access[key]
+        if self.archive is not None:
+            self._evicted[key] = game
+
+    def _unsaved(self) -> dict[str, GameState]:
+        return {
+            key: game for key, game in self._evicted.items() if key not in self._saving
+        }
+
+    def _save(self, evicted: dict[str, GameState]) -> None:
+        for key, game in evicted.items():
+            self.archive.save(key, game)
+
+    def _saved(self, evicted: dict[str, GameState]) -> None:
+        for key, game in evicted.items():
+            if self._evicted.get(key) is game:
+                del self._evicted[key]
+
+    def _archive_now(self) -> None:
+        evicted = self._unsaved()
+        self._save(evicted)
+        self._saved(evicted)
+
+    def _archive_later(self) -> None:
+        """
+        Start writing the evicted games to the archive in a worker thread, must
+        be called on the event loop
+        """
+        evicted = self._unsaved()
+        if not evicted:
+            return
+        saving = asyncio.ensure_future(asyncio.to_thread(self._save, evicted))
+        for key in evicted:
+            self._saving[key] = saving
+
+        def done(_) -> None:
+            for key in evicted:
+                if self._saving.get(key) is saving:
+                    del self._saving[key]
+            # games which could not be written stay evicted and are retried
+            if saving.cancelled():
+                return
+            if saving.exception() is not None:
+                logger.error(
+                    "Could not archive %d evicted games",
+                    len(evicted),
+                    exc_info=saving.exception(),
+                    extra={"event": "archive_failed"},
+                )
+                return
+            self._saved(evicted)
+
+        saving.add_done_callback(done)
+
+    def evict_expired(self, force: bool = False) -> None:
+        """
+        Evict every game that has been idle for longer than its ttl and archive
+        it straight away
+        """
+        self._expire(force)
+        self._archive_now()
+
+    def _expire(self, force: bool = False) -> None:
+        """
+        Evict every game that has been idle for longer than its ttl. Scanning all
+        games is only done once every tenth of the shortest ttl unless forced.
+        """
+        ttls = [ttl for ttl in (self.ttl, self.finished_ttl) if ttl is not None]
+        if not ttls:
+            return
+        now = self.clock()
+        if not force and now - self._last_sweep < min(ttls) / 10:
+            return
+        self._last_sweep = now
+
+        for key, game in list(self._games.items()):
+            idle = now - self._last_access[key]
+            if game.victory_state != EndGameEnum.keep_playing:
+                ttl = self.finished_ttl if self.finished_ttl is not None else self.ttl
+            else:
+                ttl = self.ttl
+            if ttl is not None and idle > ttl:
+                self._evict(key)
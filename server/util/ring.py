@@ -0,0 +1,66 @@
+from bisect import bisect
+from hashlib import blake2b
+from typing import Iterable
+
+
+def key_hash(value: str) -> int:
+    """
+    Function to hash a string to a 64 bit position on the ring, the same in
+    every process (unlike the builtin hash of a string)
+    """
+    return int.from_bytes(blake2b(value.encode(), digest_size=8).digest(), "big")
+
+
+class HashRing:
+    """
+    Consistent hash ring assigning game keys to nodes. Each node is placed on
+    the ring at many points (replicas) and a key belongs to the first node
+    point after the key's own hash, so adding or removing a node only moves
+    the keys between it and its neighbours, about 1/n of all keys.
+    """
+
+    def __init__(self, nodes: Iterable[str] = (), replicas: int = 64) -> None:
+        self.replicas = replicas
+        self._nodes: set[str] = set()
+        self._points: list[int] = []
+        self._owners: list[str] = []
+        for node in nodes:
+            self.add(node)
+
+    @property
+    def nodes(self) -> list[str]:
+        return sorted(self._nodes)
+
+    def __len__(self) -> int:
+        return len(self._nodes)
+
+    def __contains__(self, node: str) -> bool:
+        return node in self._nodes
+
+    def add(self, node: str) -> None:
+        if node in self._nodes:
+            return
+        self._nodes.add(node)
+        self._rebuild()
+
+    def remove(self, node: str) -> None:
+        self._nodes.discard(node)
+        self._rebuild()
+
+    def _rebuild(self) -> None:
+        points = sorted(
+            (key_hash(f"{node}#{i}"), node)
+            for node in self._nodes
+            for i in range(self.replicas)
+        )
+        self._points = [point for point, _ in points]
+        self._owners = [node for _, node in points]
+
+    def get(self, key: str) -> str:
+        """
+        The node owning a key, raises LookupError if the ring is empty
+        """
+        if not self._points:
+            raise LookupError("The ring has no nodes.")
+        i = bisect(self._points, key_hash(key)) % len(self._points)
+        return self._owners[i]
@@ -0,0 +1,557 @@
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Client, Connection, Listener
+from pathlib import Path
+from typing import Sequence
+from util.events import Event, event_from_dict, replay
+from util.game_state import GameState
+import json
+import os
+import pickle
+import queue
+import sqlite3
+import sys
+import threading
+import time
+import zlib
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS snapshots (
+    key TEXT PRIMARY KEY,
+    event_count INTEGER NOT NULL,
+    state BLOB NOT NULL,
+    updated REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS events (
+    key TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    type TEXT NOT NULL,
+    data TEXT NOT NULL,
+    time REAL NOT NULL,
+    PRIMARY KEY (key, seq)
+);
+"""
+
+INSERT_EVENTS = (
+    "INSERT {} INTO events (key, seq, type, data, time) VALUES (?, ?, ?, ?, ?)"
+)
+
+
+class VersionConflict(Exception):
+    """
+    Raised when events are recorded for a game which has been changed
+    by someone else since it was loaded
+    """
+
+
+def encode_game(game: GameState) -> bytes:
+    """
+    Function to serialize a game into the compact form kept in storage
+    """
+    return zlib.compress(pickle.dumps(game, pickle.HIGHEST_PROTOCOL))
+
+
+def decode_game(data: bytes) -> GameState:
+    """
+    Function to rebuild a game from the output of encode_game
+    """
+    return pickle.loads(zlib.decompress(data))
+
+
+class GameStore:
+    """
+    Base class of the places games are kept outside of a process's memory.
+    A store can be the archive of a GameRegistry, and if it is shared several
+    server processes can serve the same games through it.
+
+    Every game in a store has a version, the number of events applied to it
+    (GameState.event_count). Recording is optimistic: record() only succeeds
+    if the stored version is the one the events were applied on top of,
+    otherwise VersionConflict is raised and the caller must reload the game.
+    """
+
+    # If other processes may be changing the games in the store,
+    # in which case a cached copy of a game must be checked before use
+    shared: bool = False
+
+    def keys(self) -> set[str]:
+        raise NotImplementedError
+
+    def version(self, key: str) -> int | None:
+        """
+        The version of a game, None if the store does not hold it
+        """
+        raise NotImplementedError
+
+    def load(self, key: str) -> GameState | None:
+        raise NotImplementedError
+
+    def record(self, key: str, events: Sequence[Event], game: GameState) -> None:
+        """
+        Store events which have just been applied to a game,
+        raises VersionConflict if the game was changed elsewhere first
+        """
+        raise NotImplementedError
+
+    def save(self, key: str, game: GameState) -> None:
+        """
+        Store the current state of a game, unless a newer version is stored
+        """
+        raise NotImplementedError
+
+    def delete(self, key: str) -> None:
+        raise NotImplementedError
+
+    def close(self) -> None:
+        pass
+
+    def __contains__(self, key: str) -> bool:
+        return self.version(key) is not None
+
+    def __len__(self) -> int:
+        return len(self.keys())
+
+
+class VersionedTable:
+    """
+    Maps keys to versioned blobs with compare and set, the only operations
+    MemoryGameStore and SocketGameStore need from the table holding their
+    games. Most external key value stores can do the same.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._rows: dict[str, tuple[int, bytes]] = {}
+
+    def keys(self) -> set[str]:
+        return set(self._rows)
+
+    def version(self, key: str) -> int | None:
+        row = self._rows.get(key)
+        return row[0] if row else None
+
+    def get(self, key: str) -> tuple[int, bytes] | None:
+        return self._rows.get(key)
+
+    def compare_and_set(
+        self, key: str, expected: int, version: int, data: bytes
+    ) -> bool:
+        """
+        Set the row only if its current version is expected, 0 for a new key
+        """
+        with self._lock:
+            row = self._rows.get(key)
+            if (row[0] if row else 0) != expected:
+                return False
+            self._rows[key] = (version, data)
+            return True
+
+    def set_if_newer(self, key: str, version: int, data: bytes) -> None:
+        with self._lock:
+            row = self._rows.get(key)
+            if row is None or row[0] < version:
+                self._rows[key] = (version, data)
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._rows.pop(key, None)
+
+
+class MemoryGameStore(GameStore):
+    """
+    Keeps encoded games in a VersionedTable in this process. Games are copied in
+    and out of the store like they are with an external one, which makes it a
+    drop in for tests and for running games without a database.
+    """
+
+    def __init__(self, table: VersionedTable | None = None) -> None:
+        self.table = table if table is not None else VersionedTable()
+
+    def keys(self) -> set[str]:
+        return self.table.keys()
+
+    def version(self, key: str) -> int | None:
+        return self.table.version(key)
+
+    def load(self, key: str) -> GameState | None:
+        row = self.table.get(key)
+        return decode_game(row[1]) if row else None
+
+    def record(self, key: str, events: Sequence[Event], game: GameState) -> None:
+        expected = game.event_count - len(events)
+        if not self.table.compare_and_set(
+            key, expected, game.event_count, encode_game(game)
+        ):
+            raise VersionConflict(key, expected)
+
+    def save(self, key: str, game: GameState) -> None:
+        self.table.set_if_newer(key, game.event_count, encode_game(game))
+
+    def delete(self, key: str) -> None:
+        self.table.delete(key)
+
+
+class SocketGameStore(MemoryGameStore):
+    """
+    Client of a VersionedTable served by serve_table() in another process over
+    a unix socket. It stands in for an external key value store so that several
+    server processes can share their games. Both ends must be given the same
+    key, which the connection is authenticated with.
+    """
+
+    shared = True
+
+    def __init__(self, address: str, key: str) -> None:
+        super().__init__(_RemoteTable(address, key))
+
+    def close(self) -> None:
+        self.table.close()
+
+
+class _RemoteTable:
+    """
+    Forwards the calls made on a VersionedTable to the one served at address
+    """
+
+    def __init__(self, address: str, key: str) -> None:
+        self._connection: Connection = Client(
+            address, family="AF_UNIX", authkey=authkey(key)
+        )
+        self._lock = threading.Lock()
+
+    def _call(self, method: str, *args):
+        with self._lock:
+            self._connection.send((method, args))
+            ok, result = self._connection.recv()
+        if not ok:
+            raise result
+        return result
+
+    def keys(self) -> set[str]:
+        return self._call("keys")
+
+    def version(self, key: str) -> int | None:
+        return self._call("version", key)
+
+    def get(self, key: str) -> tuple[int, bytes] | None:
+        return self._call("get", key)
+
+    def compare_and_set(
+        self, key: str, expected: int, version: int, data: bytes
+    ) -> bool:
+        return self._call("compare_and_set", key, expected, version, data)
+
+    def set_if_newer(self, key: str, version: int, data: bytes) -> None:
+        self._call("set_if_newer", key, version, data)
+
+    def delete(self, key: str) -> None:
+        self._call("delete", key)
+
+    def close(self) -> None:
+        with self._lock:
+            self._connection.close()
+
+
+TABLE_METHODS = {"keys", "version", "get", "compare_and_set", "set_if_newer", "delete"}
+
+
+def authkey(key: str) -> bytes:
+    """
+    Utility function to check the key shared by serve_table and its clients
+    is set, as the messages they exchange are unpickled
+    """
+    if not key:
+        raise ValueError("A key is needed to serve or use a shared game table.")
+    return key.encode()
+
+
+def serve_table(address: str, key: str, table: VersionedTable | None = None) -> None:
+    """
+    Function to serve a VersionedTable to SocketGameStore clients on a unix
+    socket, runs until the process is stopped. Only clients holding the same
+    key can connect, and only local users allowed to open the socket file.
+    """
+    table = table if table is not None else VersionedTable()
+    with Listener(address, family="AF_UNIX", authkey=authkey(key)) as listener:
+        while True:
+            try:
+                connection = listener.accept()
+            except (AuthenticationError, EOFError, ConnectionError):
+                # a client without the key, or one gone before it was checked
+                continue
+            threading.Thread(
+                target=_serve_connection, args=(connection, table), daemon=True
+            ).start()
+
+
+def _serve_connection(connection: Connection, table: VersionedTable) -> None:
+    with connection:
+        while True:
+            try:
+                method, args = connection.recv()
+            except EOFError:
+                return
+            if method not in TABLE_METHODS:
+                connection.send((False, ValueError("Unknown method.", method)))
+                continue
+            try:
+                connection.send((True, getattr(table, method)(*args)))
+            except Exception as e:
+                connection.send((False, e))
+
+
+class SQLiteGameStore(GameStore):
+    """
+    Durable storage for games in a local SQLite database. Every event of a
+    game (see util/events.py) is appended to an event log, and every
+    snapshot_every events a snapshot of the whole game is written, so loading
+    a game only has to replay the events after its latest snapshot.
+
+    When this process is the only one using the database, writes are done
+    behind the request: record() hands the events to a background thread,
+    which commits whatever has queued up in a single transaction, so many
+    requests share one fsync. A shared database is written to straight away
+    instead. Events are numbered per game, so a second process writing the
+    same event number fails to insert it and gets a VersionConflict.
+
+    The store can be used as the archive of a GameRegistry. Keys are listed
+    when the store opens but a game's state is only read the first time its
+    key is used.
+    """
+
+    def __init__(
+        self,
+        path: str | Path,
+        snapshot_every: int = 50,
+        batch_size: int = 256,
+        flush_interval: float = 0.05,
+        shared: bool = False,
+    ) -> None:
+        self.path = str(path)
+        self.snapshot_every = snapshot_every
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.shared = shared
+
+        self._lock = threading.Lock()
+        self._queue: queue.Queue = queue.Queue()
+
+        self._connection = sqlite3.connect(
+            self.path, check_same_thread=False, timeout=30
+        )
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.executescript(SCHEMA)
+
+        # Versions of the games recorded or loaded by this process,
+        # only trusted when the database is not shared
+        self._versions: dict[str, int] = {}
+        self._keys = self._stored_keys()
+
+        self._writer = threading.Thread(
+            target=self._write_loop, name="game-store-writer", daemon=True
+        )
+        self._writer.start()
+
+    def _stored_keys(self) -> set[str]:
+        with self._lock:
+            return {
+                row[0]
+                for row in self._connection.execute(
+                    "SELECT key FROM snapshots UNION SELECT DISTINCT key FROM events"
+                )
+            }
+
+    def __contains__(self, key: str) -> bool:
+        if self.shared:
+            return self.version(key) is not None
+        return key in self._keys
+
+    def keys(self) -> set[str]:
+        return self._stored_keys() if self.shared else set(self._keys)
+
+    def __bool__(self) -> bool:
+        if not self.shared:
+            return bool(self._keys)
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT EXISTS (SELECT 1 FROM snapshots) "
+                "OR EXISTS (SELECT 1 FROM events)"
+            ).fetchone()
+        return row[0] == 1
+
+    def version(self, key: str) -> int | None:
+        if not self.shared:
+            if key in self._versions:
+                return self._versions[key]
+            self.flush()
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT MAX(event_count) FROM ("
+                "SELECT event_count FROM snapshots WHERE key = ? "
+                "UNION ALL SELECT MAX(seq) FROM events WHERE key = ?)",
+                (key, key),
+            ).fetchone()
+        return row[0]
+
+    def record(self, key: str, events: Sequence[Event], game: GameState) -> None:
+        """
+        Write events which have just been applied to a game, along with a
+        snapshot of the game if one is due
+        """
+        now = time.time()
+        first = game.event_count - len(events) + 1
+        rows = [
+            (key, first + i, type(event).__name__, json.dumps(event.to_dict()), now)
+            for i, event in enumerate(events)
+        ]
+
+        if self.shared:
+            try:
+                with self._lock, self._connection:
+                    self._connection.executemany(INSERT_EVENTS.format(""), rows)
+            except sqlite3.IntegrityError:
+                raise VersionConflict(key, first - 1)
+        else:
+            if self._versions.get(key, 0) != first - 1:
+                raise VersionConflict(key, first - 1)
+            self._versions[key] = game.event_count
+            self._keys.add(key)
+            self._queue.put(("events", rows))
+
+        if first == 1 or (first - 1) // self.snapshot_every != (
+            game.event_count // self.snapshot_every
+        ):
+            self.save(key, game)
+
+    def save(self, key: str, game: GameState) -> None:
+        """
+        Write a snapshot of the current state of a game
+        """
+        row = (key, game.event_count, encode_game(game), time.time())
+        if self.shared:
+            with self._lock, self._connection:
+                self._write(self._connection, "snapshot", row)
+        else:
+            self._keys.add(key)
+            self._versions[key] = max(self._versions.get(key, 0), game.event_count)
+            self._queue.put(("snapshot", row))
+
+    def load(self, key: str) -> GameState | None:
+        """
+        Rebuild a game from its latest snapshot and the events after it,
+        None if the store has never seen the game
+        """
+        if not self.shared:
+            if key not in self._keys:
+                return None
+            self.flush()
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT event_count, state FROM snapshots WHERE key = ?", (key,)
+            ).fetchone()
+            after = row[0] if row else 0
+            tail = self._connection.execute(
+                "SELECT data FROM events WHERE key = ? AND seq > ? ORDER BY seq",
+                (key, after),
+            ).fetchall()
+
+        game = decode_game(row[1]) if row else None
+        events = [event_from_dict(json.loads(data)) for (data,) in tail]
+        if game is None and not events:
+            return None
+        game = replay(events, game)
+        self._versions[key] = game.event_count
+        return game
+
+    def events(self, key: str) -> list[Event]:
+        """
+        Every event recorded for a game, oldest first
+        """
+        self.flush()
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT data FROM events WHERE key = ? ORDER BY seq", (key,)
+            ).fetchall()
+        return [event_from_dict(json.loads(data)) for (data,) in rows]
+
+    def delete(self, key: str) -> None:
+        """
+        Forget a game, its snapshot and its events
+        """
+        self._keys.discard(key)
+        self._versions.pop(key, None)
+        self._queue.put(("delete", key))
+        if self.shared:
+            self.flush()
+
+    def flush(self) -> None:
+        """
+        Block until everything queued so far has been written
+        """
+        # the marker makes the writer commit straight away instead of
+        # waiting for its batch to fill up
+        self._queue.put(("flush", None))
+        self._queue.join()
+
+    def close(self) -> None:
+        """
+        Write everything still queued and stop the background writer
+        """
+        self._queue.put(None)
+        self._writer.join()
+        self._connection.close()
+
+    def _write_loop(self) -> None:
+        connection = sqlite3.connect(self.path, timeout=30)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+
+        running = True
+        while running:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.flush_interval
+            while (
+                batch[-1] is not None
+                and batch[-1][0] != "flush"
+                and len(batch) < self.batch_size
+            ):
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=timeout))
+                except queue.Empty:
+                    break
+
+            if batch[-1] is None:
+                running = False
+            with self._lock, connection:
+                for item in batch:
+                    if item is not None:
+                        self._write(connection, *item)
+            for _ in batch:
+                self._queue.task_done()
+
+        connection.close()
+
+    def _write(self, connection: sqlite3.Connection, kind: str, data) -> None:
+        if kind == "events":
+            connection.executemany(INSERT_EVENTS.format("OR IGNORE"), data)
+        elif kind == "snapshot":
+            # never replace a snapshot with an older one
+            connection.execute(
+                "INSERT INTO snapshots (key, event_count, state, updated) "
+                "VALUES (?, ?, ?, ?) ON CONFLICT (key) DO UPDATE SET "
+                "event_count = excluded.event_count, state = excluded.state, "
+                "updated = excluded.updated "
+                "WHERE excluded.event_count > snapshots.event_count",
+                data,
+            )
+        elif kind == "delete":
+            connection.execute("DELETE FROM snapshots WHERE key = ?", (data,))
+            connection.execute("DELETE FROM events WHERE key = ?", (data,))
+
+
+if __name__ == "__main__":
+    # Serve a table for SocketGameStore clients to share, with
+    #   CLUELESS_STORE_KEY=<secret> python -m util.store /tmp/clueless.sock
+    serve_table(sys.argv[1], os.environ.get("CLUELESS_STORE_KEY", ""))